@@ -1,20 +1,36 @@
 
-from collections import Counter
+from collections import Counter, defaultdict
 import json
+import math
 import os
 import re
 import asyncio
 from google import genai
 from src.config import GEMINI_API_KEY
 from src.gemini_utils import get_gemini_model
+from src.embeddings import select_passages
+from src.nlp_pipeline import parse_book, NER_COMPONENTS
+
+# Characters of book text sent for analysis; longer books are sampled across
+# their length via embeddings instead of truncated
+ANALYSIS_MAX_CHARS = 100000
 
 # Compile regex pattern once for performance
 CAPITALIZED_PATTERN = re.compile(r'\b[A-Z][a-z]+\b')
 
+# Offline NER tier: spaCy entity labels kept, and the role each maps to
+NER_ROLES = {"PERSON": "Character", "GPE": "Location", "LOC": "Location", "FAC": "Location", "ORG": "Organization"}
+OFFLINE_ENTITY_LIMIT = 8
+SPREAD_BUCKETS = 10  # Book sections used to measure how widely an entity appears
+NAME_TITLES = {
+    "mr", "mrs", "ms", "miss", "dr", "doctor", "prof", "professor", "captain", "capt", "sir", "lady", "lord",
+    "king", "queen", "prince", "princess", "master", "madam", "madame", "uncle", "aunt", "saint", "st", "father",
+}
+
 async def semantic_analysis(text):
     """
     Performs semantic analysis to extract entities and key concepts (Async).
-    Priority: Gemini -> Basic Regex
+    Priority: Gemini -> Local NER (spaCy) -> Basic Regex
     """
     # 1. Try Gemini
     api_key = os.getenv("GEMINI_API_KEY")
@@ -33,6 +49,12 @@ async def semantic_analysis(text):
         print("Falling back...")
 
 
+    # 2. Local NER over the whole book (offline, CPU only)
+    entities = await asyncio.to_thread(extract_entities_offline, text)
+    if entities:
+        print(f"✅ Offline NER analysis found {len(entities)} entities.")
+        return fallback_analysis(entities)
+
     # 3. Basic Regex Fallback
     print("Falling back to Basic Regex Analysis...")
     
@@ -64,8 +86,12 @@ async def semantic_analysis(text):
         for name, count in counts.most_common(5)
     ]
     
+    return fallback_analysis(top_entities)
+
+def fallback_analysis(entities):
+    """Analysis result for the offline tiers: the given entities plus generic scenes."""
     return {
-        "entities": top_entities,
+        "entities": entities,
         "keywords": [],
         "scenes": [
             {
@@ -103,6 +129,89 @@ async def semantic_analysis(text):
         ]
     }
 
+def clean_name(name):
+    """Canonical surface form: no possessive, leading titles or stray punctuation."""
+    name = re.sub(r"['’]s$", "", name.strip())
+    words = [w.strip(".,;:!?\"'()") for w in name.split()]
+    words = [w for w in words if w]
+    while len(words) > 1 and words[0].lower().rstrip(".") in NAME_TITLES:
+        words = words[1:]
+    return " ".join(words)
+
+def merge_name_variants(counts):
+    """
+    Coreference-lite: map each name to a canonical one. A single-word name
+    ("Elizabeth") joins the multi-word name it starts or ends
+    ("Elizabeth Bennet") when that name is unambiguous or clearly dominant.
+
+    Returns:
+        {name: canonical name}
+    """
+    aliases = {name: name for name in counts}
+    full_names = sorted((n for n in counts if " " in n), key=lambda n: -counts[n])
+    for name in counts:
+        if " " in name:
+            continue
+        matches = [f for f in full_names if name in (f.split()[0], f.split()[-1])]
+        if len(matches) == 1 or (len(matches) > 1 and counts[matches[0]] >= 2 * counts[matches[1]]):
+            aliases[name] = matches[0]
+    return aliases
+
+def rank_entities(sentences, limit=OFFLINE_ENTITY_LIMIT):
+    """
+    Entities from NER sentence records, ranked by mentions, centrality (how
+    many other entities they share sentences with) and spread across the book.
+
+    Returns:
+        [[name, role, ""]] best first, in the analysis entity format
+    """
+    mentions = Counter()
+    labels = defaultdict(Counter)
+    per_sentence = []
+    for sent in sentences:
+        names = []
+        for ent_text, label in sent.get("ents", []):
+            if label not in NER_ROLES:
+                continue
+            name = clean_name(ent_text)
+            if len(name) < 2 or not name[0].isupper():
+                continue
+            mentions[name] += 1
+            labels[name][label] += 1
+            names.append(name)
+        per_sentence.append(names)
+    if not mentions:
+        return []
+
+    aliases = merge_name_variants(mentions)
+    merged_mentions = Counter()
+    merged_labels = defaultdict(Counter)
+    for name, count in mentions.items():
+        merged_mentions[aliases[name]] += count
+        merged_labels[aliases[name]].update(labels[name])
+
+    neighbours = defaultdict(set)
+    sections = defaultdict(set)
+    for i, names in enumerate(per_sentence):
+        canonical = {aliases[n] for n in names}
+        for name in canonical:
+            neighbours[name].update(canonical - {name})
+            sections[name].add(i * SPREAD_BUCKETS // len(per_sentence))
+
+    def score(name):
+        spread = len(sections[name]) / SPREAD_BUCKETS
+        return merged_mentions[name] * (1 + math.log1p(len(neighbours[name]))) * (0.5 + spread)
+
+    ranked = sorted(merged_mentions, key=lambda n: (-score(n), n))[:limit]
+    return [[name, NER_ROLES[merged_labels[name].most_common(1)[0][0]], ""] for name in ranked]
+
+def extract_entities_offline(text, limit=OFFLINE_ENTITY_LIMIT):
+    """Named entities of the whole book via the local spaCy NER pipeline; [] if unavailable."""
+    sentences = parse_book(text, NER_COMPONENTS)
+    if not sentences:
+        return []
+    return rank_entities(sentences, limit)
+
 from src.prompts import SEMANTIC_ANALYSIS_PROMPT
 
 async def semantic_analysis_with_llm(text, api_key):
@@ -111,7 +220,9 @@ async def semantic_analysis_with_llm(text, api_key):
     try:
         client, model_name = get_gemini_model(capability="text", api_key=api_key)
         
-        prompt = SEMANTIC_ANALYSIS_PROMPT.format(text=text[:100000])
+        # Scenes should come from the whole book, not just its opening
+        sample = await asyncio.to_thread(select_passages, text, ANALYSIS_MAX_CHARS)
+        prompt = SEMANTIC_ANALYSIS_PROMPT.format(text=sample or text[:ANALYSIS_MAX_CHARS])
         
         # Run blocking generation in thread
         response = await asyncio.to_thread(
@@ -1,9 +1,16 @@
 import asyncio
+import os
+import uuid
+import hashlib
+import time
 import requests
+from collections import OrderedDict
 
 from google import genai
 from src.config import ELEVENLABS_API_KEY, GEMINI_API_KEY, DEEPGRAM_API_KEY
 from src.prompts import SSML_PROMPT
+from src.provider_health import HealthRegistry, is_rate_limit_error
+from src.gemini_utils import get_gemini_model
 
 # Configure Gemini
 # genai.configure(api_key=GEMINI_API_KEY) # Not needed with new SDK client
@@ -92,7 +99,7 @@ def get_deepgram_voice(voice_id: str) -> str:
     }
     return voice_map.get(voice_id, "aura-2-cordelia-en")
 
-async def generate_audio_deepgram(text, output_path, voice_id="21m00Tcm4TlvDq8ikWAM", title=None, author=None):
+async def generate_audio_deepgram(text, output_path, voice_id="21m00Tcm4TlvDq8ikWAM", title=None, author=None, include_outro=True):
     """
     Generates audio using Deepgram Aura-2 TTS API.
     Automatically selects appropriate voice based on voice_id mapping.
@@ -122,7 +129,7 @@ async def generate_audio_deepgram(text, output_path, voice_id="21m00Tcm4TlvDq8ik
     else:
         # Long text - apply full professional narration
         # Only pass title/author if provided (implies audiobook mode)
-        professional_text = format_for_professional_narration(text, book_title=title, author=author)
+        professional_text = format_for_professional_narration(text, book_title=title, author=author, include_outro=include_outro)
         formatted_text = format_text_for_deepgram(professional_text)
     
     print(f"📝 Text formatted for natural TTS ({len(text)} -> {len(formatted_text)} chars)")
@@ -154,40 +161,117 @@ async def generate_audio_deepgram(text, output_path, voice_id="21m00Tcm4TlvDq8ik
         print(f"❌ Deepgram failed: {e}")
         raise e
 
-async def generate_audio(text, output_path="audiobook.mp3", voice_id="21m00Tcm4TlvDq8ikWAM", stability=0.5, similarity_boost=0.75, style=0.0, use_speaker_boost=True, provider="elevenlabs", speaking_rate=1.0, title=None, author=None):
+# Health tracking for TTS providers ("inbuilt" is Edge TTS, the keyless last resort)
+tts_health = HealthRegistry(["deepgram", "elevenlabs", "inbuilt"])
+
+def route_tts_providers(provider: str) -> list:
+    """
+    Ordered list of providers to try for a request.
+    The requested provider comes first unless it is unhealthy; providers
+    without an API key or with an open circuit breaker are skipped up front,
+    so an outage no longer costs a failed round-trip per segment.
+    """
+    configured = {
+        "deepgram": bool(DEEPGRAM_API_KEY),
+        "elevenlabs": bool(ELEVENLABS_API_KEY),
+        "inbuilt": True
+    }
+    if provider not in configured:
+        print(f"⚠️  Unknown provider '{provider}'. Using Edge TTS.")
+        provider = "inbuilt"
+    elif not configured[provider]:
+        print(f"⚠️  {provider.title()} key missing. Falling back to Inbuilt (Edge TTS).")
+
+    candidates = [provider] if configured[provider] else []
+    if "inbuilt" not in candidates:
+        candidates.append("inbuilt")
+
+    routed = tts_health.rank(candidates)
+    # Edge TTS stays available as the last resort even if its breaker is open
+    return routed or ["inbuilt"]
+
+async def generate_audio(text, output_path="audiobook.mp3", voice_id="21m00Tcm4TlvDq8ikWAM", stability=0.5, similarity_boost=0.75, style=0.0, use_speaker_boost=True, provider="elevenlabs", speaking_rate=1.0, title=None, author=None, include_outro=True):
     """
     Generates audio using the specified provider with automatic fallback.
-    Priority: Deepgram -> Edge TTS (inbuilt)
+    Providers are routed by health (see route_tts_providers); Edge TTS (inbuilt)
+    is the final fallback. include_outro=False stops Deepgram's long-text
+    narration from closing with "Thank you for listening" (for parts of a book).
     """
     print(f"🎵 Generating audio with provider: {provider} (Rate: {speaking_rate})")
     
-    # Deepgram with automatic fallback to edge-tts
-    if provider == "deepgram":
-        if not DEEPGRAM_API_KEY:
-            print("⚠️  Deepgram key missing. Falling back to Inbuilt (Edge TTS).")
-            return await generate_audio_edge(text, output_path, voice_id, rate=speaking_rate)
+    last_error = None
+    for name in route_tts_providers(provider):
+        health = tts_health.get(name)
+        ticket = health.allow_request()
+        if ticket is None and name != "inbuilt":
+            continue  # Edge TTS still runs as the last resort, just without a trial ticket
         
         try:
-            return await generate_audio_deepgram(text, output_path, voice_id, title=title, author=author)
+            # Bounded per provider actually called, not the one requested
+            async with get_provider_semaphore(name):
+                start = time.monotonic()
+                if name == "deepgram":
+                    result = await generate_audio_deepgram(text, output_path, voice_id, title=title, author=author, include_outro=include_outro)
+                elif name == "elevenlabs":
+                    result = await generate_audio_elevenlabs(text, output_path, voice_id, stability, similarity_boost, style, use_speaker_boost)
+                else:
+                    result = await generate_audio_edge(text, output_path, voice_id, rate=speaking_rate)
+            health.record_success(time.monotonic() - start, ticket)
+            return result
+        except asyncio.CancelledError:
+            health.end_trial(ticket)  # Cancelled by the caller; not a failure
+            raise
+        except Exception as e:
+            health.record_failure(time.monotonic() - start, rate_limited=is_rate_limit_error(e), ticket=ticket)
+            last_error = e
+            print(f"⚠️  {name} failed: {e}. Trying next provider...")
+    
+    raise last_error or Exception("No TTS provider available")
+
+# Max in-flight TTS requests per provider when synthesizing many files at once
+PROVIDER_CONCURRENCY = {
+    "deepgram": 4,
+    "elevenlabs": 2,  # ElevenLabs rejects concurrent requests above the plan limit
+    "inbuilt": 3,
+}
+_provider_semaphores = {}
+
+def get_provider_semaphore(provider: str) -> asyncio.Semaphore:
+    """Shared semaphore bounding concurrent requests to a TTS provider."""
+    if provider not in _provider_semaphores:
+        _provider_semaphores[provider] = asyncio.Semaphore(PROVIDER_CONCURRENCY.get(provider, 2))
+    return _provider_semaphores[provider]
+
+async def generate_audio_file(text, output_path, retries=2, **kwargs):
+    """
+    Generates audio into output_path atomically, retrying on failure.
+    Audio is written to a temp file and renamed into place, so readers never
+    see a partially written file. Accepts the same kwargs as generate_audio.
+    """
+    # Keep the extension last so providers that sniff it still see ".mp3"
+    root, ext = os.path.splitext(output_path)
+    tmp_path = f"{root}.{uuid.uuid4().hex[:8]}.part{ext}"
+
+    last_error = None
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            wait_time = 2 ** attempt
+            print(f"🔄 Retrying {os.path.basename(output_path)} in {wait_time}s (attempt {attempt + 1}/{retries + 1})...")
+            await asyncio.sleep(wait_time)
+        try:
+            result = await generate_audio(text, tmp_path, **kwargs)
+            if not result or not os.path.exists(result):
+                raise Exception("Provider returned no audio")
+            os.replace(result, output_path)
+            return output_path
         except Exception as e:
-            print(f"⚠️  Deepgram failed: {e}. Falling back to Inbuilt (Edge TTS).")
-            return await generate_audio_edge(text, output_path, voice_id, rate=speaking_rate)
-    
-    # Edge TTS (inbuilt)
-    elif provider == "inbuilt":
-        return await generate_audio_edge(text, output_path, voice_id, rate=speaking_rate)
-    
-    # ElevenLabs with fallback
-    elif provider == "elevenlabs":
-        if not ELEVENLABS_API_KEY:
-            print("⚠️  ElevenLabs key missing. Falling back to Inbuilt (Edge TTS).")
-            return await generate_audio_edge(text, output_path, voice_id, rate=speaking_rate)
-        return await generate_audio_elevenlabs(text, output_path, voice_id, stability, similarity_boost, style, use_speaker_boost)
-    
-    # Default fallback
-    else:
-        print(f"⚠️  Unknown provider '{provider}'. Using Edge TTS.")
-        return await generate_audio_edge(text, output_path, voice_id, rate=speaking_rate)
+            last_error = e
+            print(f"⚠️  Audio attempt {attempt + 1} failed for {os.path.basename(output_path)}: {e}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    raise Exception(f"Audio generation failed after {retries + 1} attempts: {last_error}")
 
 async def generate_audio_elevenlabs(text, output_path, voice_id, stability, similarity_boost, style, use_speaker_boost):
     """
@@ -247,9 +331,9 @@ async def generate_audio_elevenlabs(text, output_path, voice_id, stability, simi
             raise Exception(error_msg)
             
     except Exception as e:
+        # Fallback is handled by the provider router in generate_audio
         print(f"Exception in ElevenLabs TTS: {e}")
-        print("Falling back to Edge TTS...")
-        return await generate_audio_edge(text, output_path, voice_id)
+        raise e
 
 async def generate_audio_edge(text, output_path, voice_id=None, rate=1.0):
     """
@@ -567,11 +651,22 @@ def slow_down_for_audiobook(text: str) -> str:
 
 
 
+# Narration prep: chunk size per Gemini call, concurrent calls, cached chunks
+NARRATION_CHUNK_CHARS = 8000
+NARRATION_CONCURRENCY = 4
+NARRATION_CACHE_SIZE = 512
+_narration_cache = OrderedDict()
+
 async def prepare_audiobook_text(text: str, book_title: str = "this audiobook", author: str = "the author") -> str:
     """
     Prepare text for professional audiobook narration using Gemini.
     Applies all the formatting rules for natural, engaging TTS output.
     
+    The whole book is split into chunks which are narrated concurrently
+    (at most NARRATION_CONCURRENCY Gemini calls in flight) and reassembled
+    in their original order. Chunks that fail fall back to rule-based
+    formatting individually.
+    
     Args:
         text: The raw book text
         book_title: Title of the book
@@ -580,63 +675,85 @@ async def prepare_audiobook_text(text: str, book_title: str = "this audiobook",
     Returns:
         Formatted text optimized for TTS narration
     """
-    from src.config import GEMINI_API_KEY
+    print(f"📖 Preparing audiobook narration for: {book_title}")
+    
+    chunks = chunk_text_for_tts(text, max_chunk_size=NARRATION_CHUNK_CHARS)
+    semaphore = asyncio.Semaphore(NARRATION_CONCURRENCY)
+    last = len(chunks) - 1
     
+    # One client and model for every chunk; model discovery is blocking
     try:
-        from google import genai
-        from src.prompts import AUDIOBOOK_NARRATOR_PROMPT
-        
-        print(f"📖 Preparing audiobook narration for: {book_title}")
-        
-        # For very long texts, process in chunks
-        max_chunk = 8000
-        if len(text) > max_chunk:
-            # Process intro
-            intro_text = text[:max_chunk]
-            processed_intro = await _process_audiobook_chunk(intro_text, book_title, author, is_intro=True)
-            
-            # For now, just add pauses to the rest using rule-based approach
-            rest_text = text[max_chunk:]
-            processed_rest = slow_down_for_audiobook(enhance_text_for_natural_tts(rest_text))
-            
-            full_text = processed_intro + "\n\n... " + processed_rest
-            
-            # Add outro
-            full_text += "\n\n... Thank you for listening."
-            
-            return full_text
-        else:
-            return await _process_audiobook_chunk(text, book_title, author, is_intro=True, is_outro=True)
-            
+        client, model_name = await asyncio.to_thread(get_gemini_model, "text", GEMINI_API_KEY)
     except Exception as e:
-        print(f"⚠️ Audiobook preparation failed: {e}, using rule-based fallback")
-        # Fallback to rule-based processing
+        print(f"⚠️ Gemini unavailable for narration prep ({e}), using rule-based formatting")
+        client, model_name = None, None
+    
+    async def process(i, chunk):
+        is_intro, is_outro = i == 0, i == last
+        if client is None:
+            return _rule_based_narration(chunk, book_title, author, is_intro, is_outro)
+        async with semaphore:
+            try:
+                return await _process_audiobook_chunk(chunk, book_title, author, client, model_name,
+                                                      is_intro=is_intro, is_outro=is_outro)
+            except Exception as e:
+                print(f"⚠️ Narration prep failed for chunk {i + 1}/{len(chunks)}: {e}, using rule-based fallback")
+                return _rule_based_narration(chunk, book_title, author, is_intro, is_outro)
+    
+    # gather preserves input order regardless of completion order
+    processed = await asyncio.gather(*(process(i, chunk) for i, chunk in enumerate(chunks)))
+    
+    if len(chunks) > 1:
+        print(f"✅ Narration prepared for {len(chunks)} chunks ({len(text)} chars)")
+    return "\n\n... ".join(processed)
+
+
+def _rule_based_narration(text: str, book_title: str, author: str, is_intro: bool, is_outro: bool) -> str:
+    """Rule-based narration formatting for a single chunk."""
+    result = ""
+    if is_intro:
         result = f"You are listening to the audiobook of {book_title}. "
         if author:
             result += f"Written by {author}. "
         result += "... "
-        result += slow_down_for_audiobook(enhance_text_for_natural_tts(text))
+    result += slow_down_for_audiobook(enhance_text_for_natural_tts(text))
+    if is_outro:
         result += " ... Thank you for listening."
-        return result
+    return result
 
 
-async def _process_audiobook_chunk(text: str, book_title: str, author: str, 
+async def _process_audiobook_chunk(text: str, book_title: str, author: str, client, model_name: str,
                                    is_intro: bool = False, is_outro: bool = False) -> str:
-    """Process a chunk of text through LLM for audiobook formatting."""
-    from src.config import GEMINI_API_KEY
-    from google import genai
-    from src.prompts import AUDIOBOOK_NARRATOR_PROMPT
+    """Process a chunk of text through LLM for audiobook formatting (cached per chunk)."""
+    from src.prompts import (
+        AUDIOBOOK_NARRATOR_PROMPT, AUDIOBOOK_INTRO_INSTRUCTION,
+        AUDIOBOOK_OUTRO_INSTRUCTION, AUDIOBOOK_CONTINUATION_INSTRUCTION
+    )
     
-    client = genai.Client(api_key=GEMINI_API_KEY)
+    cache_key = hashlib.sha256(f"{model_name}\0{book_title}\0{author}\0{is_intro}\0{is_outro}\0{text}".encode("utf-8")).hexdigest()
+    if cache_key in _narration_cache:
+        _narration_cache.move_to_end(cache_key)
+        return _narration_cache[cache_key]
+    
+    bookends = ""
+    if is_intro:
+        bookends += AUDIOBOOK_INTRO_INSTRUCTION
+    if is_outro:
+        bookends += AUDIOBOOK_OUTRO_INSTRUCTION
+    if not bookends:
+        bookends = AUDIOBOOK_CONTINUATION_INSTRUCTION
     
     prompt = AUDIOBOOK_NARRATOR_PROMPT.format(
         text=text,
         book_title=book_title,
-        author=author
+        author=author,
+        bookends=bookends
     )
     
-    response = client.models.generate_content(
-        model='gemini-2.0-flash',
+    # Run blocking generation in thread
+    response = await asyncio.to_thread(
+        client.models.generate_content,
+        model=model_name,
         contents=prompt
     )
     
@@ -645,23 +762,18 @@ async def _process_audiobook_chunk(text: str, book_title: str, author: str,
     # Validate output
     if len(processed) < len(text) * 0.3:
         print("⚠️ LLM output too short, using rule-based fallback")
-        result = ""
-        result = ""
-        if is_intro:
-            result = f"You are listening to the audiobook of {book_title}. "
-            if author:
-                result += f"Written by {author}. "
-            result += "... "
-        result += slow_down_for_audiobook(enhance_text_for_natural_tts(text))
-        if is_outro:
-            result += " ... Thank you for listening."
-        return result
+        # Not cached so a later run can retry the LLM
+        return _rule_based_narration(text, book_title, author, is_intro, is_outro)
+    
+    _narration_cache[cache_key] = processed
+    if len(_narration_cache) > NARRATION_CACHE_SIZE:
+        _narration_cache.popitem(last=False)
     
     print(f"✅ Audiobook text prepared ({len(text)} -> {len(processed)} chars)")
     return processed
 
 
-def format_for_professional_narration(text: str, book_title: str = "", author: str = "") -> str:
+def format_for_professional_narration(text: str, book_title: str = "", author: str = "", include_outro: bool = True) -> str:
     """
     Rule-based professional narration formatting (sync version).
     Adds proper pauses and formatting for audiobook quality.
@@ -711,7 +823,8 @@ def format_for_professional_narration(text: str, book_title: str = "", author: s
         result = re.sub(abbr, expanded, result)
     
     # === ADD OUTRO ===
-    result = result.rstrip() + " ... Thank you for listening."
+    if include_outro:
+        result = result.rstrip() + " ... Thank you for listening."
     
     # === CLEAN UP ===
     result = re.sub(r'(\.\s*){4,}', '... ', result)
@@ -0,0 +1,208 @@
+import os
+import asyncio
+from typing import List, Dict, Optional, Callable
+from src.analysis import chapter_segmentation
+from src.audio import generate_audio_file, chunk_text_for_tts
+from src.media import run_ffmpeg, probe_duration, write_ffmetadata, codec_args
+
+# Parallel ffmpeg encodes; each one is a single-threaded subprocess
+MAX_FFMPEG_PROCESSES = os.cpu_count() or 2
+_ffmpeg_slots = None
+
+def _get_ffmpeg_slots() -> asyncio.Semaphore:
+    """Semaphore sizing the ffmpeg subprocess pool to the number of cores."""
+    global _ffmpeg_slots
+    if _ffmpeg_slots is None:
+        _ffmpeg_slots = asyncio.Semaphore(MAX_FFMPEG_PROCESSES)
+    return _ffmpeg_slots
+
+def _write_concat_list(path: str, files: List[str]) -> str:
+    """Write an ffmpeg concat demuxer list."""
+    with open(path, "w", encoding="utf-8") as f:
+        for file_path in files:
+            escaped = os.path.abspath(file_path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return path
+
+async def _encode_chapter(parts: List[str], mp3_path: str, aac_path: str, title: str, track: int, total: int, book_title: str, author: str):
+    """
+    Join a chapter's TTS parts into a tagged MP3 and an AAC track for the M4B.
+    Both outputs come from one ffmpeg process, written via temp files.
+    """
+    list_path = _write_concat_list(f"{mp3_path}.txt", parts)
+    tags = [
+        "-metadata", f"title={title}",
+        "-metadata", f"album={book_title}",
+        "-metadata", f"artist={author}",
+        "-metadata", f"track={track}/{total}",
+    ]
+    mp3_tmp, aac_tmp = f"{mp3_path}.part", f"{aac_path}.part"
+    try:
+        async with _get_ffmpeg_slots():
+            await run_ffmpeg([
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-map", "0:a", *tags, *codec_args("mp3"), "-y", mp3_tmp,
+                "-map", "0:a", *codec_args("m4a"), "-y", aac_tmp
+            ])
+        os.replace(mp3_tmp, mp3_path)
+        os.replace(aac_tmp, aac_path)
+    finally:
+        for path in (list_path, mp3_tmp, aac_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+
+async def _package_m4b(chapters: List[Dict], output_path: str, book_title: str, author: str) -> str:
+    """Concatenate chapter AAC tracks (stream copy) into an M4B with chapter atoms."""
+    durations = await asyncio.gather(*(probe_duration(c["aac_path"]) for c in chapters))
+
+    markers = []
+    cursor = 0.0
+    for chapter, duration in zip(chapters, durations):
+        markers.append({"title": chapter["title"], "start": cursor, "end": cursor + duration})
+        chapter["start"] = round(cursor, 3)
+        chapter["duration"] = round(duration, 3)
+        cursor += duration
+
+    list_path = _write_concat_list(f"{output_path}.txt", [c["aac_path"] for c in chapters])
+    metadata_path = write_ffmetadata(f"{output_path}.ffmeta", markers, title=book_title, artist=author)
+    tmp_path = f"{output_path}.part"
+    try:
+        async with _get_ffmpeg_slots():
+            await run_ffmpeg([
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-i", metadata_path,
+                "-map", "0:a", "-map_metadata", "1", "-map_chapters", "1",
+                "-c", "copy", "-movflags", "+faststart", "-f", "mp4",
+                "-y", tmp_path
+            ])
+        os.replace(tmp_path, output_path)
+    finally:
+        for path in (list_path, metadata_path, tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return output_path
+
+async def export_audiobook(
+    text: str,
+    output_dir: str,
+    book_title: str = "Untitled",
+    author: str = "Unknown Author",
+    voice_id: str = "21m00Tcm4TlvDq8ikWAM",
+    provider: str = "deepgram",
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Export a full-length audiobook as chapter MP3s plus a single M4B.
+
+    TTS chunks for all chapters are synthesized concurrently (bounded per
+    provider); each chapter is encoded as soon as its chunks are ready, with
+    ffmpeg subprocesses bounded by the number of cores.
+
+    Args:
+        text: Full book text
+        output_dir: Directory for chapter MP3s and the M4B
+        progress_callback: Called with a chapter dict whenever its status changes
+
+    Returns:
+        Dict with the export status ("complete", "partial" or "failed"), the
+        M4B path, the indexes of chapters missing from it and per-chapter results
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    parts_dir = os.path.join(output_dir, "parts")
+    os.makedirs(parts_dir, exist_ok=True)
+
+    segments = [c for c in chapter_segmentation(text) if c["content"].strip()]
+    if not segments:
+        segments = [{"title": book_title, "content": text}]
+
+    chapters = []
+    for i, segment in enumerate(segments):
+        chunks = chunk_text_for_tts(segment["content"].strip())
+        chapters.append({
+            "index": i + 1,
+            "title": segment["title"] or f"Chapter {i + 1}",
+            "chunks": chunks,
+            "mp3_path": os.path.join(output_dir, f"chapter_{i + 1:03d}.mp3"),
+            "aac_path": os.path.join(parts_dir, f"chapter_{i + 1:03d}.m4a"),
+            "status": "pending"
+        })
+
+    # Intro on the very first chunk, outro on the very last
+    chapters[0]["chunks"][0] = f"You are listening to {book_title}, written by {author}. ... " + chapters[0]["chunks"][0]
+    chapters[-1]["chunks"][-1] = chapters[-1]["chunks"][-1] + " ... Thank you for listening."
+
+    print(f"📚 Exporting audiobook '{book_title}': {len(chapters)} chapters, "
+          f"{sum(len(c['chunks']) for c in chapters)} TTS chunks")
+
+    def update(chapter, status):
+        chapter["status"] = status
+        if progress_callback:
+            progress_callback(chapter)
+
+    async def process_chapter(chapter):
+        update(chapter, "synthesizing")
+        parts = [
+            os.path.join(parts_dir, f"chapter_{chapter['index']:03d}_part_{j:03d}.mp3")
+            for j in range(len(chapter["chunks"]))
+        ]
+        tasks = [
+            asyncio.create_task(generate_audio_file(chunk, part, voice_id=voice_id, provider=provider, include_outro=False))
+            for chunk, part in zip(chapter["chunks"], parts)
+        ]
+        try:
+            # Stop the chapter at its first failed part: the remaining parts are
+            # cancelled (and awaited) before their files are removed below
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in tasks:
+                if task in done and task.exception():
+                    raise task.exception()
+            update(chapter, "encoding")
+            await _encode_chapter(
+                parts, chapter["mp3_path"], chapter["aac_path"],
+                chapter["title"], chapter["index"], len(chapters), book_title, author
+            )
+            update(chapter, "ready")
+        except Exception as e:
+            chapter["error"] = str(e)[:200]
+            update(chapter, "failed")
+            print(f"❌ Chapter {chapter['index']} export failed: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for part in parts:
+                if os.path.exists(part):
+                    os.remove(part)
+
+    await asyncio.gather(*(process_chapter(c) for c in chapters))
+
+    ready = [c for c in chapters if c["status"] == "ready"]
+    missing = [c["index"] for c in chapters if c["status"] != "ready"]
+    status = "failed" if not ready else "partial" if missing else "complete"
+    m4b_path = None
+    if ready:
+        # A book with missing chapters is never published under the plain title
+        safe_title = "".join(c if c.isalnum() else "_" for c in book_title)[:50] or "audiobook"
+        if missing:
+            safe_title += "_partial"
+        m4b_path = await _package_m4b(ready, os.path.join(output_dir, f"{safe_title}.m4b"), book_title, author)
+        if missing:
+            print(f"⚠️ Partial audiobook exported: {m4b_path} ({len(ready)}/{len(chapters)} chapters, missing {missing})")
+        else:
+            print(f"✅ Audiobook exported: {m4b_path} ({len(ready)}/{len(chapters)} chapters)")
+
+    for chapter in ready:
+        if os.path.exists(chapter["aac_path"]):
+            os.remove(chapter["aac_path"])
+    if not os.listdir(parts_dir):
+        os.rmdir(parts_dir)
+
+    return {
+        "status": status,
+        "m4b_path": m4b_path,
+        "missing_chapters": missing,
+        "chapters": [
+            {k: c.get(k) for k in ("index", "title", "status", "mp3_path", "start", "duration", "error")}
+            for c in chapters
+        ]
+    }
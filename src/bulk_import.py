@@ -0,0 +1,268 @@
+"""
+Bulk library import from a directory or a zip archive.
+
+    python -m src.bulk_import /path/to/books        # directory (recursive)
+    python -m src.bulk_import catalog.zip --no-analysis
+
+Files are deduplicated by content hash, ingested in a process pool and
+queued for semantic analysis under a rate limit.
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import zipfile
+import tempfile
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Callable
+
+from src.library import LibraryManager, ALLOWED_EXTENSIONS, file_sha256
+
+# Text extraction is CPU-bound (PDF parsing); one process per spare core
+INGEST_PROCESSES = max(1, (os.cpu_count() or 2) - 1)
+
+# Analysis calls Gemini; keep well under the per-minute quota
+ANALYSIS_CONCURRENCY = 2
+ANALYSIS_MIN_INTERVAL = 4.0  # Seconds between analysis starts
+
+# Zip archives are untrusted; bound what extraction may write
+ZIP_MAX_MEMBERS = int(os.getenv("ZIP_MAX_MEMBERS", 5000))
+ZIP_MAX_TOTAL_MB = int(os.getenv("ZIP_MAX_TOTAL_MB", 4096))  # Uncompressed, all members
+ZIP_MAX_RATIO = 100  # Uncompressed / compressed size of a single member
+
+class AnalysisRateLimiter:
+    """Bounds concurrent analyses and spaces out their start times."""
+    def __init__(self, max_concurrent: int = ANALYSIS_CONCURRENCY, min_interval: float = ANALYSIS_MIN_INTERVAL):
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.min_interval = min_interval
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        async with self.lock:
+            delay = self.next_start - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_start = time.monotonic() + self.min_interval
+        return self
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+def _ingest_worker(path: str) -> Dict:
+    """Runs in a worker process: extract text and metadata from one book file."""
+    from src.ingestion import ingest_book
+    result = asyncio.run(ingest_book(path))
+    return {
+        "title": result.get("title") or "Unknown",
+        "author": result.get("author") or "Unknown",
+        "full_text": result.get("full_text", "")
+    }
+
+def _check_zip_limits(members: List[zipfile.ZipInfo]):
+    """Reject archives whose declared sizes exceed the extraction limits."""
+    if len(members) > ZIP_MAX_MEMBERS:
+        raise ValueError(f"Archive has {len(members)} book files; the limit is {ZIP_MAX_MEMBERS}")
+    total = sum(member.file_size for member in members)
+    if total > ZIP_MAX_TOTAL_MB * 1024 * 1024:
+        raise ValueError(f"Archive expands to {total // (1024 * 1024)}MB; the limit is {ZIP_MAX_TOTAL_MB}MB")
+    for member in members:
+        if member.file_size > ZIP_MAX_RATIO * max(member.compress_size, 1):
+            raise ValueError(f"Suspicious compression ratio for {member.filename}")
+
+def _copy_bounded(src, dst, declared: int, budget: int, chunk_size: int = 1024 * 1024) -> int:
+    """
+    Copy a zip member, stopping if it writes more than its header declared or
+    than the remaining budget (headers can lie). Returns the bytes written.
+    """
+    limit = min(declared, budget)
+    written = 0
+    while chunk := src.read(chunk_size):
+        written += len(chunk)
+        if written > limit:
+            raise ValueError("Archive member is larger than declared or exceeds the extraction limit")
+        dst.write(chunk)
+    return written
+
+def collect_sources(source: str, extract_dir: str) -> List[str]:
+    """
+    Book files under a directory, or extracted from a zip into extract_dir.
+    Zip members are flattened to their basenames so paths can't escape extract_dir,
+    and archives over the member-count, size or compression-ratio limits are rejected.
+    """
+    if os.path.isdir(source):
+        files = []
+        for root, _, names in os.walk(source):
+            for name in sorted(names):
+                if os.path.splitext(name)[1].lower() in ALLOWED_EXTENSIONS and not name.startswith("."):
+                    files.append(os.path.join(root, name))
+        return files
+
+    if zipfile.is_zipfile(source):
+        files = []
+        with zipfile.ZipFile(source) as archive:
+            members = [
+                (i, member) for i, member in enumerate(archive.infolist())
+                if not member.is_dir()
+                and not os.path.basename(member.filename).startswith(".")
+                and os.path.splitext(member.filename)[1].lower() in ALLOWED_EXTENSIONS
+            ]
+            _check_zip_limits([member for _, member in members])
+            budget = ZIP_MAX_TOTAL_MB * 1024 * 1024
+            for i, member in members:
+                # Index prefix keeps same-named files from different folders apart
+                target = os.path.join(extract_dir, f"{i:05d}", os.path.basename(member.filename))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with archive.open(member) as src, open(target, "wb") as dst:
+                    budget -= _copy_bounded(src, dst, member.file_size, budget)
+                files.append(target)
+        return files
+
+    raise ValueError(f"Not a directory or zip archive: {source}")
+
+def _safe_filename(name: str) -> str:
+    # Same rules as /api/upload
+    safe = "".join(c for c in os.path.basename(name) if c.isalnum() or c in "._- ").strip()
+    return safe or f"import_{int(time.time())}.txt"
+
+def _library_filename(path: str, upload_dir: str, content_hash: str, reserved: set) -> str:
+    """A name in the upload dir not used by an existing file or another file in this import."""
+    filename = _safe_filename(path)
+    if filename in reserved or os.path.exists(os.path.join(upload_dir, filename)):
+        stem, ext = os.path.splitext(filename)
+        filename = f"{stem}_{content_hash[:8]}{ext}"
+    reserved.add(filename)
+    return filename
+
+def _copy_into_library(path: str, target: str):
+    if not os.path.exists(target):
+        tmp_path = f"{target}.part"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, target)
+
+async def bulk_import(
+    source: str,
+    library: LibraryManager,
+    analyze: bool = True,
+    processes: int = INGEST_PROCESSES,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Import every book in a directory or zip archive into the library.
+
+    Args:
+        source: Directory (searched recursively) or .zip path
+        library: Library to import into; files are copied to its upload dir
+        analyze: Run semantic analysis for each imported book
+        progress_callback: Called with a file entry whenever its status changes
+
+    Returns:
+        {"files": [...], "counts": {status: n}}. Each file entry holds
+        source, status (queued/duplicate/ingesting/analyzing/imported/failed),
+        book_id and error.
+    """
+    from src.analysis import semantic_analysis
+
+    extract_dir = tempfile.mkdtemp(prefix="book_import_")
+    files: List[Dict] = []
+    try:
+        paths = await asyncio.to_thread(collect_sources, source, extract_dir)
+        files = [{"source": os.path.basename(p), "path": p, "status": "queued", "book_id": None, "error": None} for p in paths]
+        print(f"📦 Bulk import: {len(files)} book files found in {source}")
+
+        def update(entry, status, **fields):
+            entry["status"] = status
+            entry.update(fields)
+            if progress_callback:
+                progress_callback(entry)
+
+        # Dedupe against the library and within the batch before any parsing
+        await asyncio.to_thread(library.backfill_content_hashes)
+        hashes = await asyncio.gather(*(asyncio.to_thread(file_sha256, entry["path"]) for entry in files))
+        seen = {}
+        reserved = set()
+        pending = []
+        for entry, content_hash in zip(files, hashes):
+            entry["content_hash"] = content_hash
+            existing = seen.get(content_hash) or await asyncio.to_thread(library.find_book_by_hash, content_hash)
+            if existing:
+                update(entry, "duplicate", book_id=existing.get("id"), duplicate_of=existing.get("title"))
+            else:
+                seen[content_hash] = {"title": entry["source"]}
+                entry["filename"] = _library_filename(entry["path"], library.upload_dir, content_hash, reserved)
+                pending.append(entry)
+
+        limiter = AnalysisRateLimiter()
+        loop = asyncio.get_running_loop()
+
+        async def process(entry, pool):
+            try:
+                update(entry, "ingesting")
+                filename = entry["filename"]
+                stored_path = os.path.join(library.upload_dir, filename)
+                await asyncio.to_thread(_copy_into_library, entry["path"], stored_path)
+                result = await loop.run_in_executor(pool, _ingest_worker, stored_path)
+                book = await asyncio.to_thread(library.add_book, {
+                    "title": result["title"],
+                    "author": result["author"],
+                    "filename": filename,
+                    "file_size": os.path.getsize(stored_path),
+                    "content_hash": entry["content_hash"]
+                }, result["full_text"])
+                entry["book_id"] = book["id"]
+
+                if analyze and result["full_text"].strip():
+                    update(entry, "analyzing")
+                    async with limiter:
+                        analysis = await semantic_analysis(result["full_text"])
+                    await asyncio.to_thread(library.save_analysis, book["id"], analysis)
+                    await asyncio.to_thread(library.update_graph, book["id"], result["full_text"], analysis.get("entities"))
+                update(entry, "imported", title=result["title"])
+            except Exception as e:
+                print(f"❌ Import failed for {entry['source']}: {e}")
+                update(entry, "failed", error=str(e)[:200])
+
+        if pending:
+            # Spawned workers: forking the server would copy its threads and open connections
+            with ProcessPoolExecutor(max_workers=max(1, processes), mp_context=multiprocessing.get_context("spawn")) as pool:
+                await asyncio.gather(*(process(entry, pool) for entry in pending))
+    finally:
+        shutil.rmtree(extract_dir, ignore_errors=True)
+
+    counts = {}
+    for entry in files:
+        entry.pop("path", None)
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    print(f"✅ Bulk import finished: {counts}")
+    return {"files": files, "counts": counts}
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Import a directory or zip of PDF/EPUB/TXT books into the library.")
+    parser.add_argument("source", help="Directory or .zip archive")
+    parser.add_argument("--upload-dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "temp_upload"),
+                        help="Library upload directory (default: the server's temp_upload)")
+    parser.add_argument("--no-analysis", action="store_true", help="Only ingest; skip semantic analysis")
+    parser.add_argument("--processes", type=int, default=INGEST_PROCESSES, help="Ingestion worker processes")
+    args = parser.parse_args(argv)
+
+    import src.config  # Load .env for analysis API keys
+    from src.nlp_pipeline import set_pipe_processes
+    set_pipe_processes(args.processes)  # Offline analysis may use spaCy workers outside the server
+
+    os.makedirs(args.upload_dir, exist_ok=True)
+    library = LibraryManager(args.upload_dir)
+
+    def report(entry):
+        print(f"   [{entry['status']:>9}] {entry['source']}" + (f" - {entry['error']}" if entry.get("error") else ""))
+
+    result = asyncio.run(bulk_import(
+        args.source, library, analyze=not args.no_analysis, processes=args.processes, progress_callback=report
+    ))
+    return 0 if not result["counts"].get("failed") else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,49 +1,213 @@
 from typing import Optional, List
 from sqlmodel import Field, SQLModel, create_engine, Session, Relationship
+from sqlalchemy import Index, Column, Text, event
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
 import os
+import zlib
 
-# Database URL
-DATABASE_URL = "sqlite:///./library.db"
+# Database URL (absolute default so the DB doesn't depend on the working directory)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(PROJECT_ROOT, 'library.db')}")
+
+# SQLite connection tuning for concurrent request + background task traffic
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",       # Readers don't block the writer
+    "synchronous": "NORMAL",     # Safe with WAL, far fewer fsyncs
+    "busy_timeout": 5000,        # Wait (ms) for the write lock instead of "database is locked"
+    "cache_size": -20000,        # ~20MB page cache per connection
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+def create_db_engine(url: str = DATABASE_URL):
+    """Create an engine; SQLite connections get SQLITE_PRAGMAS applied on connect."""
+    if not url.startswith("sqlite"):
+        return create_engine(url, echo=False, pool_pre_ping=True)
+
+    # Pooled connections are handed between the event loop and worker threads
+    db_engine = create_engine(url, echo=False, connect_args={"check_same_thread": False, "timeout": 30})
+
+    @event.listens_for(db_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return db_engine
 
 # Engine
-engine = create_engine(DATABASE_URL, echo=False)
+engine = create_db_engine()
+
+# Compressed column storage: header + zlib stream. The leading NUL can't start
+# a stored text value, so rows written before compression still read back as-is.
+COMPRESSED_HEADER = b"\x00zl1"
+COMPRESS_MIN_BYTES = 512   # Smaller values aren't worth the header/CPU
+COMPRESS_LEVEL = 6
+
+def compress_text(value: str):
+    """Encode a string for storage; returns bytes if compressed, else the original str."""
+    raw = value.encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return value
+    return COMPRESSED_HEADER + zlib.compress(raw, COMPRESS_LEVEL)
+
+def decompress_text(value) -> str:
+    if isinstance(value, (bytes, memoryview)):
+        value = bytes(value)
+        if value.startswith(COMPRESSED_HEADER):
+            return zlib.decompress(value[len(COMPRESSED_HEADER):]).decode("utf-8")
+        return value.decode("utf-8")
+    return value
+
+class CompressedText(TypeDecorator):
+    """
+    Text column stored zlib-compressed (as a BLOB) when large. Decompression
+    happens only when the column is actually loaded, so deferred/unselected
+    columns cost nothing.
+    """
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return compress_text(value) if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value) if value is not None else None
 
 class Book(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
     author: str
-    filename: str
-    upload_date: datetime = Field(default_factory=datetime.utcnow)
-    full_text: str = Field() # Defer loading large text
-    
+    filename: str = Field(unique=True, index=True)
+    file_size: int = Field(default=0) # Bytes, recorded at upload so listings don't stat the disk
+    content_hash: Optional[str] = Field(default=None, index=True) # sha256 of the uploaded file, for dedupe
+    upload_date: datetime = Field(default_factory=datetime.utcnow, index=True)
+    full_text: str = Field(sa_column=Column(CompressedText, nullable=False)) # Large: list via BOOK_SUMMARY_COLUMNS / defer() in src/library.py
+
     # Relationships
     analysis: Optional["Analysis"] = Relationship(back_populates="book")
     images: List["Image"] = Relationship(back_populates="book")
 
 class Analysis(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    book_id: int = Field(foreign_key="book.id")
+    book_id: int = Field(foreign_key="book.id", unique=True, index=True) # One analysis per book
     summary: str
-    entities_json: str # JSON string
-    scenes_json: str # JSON string
-    keywords_json: str # JSON string
-    podcast_json: Optional[str] = None # JSON string for podcast playlist
-    
+    # Entities, scenes and podcast segments live in their own tables (migration 6);
+    # the JSON columns are kept empty for older readers of the schema.
+    entities_json: str = Field(default="[]", sa_column=Column(CompressedText, nullable=False))
+    scenes_json: str = Field(default="[]", sa_column=Column(CompressedText, nullable=False))
+    keywords_json: str = Field(sa_column=Column(CompressedText, nullable=False)) # JSON string
+    podcast_json: Optional[str] = Field(default=None, sa_column=Column(CompressedText))
+
     book: Optional[Book] = Relationship(back_populates="analysis")
 
 class Image(SQLModel, table=True):
+    # Cover lookups filter on (book_id, type); the leading column also serves book_id lookups
+    __table_args__ = (Index("ix_image_book_id_type", "book_id", "type"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     book_id: int = Field(foreign_key="book.id")
     type: str # "cover", "scene", "entity"
     path: str
     prompt: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    
+
     book: Optional[Book] = Relationship(back_populates="images")
 
+class Entity(SQLModel, table=True):
+    """One character/entity from a book's analysis."""
+    __table_args__ = (Index("ix_entity_book_id_position", "book_id", "position", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    book_id: int = Field(foreign_key="book.id")
+    position: int # Order within the analysis
+    name: str
+    name_key: str = Field(index=True) # Lowercased name for lookups across books
+    role: Optional[str] = None
+    data_json: str # Original entry, e.g. [name, role, physical, outfit, prop]
+
+class Scene(SQLModel, table=True):
+    __table_args__ = (Index("ix_scene_book_id_position", "book_id", "position", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    book_id: int = Field(foreign_key="book.id")
+    position: int
+    description: str
+    emotion: Optional[str] = None
+    data_json: str # Original scene dict (description, excerpt, narrator_intro, mood, ...)
+
+class PodcastSegment(SQLModel, table=True):
+    __tablename__ = "podcast_segment"
+    __table_args__ = (Index("ix_podcast_segment_book_id_position", "book_id", "position", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    book_id: int = Field(foreign_key="book.id")
+    position: int
+    speaker: str
+    text: str
+    url: Optional[str] = None
+
+class Asset(SQLModel, table=True):
+    """A generated file or directory under the upload dir (path relative to it)."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    path: str = Field(unique=True, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class AssetRef(SQLModel, table=True):
+    """Book -> asset reference; an asset with no refs is garbage."""
+    __tablename__ = "asset_ref"
+
+    asset_id: int = Field(foreign_key="asset.id", primary_key=True)
+    book_id: int = Field(foreign_key="book.id", primary_key=True, index=True)
+
+class StudyPack(SQLModel, table=True):
+    """Quiz, flashcards and suggested questions generated once per book."""
+    __tablename__ = "study_pack"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    book_id: int = Field(foreign_key="book.id", unique=True, index=True)
+    quiz_json: str = Field(sa_column=Column(CompressedText, nullable=False))
+    flashcards_json: str = Field(sa_column=Column(CompressedText, nullable=False))
+    questions_json: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class GraphChapter(SQLModel, table=True):
+    """Digest of a chapter's text and entity names when its graph edges were counted."""
+    __tablename__ = "graph_chapter"
+
+    book_id: int = Field(foreign_key="book.id", primary_key=True)
+    position: int = Field(primary_key=True)
+    title: str
+    digest: str
+
+class GraphEdge(SQLModel, table=True):
+    """Co-occurrence weight of two entities in one chapter; source == target rows are mention counts."""
+    __tablename__ = "graph_edge"
+    __table_args__ = (Index("ix_graph_edge_book_id_chapter", "book_id", "chapter"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    book_id: int = Field(foreign_key="book.id")
+    chapter: int
+    source: str
+    target: str
+    weight: int
+
+class QASession(SQLModel, table=True):
+    """A Q&A conversation about one book: rolling summary plus the latest turns."""
+    __tablename__ = "qa_session"
+
+    id: str = Field(primary_key=True)
+    book_id: int = Field(foreign_key="book.id", index=True)
+    summary: str = ""
+    turns_json: str = "[]"
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 def init_db():
-    SQLModel.metadata.create_all(engine)
+    from src.migrations import run_migrations
+    run_migrations(engine)
 
 def get_session():
     with Session(engine) as session:
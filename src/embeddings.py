@@ -0,0 +1,199 @@
+"""
+Per-book passage embeddings for semantic retrieval.
+
+Each book's passages (retrieval.chunk_text, so row i is passage i) are
+embedded in batches and saved as a float16 matrix of unit vectors:
+
+    temp_upload/embeddings/<text digest>-<model>.npy
+
+Files are keyed by a digest of the text, so the same book text is embedded
+once whether it arrives by upload, library load or bulk import. Queries
+memory-map the file and score it block by block, so only the pages
+touched are read and no book's vectors are held in RAM between calls.
+"""
+import os
+import hashlib
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.retrieval import chunk_text, TOP_K
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", os.path.join(PROJECT_ROOT, "temp_upload", "embeddings"))
+
+EMBED_BATCH = 64           # Passages per embedding call (Gemini allows up to 100)
+SCORE_BLOCK_ROWS = 4096    # Rows scored per block of the memory-mapped matrix
+
+# Local CPU model (sentence-transformers, optional) is preferred; Gemini otherwise
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+GEMINI_EMBEDDING_MODEL = "text-embedding-004"
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+class Embedder:
+    """A named text -> unit vector function."""
+    def __init__(self, name: str, encode):
+        self.name = name
+        self._encode = encode
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Unit-normalized float32 vectors, one row per text, computed in batches."""
+        rows = []
+        for i in range(0, len(texts), EMBED_BATCH):
+            rows.append(np.asarray(self._encode(texts[i:i + EMBED_BATCH]), dtype=np.float32))
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32)
+        return _normalize(np.vstack(rows))
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def _load_local_embedder() -> Optional[Embedder]:
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        return None
+    try:
+        model = SentenceTransformer(LOCAL_EMBEDDING_MODEL, device="cpu")
+    except Exception as e:
+        print(f"⚠️ Local embedding model failed to load: {e}")
+        return None
+    name = LOCAL_EMBEDDING_MODEL.rsplit("/", 1)[-1]
+    return Embedder(name, lambda batch: model.encode(batch, batch_size=EMBED_BATCH, convert_to_numpy=True))
+
+def _load_gemini_embedder() -> Optional[Embedder]:
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return None
+    from google import genai
+    client = genai.Client(api_key=api_key)
+
+    def encode(batch):
+        response = client.models.embed_content(model=GEMINI_EMBEDDING_MODEL, contents=batch)
+        return [e.values for e in response.embeddings]
+    return Embedder(GEMINI_EMBEDDING_MODEL, encode)
+
+def get_embedder() -> Optional[Embedder]:
+    """The process-wide embedder, or None when no backend is available."""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = _load_local_embedder() or _load_gemini_embedder() or False
+            if _embedder:
+                print(f"🧭 Embeddings via {_embedder.name}")
+        return _embedder or None
+
+def text_key(full_text: str) -> str:
+    return hashlib.sha1((full_text or "").encode("utf-8")).hexdigest()[:20]
+
+def store_path(full_text: str, embedder: Embedder, directory: str = EMBEDDING_DIR) -> str:
+    return os.path.join(directory, f"{text_key(full_text)}-{embedder.name}.npy")
+
+def build_index(full_text: str, directory: str = EMBEDDING_DIR, embedder: Optional[Embedder] = None) -> Optional[str]:
+    """
+    Embed a book's passages and save them. Returns the file path, or None
+    if no embedder is available. Existing files are reused.
+    """
+    embedder = embedder or get_embedder()
+    if not embedder or not (full_text or "").strip():
+        return None
+    path = store_path(full_text, embedder, directory)
+    if os.path.exists(path):
+        return path
+
+    passages = chunk_text(full_text)
+    print(f"🧭 Embedding {len(passages)} passages...")
+    matrix = embedder.embed(passages).astype(np.float16)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.part.npy"
+    np.save(tmp_path, matrix)
+    os.replace(tmp_path, path)
+    return path
+
+def load_index(full_text: str, directory: str = EMBEDDING_DIR, embedder: Optional[Embedder] = None) -> Optional[np.ndarray]:
+    """The book's passage matrix, memory-mapped read-only, or None if not built."""
+    embedder = embedder or get_embedder()
+    if not embedder:
+        return None
+    path = store_path(full_text, embedder, directory)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+def cosine_top_k(matrix: np.ndarray, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """
+    Rows of a unit-vector matrix most similar to a unit query vector, best
+    first. Scored in blocks so a memory-mapped matrix is never fully loaded.
+    """
+    if matrix is None or not len(matrix) or k <= 0:
+        return []
+    query = np.asarray(query, dtype=np.float32).ravel()
+    scores = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+        scores[start:start + len(block)] = block @ query
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(int(i), float(scores[i])) for i in top]
+
+def _spread_rows(matrix: np.ndarray, k: int) -> List[int]:
+    """
+    k rows that cover the book: start from the passage closest to the mean,
+    then repeatedly take the passage least similar to everything chosen so far.
+    """
+    n = len(matrix)
+    if n <= k:
+        return list(range(n))
+    mean = np.zeros(matrix.shape[1], dtype=np.float32)
+    for start in range(0, n, SCORE_BLOCK_ROWS):
+        mean += np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32).sum(axis=0)
+    chosen = [cosine_top_k(matrix, _normalize(mean), 1)[0][0]]
+    closest = np.full(n, -np.inf, dtype=np.float32)
+    for _ in range(k - 1):
+        last = np.asarray(matrix[chosen[-1]], dtype=np.float32)
+        for start in range(0, n, SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            np.maximum(closest[start:start + len(block)], block @ last, out=closest[start:start + len(block)])
+        closest[chosen] = np.inf
+        chosen.append(int(np.argmin(closest)))
+    return chosen
+
+def semantic_passages(full_text: str, question: str, k: int = TOP_K, directory: str = EMBEDDING_DIR) -> Optional[List[str]]:
+    """
+    Top-k passages for a question by cosine similarity, in reading order.
+    None when the book has no embedding index (callers fall back to BM25).
+    """
+    embedder = get_embedder()
+    matrix = load_index(full_text, directory, embedder)
+    if matrix is None:
+        return None
+    query = embedder.embed([question])[0]
+    positions = sorted(i for i, _ in cosine_top_k(matrix, query, k))
+    passages = chunk_text(full_text)
+    return [passages[i] for i in positions if i < len(passages)]
+
+def representative_passages(full_text: str, k: int = 4, directory: str = EMBEDDING_DIR) -> Optional[List[str]]:
+    """k passages spread across the book's content, in reading order, or None without an index."""
+    matrix = load_index(full_text, directory)
+    if matrix is None:
+        return None
+    passages = chunk_text(full_text)
+    return [passages[i] for i in sorted(_spread_rows(matrix, k)) if i < len(passages)]
+
+def select_passages(full_text: str, max_chars: int, directory: str = EMBEDDING_DIR) -> Optional[str]:
+    """
+    Text of at most max_chars drawn from across a long book (for prompts that
+    can't take the whole text), building the index if needed. None when the
+    text already fits or no embedder is available.
+    """
+    if len(full_text or "") <= max_chars or not build_index(full_text, directory):
+        return None
+    passages = chunk_text(full_text)
+    per_passage = max(1, max(len(p) for p in passages))
+    chosen = representative_passages(full_text, max(1, max_chars // per_passage), directory) or []
+    return "\n\n...\n\n".join(chosen)[:max_chars]
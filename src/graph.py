@@ -0,0 +1,147 @@
+"""
+Character relationship graph from entity co-occurrence.
+
+Each chapter is scanned once: one compiled pattern finds the analysis
+entities' names in every paragraph, and two entities are linked whenever
+they appear within GRAPH_WINDOW paragraphs of each other. Counts are kept
+sparse (only pairs that actually meet), so the work is linear in the
+length of the book.
+
+Partial graphs are per chapter and carry a digest of the chapter text and
+the entity names. LibraryManager.update_graph stores them and only
+recounts chapters whose digest changed, and the book's graph is the sum of
+its chapters.
+"""
+import re
+import hashlib
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.analysis import chapter_segmentation, NAME_TITLES, clean_name
+
+GRAPH_WINDOW = 3          # Paragraphs (current + previous) within which names co-occur
+GRAPH_MAX_ENTITIES = 50   # Analysis entities tracked, in analysis order
+GRAPH_MIN_ALIAS = 3       # Shortest first/last name usable on its own
+
+PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+
+def entity_names(entities: Sequence) -> List[str]:
+    """Names from analysis entities ([name, role, ...], dicts or plain names), deduplicated."""
+    names = []
+    for entity in entities or []:
+        if isinstance(entity, (list, tuple)):
+            name = entity[0] if entity else ""
+        elif isinstance(entity, dict):
+            name = entity.get("name", "")
+        else:
+            name = entity
+        name = clean_name(str(name))
+        if name and name not in names:
+            names.append(name)
+    return names[:GRAPH_MAX_ENTITIES]
+
+def name_aliases(names: Sequence[str]) -> Dict[str, str]:
+    """
+    Surface form -> entity name. Besides the full name, a multi-word name is
+    matched by its first or last word ("Elizabeth", "Bennet") when no other
+    entity shares that word.
+    """
+    aliases = {name: name for name in names}
+    owners = {}
+    for name in names:
+        words = name.split()
+        if len(words) < 2:
+            continue
+        for word in {words[0], words[-1]}:
+            if len(word) >= GRAPH_MIN_ALIAS and word.lower() not in NAME_TITLES:
+                owners.setdefault(word, set()).add(name)
+    for word, owner in owners.items():
+        if len(owner) == 1 and word not in aliases:
+            aliases[word] = next(iter(owner))
+    return aliases
+
+def name_pattern(aliases: Dict[str, str]) -> Optional[re.Pattern]:
+    if not aliases:
+        return None
+    alternatives = "|".join(re.escape(alias) for alias in sorted(aliases, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternatives})\b")
+
+def names_key(names: Sequence[str]) -> str:
+    return "\x00".join(sorted(names))
+
+def chapter_digest(title: str, content: str, key: str) -> str:
+    digest = hashlib.sha1(key.encode("utf-8"))
+    digest.update(b"\x01" + title.encode("utf-8") + b"\x01" + content.encode("utf-8"))
+    return digest.hexdigest()
+
+def count_chapter(content: str, pattern: Optional[re.Pattern], aliases: Dict[str, str],
+                  window: int = GRAPH_WINDOW) -> Tuple[Counter, Counter]:
+    """
+    Mentions and co-occurrences in one chapter.
+
+    Returns:
+        (Counter{name: mentions}, Counter{(name_a, name_b): weight}) with
+        name_a < name_b; a pair gains 1 for each paragraph in which one of
+        them appears while the other appeared within the window.
+    """
+    mentions = Counter()
+    edges = Counter()
+    if pattern is None:
+        return mentions, edges
+
+    last_seen = {}  # name -> index of the last paragraph mentioning it
+    for index, paragraph in enumerate(PARAGRAPH_PATTERN.split(content)):
+        present = Counter(aliases[match] for match in pattern.findall(paragraph))
+        if not present:
+            continue
+        mentions.update(present)
+        for name in present:
+            last_seen[name] = index
+        active = [name for name, seen in last_seen.items() if seen > index - window]
+        edges.update({
+            (a, b) if a < b else (b, a)
+            for a in present for b in active if a != b
+        })
+    return mentions, edges
+
+def chapter_graphs(full_text: str, entities: Sequence, known: Optional[Dict[int, str]] = None) -> List[Dict]:
+    """
+    Per-chapter partial graphs for a book.
+
+    `known` maps chapter position -> digest already stored; those chapters
+    come back with "changed": False and are not recounted.
+
+    Returns:
+        [{"position", "title", "digest", "changed", "mentions", "edges"}]
+    """
+    names = entity_names(entities)
+    aliases = name_aliases(names)
+    pattern = name_pattern(aliases)
+    key = names_key(names)
+    known = known or {}
+
+    chapters = []
+    for position, chapter in enumerate(c for c in chapter_segmentation(full_text or "") if c["content"].strip()):
+        digest = chapter_digest(chapter["title"], chapter["content"], key)
+        entry = {"position": position, "title": chapter["title"], "digest": digest,
+                 "changed": known.get(position) != digest, "mentions": Counter(), "edges": Counter()}
+        if entry["changed"]:
+            entry["mentions"], entry["edges"] = count_chapter(chapter["content"], pattern, aliases)
+        chapters.append(entry)
+    return chapters
+
+def graph_payload(rows: Sequence[Tuple[str, str, int]], min_weight: int = 1) -> Dict:
+    """
+    API shape from summed (source, target, weight) rows, where source ==
+    target rows hold a node's mention count.
+    """
+    nodes = []
+    edges = []
+    for source, target, weight in rows:
+        if source == target:
+            nodes.append({"id": source, "mentions": int(weight)})
+        elif weight >= min_weight:
+            edges.append({"source": source, "target": target, "weight": int(weight)})
+    nodes.sort(key=lambda n: (-n["mentions"], n["id"]))
+    edges.sort(key=lambda e: (-e["weight"], e["source"], e["target"]))
+    return {"nodes": nodes, "edges": edges}
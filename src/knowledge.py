@@ -1,13 +1,24 @@
 import json
 import os
+import time
 import random
+import asyncio
+import hashlib
+from collections import OrderedDict
+import aiohttp
 # spaCy imported lazily in load_spacy() to avoid startup overhead if not needed
 from src.config import GEMINI_API_KEY
-from google import genai
 from src.gemini_utils import get_gemini_model
+from src.retrieval import rank_passages, format_passages, chunk_text
+from src.analysis import chapter_segmentation
+from src.nlp_pipeline import parse_book, load_pipeline, MODEL_COMPONENTS
+from src.embeddings import semantic_passages
+from src.provider_health import HealthRegistry, is_rate_limit_error
 
 nlp = None
 
+DEFAULT_QUESTIONS = ("What is the plot?", "Who are the characters?")
+
 def get_referer():
     """Get HTTP referer URL with correct port from environment."""
     port = os.getenv("PORT", "8000")
@@ -16,341 +27,604 @@ def get_referer():
 def load_spacy():
     """
     Lazily load spaCy English model for NLP tasks.
+    Task-specific pipelines (only the needed components) come from nlp_pipeline.
     
     Returns:
         Loaded spaCy model or None if loading fails.
     """
     global nlp
     if nlp is None:
-        try:
-            import spacy
-            nlp = spacy.load("en_core_web_sm")
-        except Exception as e:
-            print(f"Warning: Spacy load failed: {e}")
-            print("Install with: python -m spacy download en_core_web_sm")
-            nlp = None
+        nlp = load_pipeline(MODEL_COMPONENTS)
     return nlp
 
-def generate_flashcards(text, output_path="flashcards.json"):
+def flashcards_from_text(text, parsed=False):
     """
-    Generates flashcards from text.
+    Definition-style flashcards ("X is a Y") found in the text. With
+    parsed=True, sentences come from the cached spaCy parse (when available)
+    instead of splitting on periods.
     """
-    print("Generating flashcards...")
     flashcards = []
-    sentences = text.split('.')
+    sentences = [sent["text"] for sent in parse_book(text) or []] if parsed else []
+    if not sentences:
+        sentences = text.split('.')
     for sentence in sentences:
+        sentence = sentence.strip().rstrip(".!?")
         if "is a" in sentence and len(sentence) < 100:
             parts = sentence.split("is a")
             flashcards.append({
                 "front": parts[0].strip(),
                 "back": parts[1].strip()
             })
-    
-    with open(output_path, 'w') as f:
-        json.dump(flashcards, f, indent=4)
-    
-    return output_path
+    return flashcards
 
-def generate_quizzes(text, output_path="quiz.json"):
+def quiz_from_spacy(text, count=5):
     """
-    Generates quizzes. Uses DeepSeek if available, then Gemini, else Spacy fallback.
+    Fill-in-the-blank questions from random sentences across the text, or
+    None if spaCy is unavailable. Uses the cached parse from nlp_pipeline,
+    so the book is tagged once and sentences are never re-parsed.
     """
-    print("Generating quiz...")
-    
+    sentences = parse_book(text)
+    if sentences is None:
+        print("Spacy not loaded. Cannot generate quiz.")
+        return None
+
+    # Sentences with a noun or proper noun to mask
+    candidates = []
+    for sent in sentences:
+        if 20 < len(sent["text"]) < 150:
+            nouns = [tok for tok, pos, is_stop in sent["tokens"] if pos in ("NOUN", "PROPN") and not is_stop]
+            if nouns:
+                candidates.append((sent["text"], nouns))
+
+    quiz = []
+    for sent, nouns in random.sample(candidates, min(count, len(candidates))):
+        target = random.choice(nouns)
+        question = sent.replace(target, "______")
+        quiz.append({
+            "question": f"Fill in the blank: {question}",
+            "options": ["(Write the answer)"],
+            "answer": target
+        })
+    return quiz
+
+# Shared settings for chat completions (Q&A, suggested questions)
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEEPSEEK_MODEL = "deepseek/deepseek-chat"
+LLM_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=5)
+HEDGE_DELAY = 3.0          # Seconds before the next provider is raced, until latencies are known
+HEDGE_PERCENTILE = 0.95    # Afterwards: a provider's p95 latency, so ~5% of calls get hedged
+HEDGE_MIN_SAMPLES = 5      # Successful calls needed before the percentile is trusted
+HEDGE_MIN_DELAY = 0.5
+HEDGE_MAX_DELAY = 10.0
+MAX_CONNECTIONS = 20       # Pooled connections across providers
+
+llm_health = HealthRegistry(["deepseek", "gemini"])
+
+class NoProviderError(Exception):
+    """No LLM provider has an API key configured."""
+
+# Answers keyed by question + retrieved passages, so repeats skip the LLM
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_TTL = 3600  # Seconds
+_answer_cache = OrderedDict()  # key -> (timestamp, answer)
+
+_http_session = None
+_gemini = None  # (client, model_name), resolved once
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Process-wide aiohttp session, so keep-alive connections are reused across requests."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            timeout=LLM_TIMEOUT,
+            connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS, ttl_dns_cache=300)
+        )
+    return _http_session
+
+async def close_http_session():
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+async def complete_with_deepseek(prompt):
+    """Chat completion via OpenRouter (DeepSeek)."""
+    headers = {
+        "Authorization": f"Bearer {os.getenv('DEEPSEEK_API_KEY')}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": get_referer(),
+        "X-Title": "Book2Vision"
+    }
+    data = {"model": DEEPSEEK_MODEL, "messages": [{"role": "user", "content": prompt}]}
+    async with get_http_session().post(OPENROUTER_URL, headers=headers, json=data) as response:
+        if response.status != 200:
+            raise Exception(f"OpenRouter Error {response.status}: {(await response.text())[:200]}")
+        result = await response.json()
+        return result['choices'][0]['message']['content'].strip()
+
+async def stream_with_deepseek(prompt):
+    """Yields completion text as OpenRouter streams it (server-sent events)."""
+    headers = {
+        "Authorization": f"Bearer {os.getenv('DEEPSEEK_API_KEY')}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": get_referer(),
+        "X-Title": "Book2Vision"
+    }
+    data = {"model": DEEPSEEK_MODEL, "messages": [{"role": "user", "content": prompt}], "stream": True}
+    async with get_http_session().post(OPENROUTER_URL, headers=headers, json=data) as response:
+        if response.status != 200:
+            raise Exception(f"OpenRouter Error {response.status}: {(await response.text())[:200]}")
+        async for raw_line in response.content:
+            line = raw_line.decode("utf-8").strip()
+            # Lines starting with ":" are keep-alive comments
+            if not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+            delta = json.loads(payload)["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+async def get_gemini():
+    """Cached Gemini client and model; model discovery is blocking, so it runs in a thread once."""
+    global _gemini
+    if _gemini is None:
+        _gemini = await asyncio.to_thread(get_gemini_model, "text", os.getenv("GEMINI_API_KEY"))
+    return _gemini
+
+async def complete_with_gemini(prompt):
+    client, model_name = await get_gemini()
+    response = await asyncio.wait_for(
+        client.aio.models.generate_content(model=model_name, contents=prompt),
+        LLM_TIMEOUT.total
+    )
+    return response.text.strip()
+
+async def stream_with_gemini(prompt):
+    client, model_name = await get_gemini()
+    async for chunk in await client.aio.models.generate_content_stream(model=model_name, contents=prompt):
+        if chunk.text:
+            yield chunk.text
+
+STREAMING_PROVIDERS = {"deepseek": stream_with_deepseek, "gemini": stream_with_gemini}
+
+def configured_providers():
+    """(name, completion coroutine) for each provider with a key, in preference order."""
+    providers = []
     if os.getenv("DEEPSEEK_API_KEY"):
-        return generate_quiz_with_deepseek(text, output_path)
-    elif os.getenv("GEMINI_API_KEY"):
-        return generate_quiz_with_llm(text, output_path)
-    else:
-        return generate_quiz_with_spacy(text, output_path)
-
-def generate_quiz_with_deepseek(text, output_path):
-    print("Using DeepSeek (via OpenRouter) for Quiz Generation...")
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        return generate_quiz_with_llm(text, output_path)
+        providers.append(("deepseek", complete_with_deepseek))
+    if os.getenv("GEMINI_API_KEY"):
+        providers.append(("gemini", complete_with_gemini))
+    return providers
+
+def hedge_delay_for(name):
+    """
+    Seconds to wait on a provider before racing the next one: its p95
+    latency over recent successful calls (clamped), or HEDGE_DELAY until
+    there are HEDGE_MIN_SAMPLES of them.
+    """
+    p95 = llm_health.get(name).latency_percentile(HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES)
+    if p95 is None:
+        return HEDGE_DELAY
+    return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, p95))
+
+def json_list(key=None):
+    """complete() parser: the JSON array in a reply, else ValueError so another provider is tried."""
+    def parse(content):
+        data = parse_json_payload(content, key)
+        if not isinstance(data, list) or not data:
+            raise ValueError("Reply is not a non-empty JSON array")
+        return data
+    return parse
+
+async def complete(prompt, providers=None, hedge_delay=None, parse=None):
+    """
+    First valid completion across providers.
+
+    Providers are tried healthiest first. Each one gets its hedge delay
+    (hedge_delay_for(), or a fixed `hedge_delay`) before the next is started
+    alongside it; whichever answers first wins and the others are cancelled.
+    `parse` turns a reply into the result; a reply it rejects counts as a
+    failure and the next provider starts at once.
+
+    Raises:
+        Exception: the last provider error when every provider fails
+    """
+    providers = dict(providers if providers is not None else configured_providers())
+    waiting = llm_health.rank(list(providers))
+    pending = set()
+    last_error = None
+    hedge_at = 0.0
+
+    async def attempt(name, ticket):
+        health = llm_health.get(name)
+        start = time.monotonic()
+        try:
+            result = await providers[name](prompt)
+            if parse is not None:
+                result = parse(result)
+        except asyncio.CancelledError:
+            health.end_trial(ticket)  # Lost the race; not a failure
+            raise
+        except Exception as e:
+            health.record_failure(time.monotonic() - start, rate_limited=is_rate_limit_error(e), ticket=ticket)
+            print(f"⚠️ {name} completion failed: {e}")
+            raise
+        health.record_success(time.monotonic() - start, ticket)
+        return result
+
+    def start_next():
+        nonlocal hedge_at
+        while waiting:
+            name = waiting.pop(0)
+            ticket = llm_health.get(name).allow_request()
+            if ticket is not None:
+                pending.add(asyncio.create_task(attempt(name, ticket)))
+                hedge_at = time.monotonic() + (hedge_delay if hedge_delay is not None else hedge_delay_for(name))
+                return
 
     try:
-        import requests
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": get_referer(),
-            "X-Title": "Book2Vision"
-        }
-        
-        prompt = f"""
-        Generate 5 multiple choice questions based on the following text.
-        Return the result as a JSON array of objects with keys: question, options (list of 4 strings), answer (string).
-        Ensure the JSON is valid and strictly follows the format.
-        
-        Text: {text[:3000]}
-        """
-        
-        data = {
-            "model": "deepseek/deepseek-chat", # Or specific deepseek model supported by OpenRouter
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        }
-        
-        response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data, timeout=30)
-        
-        print(f"OpenRouter Suggestion Status: {response.status_code}")
-        print(f"OpenRouter Suggestion Response: {response.text}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-            
-            # Clean up response text
-            content = content.strip()
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
-                
-            quiz_data = json.loads(content)
-            
-            # Handle if it returns a dict with a key like "questions"
-            if isinstance(quiz_data, dict) and "questions" in quiz_data:
-                quiz_data = quiz_data["questions"]
-                
-            with open(output_path, 'w') as f:
-                json.dump(quiz_data, f, indent=4)
-            return output_path
-        else:
-            print(f"DeepSeek API Error: {response.status_code} - {response.text}")
-            return generate_quiz_with_llm(text, output_path)
-            
-    except Exception as e:
-        print(f"Error generating quiz with DeepSeek: {e}. Falling back to Gemini.")
-        return generate_quiz_with_llm(text, output_path)
-
-def generate_quiz_with_llm(text, output_path):
-    print("Using Gemini for Quiz Generation...")
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        return generate_quiz_with_spacy(text, output_path)
-        
-    try:
-        client, model_name = get_gemini_model(capability="text", api_key=api_key)
-        
-        prompt = f"""
-        Generate 5 multiple choice questions based on the following text.
-        Return the result as a JSON array of objects with keys: question, options (list of 4 strings), answer (string).
-        
-        Text: {text[:3000]}
-        """
-        
-        response = client.models.generate_content(model=model_name, contents=prompt)
-        # Clean up response text
-        response_text = response.text.strip()
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-            
-        quiz_data = json.loads(response_text)
-        
-        # Handle if it returns a dict with a key like "questions"
-        if isinstance(quiz_data, dict) and "questions" in quiz_data:
-            quiz_data = quiz_data["questions"]
-            
-        with open(output_path, 'w') as f:
-            json.dump(quiz_data, f, indent=4)
-        return output_path
-    except Exception as e:
-        print(f"Error generating quiz with Gemini: {e}. Falling back to Spacy.")
-        return generate_quiz_with_spacy(text, output_path)
+        start_next()
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=max(0.0, hedge_at - time.monotonic()) if waiting else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+            start_next()
+    finally:
+        for task in pending:
+            task.cancel()
+    raise last_error or Exception("No LLM provider available")
 
-def generate_quiz_with_spacy(text, output_path):
-    print("Using Spacy for Fill-in-the-blank Quiz...")
-    nlp_model = load_spacy()
-    if not nlp_model:
-        print("Spacy not loaded. Cannot generate quiz.")
+async def stream_completion(prompt, providers=None):
+    """
+    Yields completion text from the healthiest provider as it streams.
+    A provider that fails before its first token falls over to the next;
+    once text has been sent, a failure is raised to the caller.
+    """
+    if providers is None:
+        providers = [(name, STREAMING_PROVIDERS[name]) for name, _ in configured_providers()]
+    providers = dict(providers)
+    last_error = None
+    for name in llm_health.rank(list(providers)):
+        health = llm_health.get(name)
+        ticket = health.allow_request()
+        if ticket is None:
+            continue
+        start = time.monotonic()
+        started = False
+        try:
+            async for text in providers[name](prompt):
+                started = True
+                yield text
+        except (asyncio.CancelledError, GeneratorExit):
+            health.end_trial(ticket)  # Consumer went away; not a failure
+            raise
+        except Exception as e:
+            health.record_failure(time.monotonic() - start, rate_limited=is_rate_limit_error(e), ticket=ticket)
+            if started:
+                raise
+            print(f"⚠️ {name} stream failed: {e}")
+            last_error = e
+            continue
+        health.record_success(time.monotonic() - start, ticket)
+        return
+    raise last_error or Exception("No LLM provider available")
+
+def _answer_key(question, passages):
+    digest = hashlib.sha1(" ".join(question.lower().split()).encode("utf-8"))
+    for passage in passages:
+        digest.update(b"\x00" + passage.encode("utf-8"))
+    return digest.hexdigest()
+
+def get_cached_answer(question, passages):
+    key = _answer_key(question, passages)
+    entry = _answer_cache.get(key)
+    if entry is None:
         return None
-        
-    doc = nlp_model(text)
-    quiz = []
-    
-    # Find sentences with entities or nouns
-    sentences = [sent.text.strip() for sent in doc.sents if len(sent.text) > 20 and len(sent.text) < 150]
-    selected_sentences = random.sample(sentences, min(5, len(sentences)))
-    
-    for sent in selected_sentences:
-        sent_doc = nlp_model(sent)
-        # Pick a noun or entity to mask
-        candidates = [token for token in sent_doc if token.pos_ in ["NOUN", "PROPN"] and not token.is_stop]
-        if candidates:
-            target = random.choice(candidates)
-            question = sent.replace(target.text, "______")
-            quiz.append({
-                "question": f"Fill in the blank: {question}",
-                "options": ["(Write the answer)"],
-                "answer": target.text
-            })
-            
-    with open(output_path, 'w') as f:
-        json.dump(quiz, f, indent=4)
-    return output_path
+    if time.monotonic() - entry[0] > ANSWER_CACHE_TTL:
+        del _answer_cache[key]
+        return None
+    _answer_cache.move_to_end(key)
+    return entry[1]
 
-def ask_question(context, question):
+def cache_answer(question, passages, answer):
+    _answer_cache[_answer_key(question, passages)] = (time.monotonic(), answer)
+    while len(_answer_cache) > ANSWER_CACHE_SIZE:
+        _answer_cache.popitem(last=False)
+
+async def find_passages(context, question):
+    """Passages for a question from raw text: embedding similarity, falling back to in-memory BM25."""
+    return (await asyncio.to_thread(semantic_passages, context, question)
+            or await asyncio.to_thread(rank_passages, context, question))
+
+def qa_prompt(question, passages, history=None):
+    conversation = ""
+    if history:
+        passages, turns = fit_conversation(passages, history)
+        lines = [f"Summary of earlier conversation: {history['summary']}"] if history.get("summary") else []
+        lines += [f"Q: {turn['q']}\n    A: {turn['a']}" for turn in turns]
+        if lines:
+            conversation = "\n    Conversation so far (for resolving follow-up questions):\n    " + "\n    ".join(lines) + "\n"
+    return f"""
+    You are an AI assistant helping a user understand a book.
+    Answer the question based ONLY on the provided passages from the book.
+    Keep the answer concise (max 3 sentences).
+    {conversation}
+    Passages:
+    {format_passages(passages)}
+
+    Question: {question}
+    """
+
+# Q&A sessions: a per-book conversation kept server-side as a rolling summary
+# plus the last few turns verbatim, so follow-ups resolve "he"/"that" without
+# re-sending earlier passages. Token counts are estimated from characters.
+CHARS_PER_TOKEN = 4
+QA_TOKEN_BUDGET = 2000      # Prompt context per session question: summary + turns + passages
+QA_HISTORY_TOKENS = 600     # Of which at most this much is recent turns
+QA_SUMMARY_TOKENS = 250     # Rolling summary cap
+QA_MAX_TURNS = 4            # Verbatim turns kept before the older ones are folded into the summary
+QA_KEEP_TURNS = 2           # Verbatim turns left after folding
+
+def estimate_tokens(text):
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+def new_conversation():
+    return {"summary": "", "turns": []}
+
+def fit_conversation(passages, history, budget=QA_TOKEN_BUDGET):
+    """
+    The passages and recent turns that fit the token budget: the summary
+    first, then turns newest-first up to QA_HISTORY_TOKENS, then passages in
+    retrieval order (always at least one).
+    """
+    remaining = budget - estimate_tokens(history.get("summary"))
+    history_budget = min(QA_HISTORY_TOKENS, remaining)
+    turns = []
+    for turn in reversed(history.get("turns", [])):
+        cost = estimate_tokens(turn["q"]) + estimate_tokens(turn["a"])
+        if cost > history_budget:
+            break
+        turns.insert(0, turn)
+        history_budget -= cost
+        remaining -= cost
+
+    kept = []
+    for passage in passages:
+        cost = estimate_tokens(passage)
+        if kept and cost > remaining:
+            break
+        kept.append(passage)
+        remaining -= cost
+    return kept, turns
+
+def retrieval_query(question, history=None):
+    """Search text for a question; follow-ups carry the previous question so "why did he?" still matches."""
+    if history and history.get("turns"):
+        return f"{question} {history['turns'][-1]['q']}"
+    return question
+
+def record_turn(history, question, answer):
+    """The conversation with one more turn appended."""
+    return {"summary": history.get("summary", ""), "turns": history.get("turns", []) + [{"q": question, "a": answer}]}
+
+def needs_compaction(history):
+    return len(history.get("turns", [])) > QA_MAX_TURNS
+
+async def compact_conversation(history):
     """
-    Answers a question based on the book context. Tries DeepSeek first, then Gemini.
+    Fold all but the last QA_KEEP_TURNS turns into the rolling summary with
+    the LLM. Without a provider, the summary keeps the latest folded text
+    that fits QA_SUMMARY_TOKENS.
+    """
+    if not needs_compaction(history):
+        return history
+    folded, kept = history["turns"][:-QA_KEEP_TURNS], history["turns"][-QA_KEEP_TURNS:]
+    transcript = "\n".join(f"Q: {turn['q']}\nA: {turn['a']}" for turn in folded)
+    max_chars = QA_SUMMARY_TOKENS * CHARS_PER_TOKEN
+    summary = None
+    if configured_providers():
+        prompt = f"""
+    Update the summary of a conversation about a book with the new exchanges.
+    Keep names, facts and what the user is interested in; drop pleasantries.
+    Return ONLY the summary, at most {QA_SUMMARY_TOKENS * 3 // 4} words.
+
+    Current summary: {history.get("summary") or "(none)"}
+
+    New exchanges:
+    {transcript}
     """
-    # Try DeepSeek/OpenRouter first
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if api_key:
-        print(f"Asking DeepSeek: {question}")
         try:
-            import requests
-            
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": get_referer(),
-                "X-Title": "Book2Vision"
-            }
-            
-            prompt = f"""
-            You are an AI assistant helping a user understand a book.
-            Answer the question based ONLY on the provided context.
-            Keep the answer concise (max 3 sentences).
-            
-            Context: {context[:10000]}...
-            
-            Question: {question}
-            """
-            
-            data = {
-                "model": "deepseek/deepseek-chat",
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ]
-            }
-            
-            response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content'].strip()
-            else:
-                print(f"OpenRouter Error: {response.status_code}. Falling back to Gemini.")
+            summary = (await complete(prompt)).strip()
         except Exception as e:
-            print(f"DeepSeek Error: {e}. Falling back to Gemini.")
+            print(f"⚠️ Conversation summary failed: {e}")
+    if not summary:
+        summary = " ".join(filter(None, [history.get("summary"), transcript.replace("\n", " ")]))
+        summary = summary[-max_chars:]
+    return {"summary": summary[:max_chars], "turns": kept}
 
-    # Fallback to Gemini
-    return ask_question_with_gemini(context, question)
+def merge_compaction(history, compacted, current):
+    """
+    Apply a compaction computed from `history` to the session as it is now,
+    keeping turns recorded while the summary was written. None if the session
+    was compacted by someone else in the meantime.
+    """
+    turns = current.get("turns", [])
+    base = history.get("turns", [])
+    if current.get("summary", "") != history.get("summary", "") or turns[:len(base)] != base:
+        return None
+    return {"summary": compacted["summary"], "turns": compacted["turns"] + turns[len(base):]}
 
-def ask_question_with_gemini(context, question):
-    print(f"Asking Gemini: {question}")
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        return "No API keys available for Q&A."
-        
+async def ask_question(context, question, passages=None, history=None):
+    """
+    Answers a question based on the book context, racing DeepSeek and Gemini
+    (see complete()).
+
+    Only the passages relevant to the question are sent: pass `passages`
+    (e.g. from LibraryManager.retrieve_passages), or they are found in
+    `context` by embedding similarity, falling back to in-memory BM25.
+    With a session `history` ({"summary", "turns"}), the conversation so far
+    is included and the prompt is held to QA_TOKEN_BUDGET.
+
+    Raises:
+        NoProviderError: no provider is configured
+        Exception: every provider failed (see complete())
+    """
+    if not configured_providers():
+        raise NoProviderError("No API keys available for Q&A.")
+    if passages is None:
+        passages = await find_passages(context, retrieval_query(question, history))
+    # Answers to follow-ups depend on the conversation, so only fresh questions are cached
+    use_cache = not (history and (history.get("summary") or history.get("turns")))
+    cached = get_cached_answer(question, passages) if use_cache else None
+    if cached is not None:
+        return cached
+
+    print(f"Asking: {question}")
+    answer = await complete(qa_prompt(question, passages, history))
+    if use_cache:
+        cache_answer(question, passages, answer)
+    return answer
+
+async def ask_question_stream(context, question, passages=None, history=None):
+    """
+    Streaming ask_question: yields the answer text as the provider produces
+    it. Cached answers are yielded whole. Raises like ask_question.
+    """
+    if not configured_providers():
+        raise NoProviderError("No API keys available for Q&A.")
+    if passages is None:
+        passages = await find_passages(context, retrieval_query(question, history))
+    use_cache = not (history and (history.get("summary") or history.get("turns")))
+    cached = get_cached_answer(question, passages) if use_cache else None
+    if cached is not None:
+        yield cached
+        return
+
+    print(f"Asking (streaming): {question}")
+    parts = []
+    async for text in stream_completion(qa_prompt(question, passages, history)):
+        parts.append(text)
+        yield text
+    if use_cache:
+        cache_answer(question, passages, "".join(parts).strip())
+
+def suggestion_prompt(context, passages=None):
+    excerpt = format_passages(passages) if passages else f"{context[:5000]}..."
+    return f"""
+    Generate 2 interesting questions a reader might ask about this book.
+    Return ONLY a JSON array of strings. Example: ["Question 1?", "Question 2?"]
+
+    Context: {excerpt}
+    """
+
+async def suggest_questions(context, passages=None):
+    """
+    Suggests 2 interesting questions, racing DeepSeek and Gemini.
+    `passages` (e.g. embeddings.representative_passages) replace the
+    opening 5000 characters as the context sent.
+    """
+    print("Generating suggested questions...")
+    if not configured_providers():
+        return list(DEFAULT_QUESTIONS)
     try:
-        client, model_name = get_gemini_model(capability="text", api_key=api_key)
-        
-        prompt = f"""
-        You are an AI assistant helping a user understand a book.
-        Answer the question based ONLY on the provided context.
-        Keep the answer concise (max 3 sentences).
-        
-        Context: {context[:10000]}...
-        
-        Question: {question}
-        """
-        
-        response = client.models.generate_content(model=model_name, contents=prompt)
-        return response.text.strip()
+        return await complete(suggestion_prompt(context, passages), parse=json_list())
     except Exception as e:
-        return f"Error with Gemini: {str(e)}"
+        print(f"Suggestion Error: {e}")
+        return list(DEFAULT_QUESTIONS)
 
-def suggest_questions(context):
+# Study pack: quiz, flashcards and suggested questions generated once per book
+STUDY_SAMPLE_CHARS = 12000   # Text sent to the LLM, drawn from across the book
+STUDY_EXCERPT_CHARS = 600    # Minimum excerpt per sampled chapter
+STUDY_QUIZ_QUESTIONS = 8
+STUDY_FLASHCARDS = 12
+
+def sample_chapters(full_text, max_chars=STUDY_SAMPLE_CHARS):
     """
-    Suggests 2 interesting questions. Tries DeepSeek first, then Gemini.
+    The opening of every chapter (evenly spaced chapters when there are too
+    many to fit), so study material covers the whole book, not its first pages.
+    Books without chapter headings are sampled by passage instead.
     """
-    print("Generating suggested questions...")
-    
-    # Try DeepSeek/OpenRouter
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if api_key:
+    chapters = [c["content"].strip() for c in chapter_segmentation(full_text or "") if c["content"].strip()]
+    if len(chapters) < 3:
+        chapters = chunk_text(full_text)
+    if not chapters:
+        return ""
+    count = min(len(chapters), max(1, max_chars // STUDY_EXCERPT_CHARS))
+    step = len(chapters) / count
+    chosen = [chapters[int(i * step)] for i in range(count)]
+    share = max_chars // count
+    return "\n\n...\n\n".join(chapter[:share] for chapter in chosen)
+
+def parse_json_payload(content, key=None):
+    """JSON from an LLM reply, minus code fences; unwraps {key: [...]} objects."""
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content[7:]
+    elif content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    data = json.loads(content)
+    if key and isinstance(data, dict) and key in data:
+        data = data[key]
+    return data
+
+async def study_quiz(full_text, sample):
+    if configured_providers():
+        prompt = f"""
+        Generate {STUDY_QUIZ_QUESTIONS} multiple choice questions based on the following excerpts, which are taken from across the whole book.
+        Cover the beginning, middle and end.
+        Return the result as a JSON array of objects with keys: question, options (list of 4 strings), answer (string).
+
+        Excerpts: {sample}
+        """
         try:
-            import requests
-            
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": get_referer(),
-                "X-Title": "Book2Vision"
-            }
-            
-            prompt = f"""
-            Generate 2 interesting questions a reader might ask about this book.
-            Return ONLY a JSON array of strings. Example: ["Question 1?", "Question 2?"]
-            
-            Context: {context[:5000]}...
-            """
-            
-            data = {
-                "model": "deepseek/deepseek-chat",
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ]
-            }
-            
-            response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content'].strip()
-                return parse_json_list(content)
-            else:
-                print(f"OpenRouter Suggestion Error: {response.status_code}. Falling back to Gemini.")
+            return await complete(prompt, parse=json_list("questions"))
         except Exception as e:
-            print(f"DeepSeek Suggestion Error: {e}. Falling back to Gemini.")
+            print(f"Study quiz generation failed: {e}. Falling back to Spacy.")
+    # Offline, the whole book is tagged (batched, cached), not just the sample
+    return await asyncio.to_thread(quiz_from_spacy, full_text, STUDY_QUIZ_QUESTIONS) or []
 
-    # Fallback to Gemini
-    return suggest_questions_with_gemini(context)
-
-def suggest_questions_with_gemini(context):
-    print("Using Gemini for Suggested Questions...")
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        return ["What is the plot?", "Who are the characters?"]
-        
-    try:
-        client, model_name = get_gemini_model(capability="text", api_key=api_key)
-        
+async def study_flashcards(full_text, sample):
+    if configured_providers():
         prompt = f"""
-        Generate 2 interesting questions a reader might ask about this book.
-        Return ONLY a JSON array of strings. Example: ["Question 1?", "Question 2?"]
-        
-        Context: {context[:5000]}...
+        Generate {STUDY_FLASHCARDS} study flashcards about the key characters, places, events and ideas in the following excerpts, which are taken from across the whole book.
+        Return the result as a JSON array of objects with keys: front (a term or question), back (a short answer).
+
+        Excerpts: {sample}
         """
-        
-        response = client.models.generate_content(model=model_name, contents=prompt)
-        return parse_json_list(response.text.strip())
-    except Exception as e:
-        print(f"Gemini Suggestion Error: {e}")
-        return ["What is the plot?", "Who are the characters?"]
+        try:
+            return await complete(prompt, parse=json_list("flashcards"))
+        except Exception as e:
+            print(f"Study flashcard generation failed: {e}. Using text heuristics.")
+    return (await asyncio.to_thread(flashcards_from_text, full_text, True))[:STUDY_FLASHCARDS]
 
-def parse_json_list(content):
-    try:
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.endswith("```"):
-            content = content[:-3]
-        return json.loads(content)
-    except:
-        return ["What is the plot?", "Who are the characters?"]
-
-def generate_mindmap(text, output_path="mindmap.png"):
+async def build_study_pack(full_text, passages=None):
     """
-    Generates a mindmap (placeholder).
+    Quiz, flashcards and suggested questions for a book, generated
+    concurrently from chapters sampled across the whole text.
+
+    Args:
+        passages: Passages for question suggestions (e.g.
+            embeddings.representative_passages); defaults to the chapter sample
+
+    Returns:
+        {"quiz": [...], "flashcards": [...], "questions": [...]}
     """
-    print("Generating mindmap data...")
-    # In a real app, use graphviz or similar
-    return output_path
+    print("📚 Building study pack...")
+    sample = await asyncio.to_thread(sample_chapters, full_text)
+    quiz, flashcards, questions = await asyncio.gather(
+        study_quiz(full_text, sample),
+        study_flashcards(full_text, sample),
+        suggest_questions(sample, passages or [sample[:5000]])
+    )
+    print(f"✅ Study pack ready: {len(quiz)} quiz questions, {len(flashcards)} flashcards")
+    return {"quiz": quiz, "flashcards": flashcards, "questions": questions}
@@ -2,10 +2,101 @@ import os
 import json
 import time
 import uuid
+import asyncio
+import shutil
+import hashlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from typing import List, Dict, Optional
 from pathlib import Path
 from sqlmodel import Session, select
-from src.database import engine, Book, Analysis, Image, init_db
+from sqlalchemy import and_, text, delete, insert, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import defer
+from src.database import engine, Book, Analysis, Image, Entity, Scene, PodcastSegment, Asset, AssetRef, StudyPack, QASession, GraphChapter, GraphEdge, init_db
+from src import search, retrieval, graph
+
+# Book formats picked up from the upload directory
+ALLOWED_EXTENSIONS = {".pdf", ".epub", ".txt"}
+
+# Fallback polling interval when watchfiles (a requirement, also pulled in by
+# uvicorn[standard]) is not installed
+WATCH_POLL_SECONDS = 5.0
+
+# Worker threads for DB access from async handlers (SQLite allows one writer; WAL lets reads overlap)
+DB_THREADS = 4
+
+# Tables holding per-book rows, deleted child-first before the book itself
+BOOK_CHILD_TABLES = (
+    AssetRef, Entity, Scene, PodcastSegment, StudyPack, QASession, GraphEdge, GraphChapter, Image, Analysis
+)
+
+# URL prefix under which upload-dir assets are served
+ASSET_URL_PREFIX = "/api/assets/"
+
+# Top search hits whose body snippet is quoted from the book text (each
+# decompresses and scans a whole book); lower hits keep the index snippet
+BODY_SNIPPET_HITS = 5
+
+# Columns needed to list books; never includes full_text
+BOOK_SUMMARY_COLUMNS = (Book.id, Book.title, Book.author, Book.filename, Book.file_size, Book.upload_date)
+
+def _book_summary_query():
+    """Book summary columns plus the cover path, in a single LEFT JOIN."""
+    return select(*BOOK_SUMMARY_COLUMNS, Image.path.label("thumbnail")).outerjoin(
+        Image, and_(Image.book_id == Book.id, Image.type == "cover")
+    )
+
+def entity_row(book_id: int, position: int, entity) -> Dict:
+    """Entity table row from an analysis entry ([name, role, ...], dict or plain name)."""
+    if isinstance(entity, (list, tuple)):
+        name = str(entity[0]) if entity else ""
+        role = str(entity[1]) if len(entity) > 1 else None
+    elif isinstance(entity, dict):
+        name, role = str(entity.get("name", "")), entity.get("role")
+    else:
+        name, role = str(entity), None
+    return {
+        "book_id": book_id, "position": position,
+        "name": name, "name_key": name.strip().lower(), "role": role,
+        "data_json": json.dumps(entity)
+    }
+
+def scene_row(book_id: int, position: int, scene) -> Dict:
+    description = scene.get("description", "") if isinstance(scene, dict) else str(scene)
+    emotion = scene.get("emotion") if isinstance(scene, dict) else None
+    return {
+        "book_id": book_id, "position": position,
+        "description": description, "emotion": emotion,
+        "data_json": json.dumps(scene)
+    }
+
+def segment_row(book_id: int, position: int, segment: Dict) -> Dict:
+    return {
+        "book_id": book_id, "position": position,
+        "speaker": segment.get("speaker", ""), "text": segment.get("text", ""), "url": segment.get("url")
+    }
+
+def _segment_to_dict(segment: PodcastSegment) -> Dict:
+    data = {"speaker": segment.speaker, "text": segment.text}
+    if segment.url:
+        data["url"] = segment.url
+    return data
+
+def replace_rows(conn, model, book_id: int, rows: List[Dict]):
+    """Swap a book's rows in one of the normalized analysis tables."""
+    conn.execute(delete(model).where(model.book_id == book_id))
+    if rows:
+        conn.execute(insert(model), rows)
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 class LibraryManager:
     """
@@ -13,6 +104,10 @@ class LibraryManager:
     """
     def __init__(self, upload_dir: str):
         self.upload_dir = upload_dir
+        self._known_filenames = None  # Filenames already in the DB, loaded on first scan
+        # Guards _known_filenames: the watcher, DB executor threads and scans all update it
+        self._known_lock = threading.Lock()
+        self._upload_dir_mtime = None  # Upload dir mtime at the last scan
         self.project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         
         # Initialize DB
@@ -20,26 +115,24 @@ class LibraryManager:
         
         # Migrate legacy JSON if needed
         self._migrate_legacy_json()
-        self._check_schema_updates()
+        self._backfill_file_sizes()
+        self._backfill_search_index()
         self.scan_and_backfill()
 
-    def _check_schema_updates(self):
-        """Check for schema updates and apply them if needed."""
-        try:
-            from sqlalchemy import text
-            with Session(engine) as session:
-                # Check if podcast_json column exists in analysis table
-                # SQLite specific check
-                result = session.exec(text("PRAGMA table_info(analysis)")).all()
-                columns = [row[1] for row in result]
-                
-                if "podcast_json" not in columns:
-                    print("🔄 Applying schema update: Adding podcast_json to analysis table...")
-                    session.exec(text("ALTER TABLE analysis ADD COLUMN podcast_json VARCHAR"))
-                    session.commit()
-                    print("✅ Schema update complete.")
-        except Exception as e:
-            print(f"⚠️ Schema update check failed: {e}")
+    def _backfill_file_sizes(self):
+        """Record on-disk sizes for books stored before Book.file_size existed."""
+        with Session(engine) as session:
+            books = session.exec(select(Book).options(defer(Book.full_text)).where(Book.file_size == 0)).all()
+            updated = 0
+            for book in books:
+                size = self._get_file_size(book.filename)
+                if size:
+                    book.file_size = size
+                    session.add(book)
+                    updated += 1
+            if updated:
+                session.commit()
+                print(f"✅ Recorded file sizes for {updated} books")
 
     def _migrate_legacy_json(self):
         """Migrate data from library.json to SQLite."""
@@ -54,7 +147,7 @@ class LibraryManager:
             with Session(engine) as session:
                 for b in books:
                     # Check if exists
-                    statement = select(Book).where(Book.filename == b["filename"])
+                    statement = select(Book.id).where(Book.filename == b["filename"])
                     existing = session.exec(statement).first()
                     if not existing:
                         # Create new book
@@ -97,23 +190,35 @@ class LibraryManager:
                 
                 if existing:
                     # Update existing
+                    old_text = existing.full_text or ""  # Still indexed; needed to replace its search row
                     existing.title = metadata.get("title", existing.title)
                     existing.author = metadata.get("author", existing.author)
                     existing.full_text = full_text or existing.full_text
+                    existing.file_size = metadata.get("file_size") or self._get_file_size(existing.filename) or existing.file_size
+                    existing.content_hash = metadata.get("content_hash") or existing.content_hash
                     session.add(existing)
+                    session.flush()
+                    self._index_book(session, existing, full_text, old_text)
                     session.commit()
                     session.refresh(existing)
-                    return self._book_to_dict(existing)
+                    return self._book_to_dict(existing, self._get_thumbnail(session, existing.id))
                 
                 new_book = Book(
                     title=metadata.get("title", "Unknown Title"),
                     author=metadata.get("author", "Unknown Author"),
                     filename=metadata.get("filename"),
+                    file_size=metadata.get("file_size") or self._get_file_size(metadata.get("filename")),
+                    content_hash=metadata.get("content_hash"),
                     full_text=full_text
                 )
                 session.add(new_book)
+                session.flush()
+                self._index_book(session, new_book, full_text)
                 session.commit()
                 session.refresh(new_book)
+                with self._known_lock:
+                    if self._known_filenames is not None:
+                        self._known_filenames.add(new_book.filename)
                 return self._book_to_dict(new_book)
         except Exception as e:
             print(f"❌ Error adding book to library: {e}")
@@ -127,118 +232,508 @@ class LibraryManager:
             existing = session.exec(statement).first()
             
             summary = analysis_data.get("summary", "")
-            entities = json.dumps(analysis_data.get("entities", []))
-            scenes = json.dumps(analysis_data.get("scenes", []))
             keywords = json.dumps(analysis_data.get("keywords", []))
-            podcast = json.dumps(analysis_data.get("podcast", [])) if analysis_data.get("podcast") else None
             
             if existing:
                 existing.summary = summary
-                existing.entities_json = entities
-                existing.scenes_json = scenes
                 existing.keywords_json = keywords
-                if podcast:
-                    existing.podcast_json = podcast
                 session.add(existing)
             else:
                 new_analysis = Analysis(
                     book_id=book_id,
                     summary=summary,
-                    entities_json=entities,
-                    scenes_json=scenes,
-                    keywords_json=keywords,
-                    podcast_json=podcast
+                    keywords_json=keywords
                 )
                 session.add(new_analysis)
+
+            conn = session.connection()
+            entities = analysis_data.get("entities", []) or []
+            scenes = analysis_data.get("scenes", []) or []
+            replace_rows(conn, Entity, book_id, [entity_row(book_id, i, e) for i, e in enumerate(entities)])
+            replace_rows(conn, Scene, book_id, [scene_row(book_id, i, sc) for i, sc in enumerate(scenes)])
+            if analysis_data.get("podcast"):
+                replace_rows(conn, PodcastSegment, book_id,
+                             [segment_row(book_id, i, seg) for i, seg in enumerate(analysis_data["podcast"])])
+            old_body = session.exec(select(Book.full_text).where(Book.id == book_id)).first() or ""
+            search.index_book(session.connection(), book_id, old_body, **search.analysis_fields(analysis_data))
             session.commit()
 
     def save_podcast(self, book_id: int, playlist: List[Dict]):
         """Save podcast playlist to DB."""
         with Session(engine) as session:
-            statement = select(Analysis).where(Analysis.book_id == book_id)
-            existing = session.exec(statement).first()
-            
-            if existing:
-                existing.podcast_json = json.dumps(playlist)
-                session.add(existing)
-                session.commit()
-            else:
-                # Should not happen if analysis exists, but just in case
-                pass
+            replace_rows(session.connection(), PodcastSegment, book_id,
+                         [segment_row(book_id, i, seg) for i, seg in enumerate(playlist)])
+            session.commit()
 
     def get_analysis(self, book_id: int) -> Optional[Dict]:
         """Get analysis results from DB."""
         with Session(engine) as session:
-            statement = select(Analysis).where(Analysis.book_id == book_id)
+            statement = select(Analysis.summary, Analysis.keywords_json).where(Analysis.book_id == book_id)
             analysis = session.exec(statement).first()
-            if analysis:
-                return {
-                    "summary": analysis.summary,
-                    "entities": json.loads(analysis.entities_json),
-                    "scenes": json.loads(analysis.scenes_json),
-                    "scenes": json.loads(analysis.scenes_json),
-                    "keywords": json.loads(analysis.keywords_json),
-                    "podcast": json.loads(analysis.podcast_json) if analysis.podcast_json else []
-                }
-        return None
+            if not analysis:
+                return None
+            entities = session.exec(
+                select(Entity.data_json).where(Entity.book_id == book_id).order_by(Entity.position)
+            ).all()
+            scenes = session.exec(
+                select(Scene.data_json).where(Scene.book_id == book_id).order_by(Scene.position)
+            ).all()
+            return {
+                "summary": analysis.summary,
+                "entities": [json.loads(e) for e in entities],
+                "scenes": [json.loads(sc) for sc in scenes],
+                "keywords": json.loads(analysis.keywords_json),
+                "podcast": self._get_podcast_segments(session, book_id)
+            }
+
+    def _get_podcast_segments(self, session: Session, book_id: int) -> List[Dict]:
+        statement = select(PodcastSegment).where(PodcastSegment.book_id == book_id).order_by(PodcastSegment.position)
+        return [_segment_to_dict(seg) for seg in session.exec(statement).all()]
+
+    def get_podcast_segments(self, book_id: int) -> List[Dict]:
+        with Session(engine) as session:
+            return self._get_podcast_segments(session, book_id)
+
+    def save_study_pack(self, book_id: int, pack: Dict):
+        """Store (or replace) a book's study pack: quiz, flashcards and suggested questions."""
+        values = {
+            "book_id": book_id,
+            "quiz_json": json.dumps(pack.get("quiz", [])),
+            "flashcards_json": json.dumps(pack.get("flashcards", [])),
+            "questions_json": json.dumps(pack.get("questions", [])),
+            "created_at": datetime.utcnow()
+        }
+        with Session(engine) as session:
+            statement = sqlite_insert(StudyPack).values(values).on_conflict_do_update(
+                index_elements=["book_id"], set_={k: v for k, v in values.items() if k != "book_id"}
+            )
+            session.exec(statement)
+            session.commit()
+
+    def get_study_pack(self, book_id: int) -> Optional[Dict]:
+        with Session(engine) as session:
+            pack = session.exec(select(StudyPack).where(StudyPack.book_id == book_id)).first()
+            if not pack:
+                return None
+            return {
+                "quiz": json.loads(pack.quiz_json),
+                "flashcards": json.loads(pack.flashcards_json),
+                "questions": json.loads(pack.questions_json),
+                "created_at": pack.created_at.timestamp()
+            }
+
+    def update_graph(self, book_id: int, full_text: Optional[str] = None, entities: Optional[List] = None) -> Optional[Dict]:
+        """
+        Recount the relationship graph of a book's changed chapters (see
+        src/graph.py); text and entities default to the stored book and
+        analysis. Returns {"chapters", "recounted"}, or None if the book has
+        no text or entities.
+        """
+        with Session(engine) as session:
+            if full_text is None:
+                full_text = session.exec(select(Book.full_text).where(Book.id == book_id)).first()
+            if entities is None:
+                entities = [json.loads(e) for e in session.exec(
+                    select(Entity.data_json).where(Entity.book_id == book_id).order_by(Entity.position)
+                ).all()]
+            if not full_text or not entities:
+                return None
+
+            known = dict(session.exec(
+                select(GraphChapter.position, GraphChapter.digest).where(GraphChapter.book_id == book_id)
+            ).all())
+            chapters = graph.chapter_graphs(full_text, entities, known)
+            changed = [c["position"] for c in chapters if c["changed"]]
+            stale = changed + [position for position in known if position >= len(chapters)]
+
+            conn = session.connection()
+            if stale:
+                conn.execute(delete(GraphEdge).where(GraphEdge.book_id == book_id, GraphEdge.chapter.in_(stale)))
+                conn.execute(delete(GraphChapter).where(GraphChapter.book_id == book_id, GraphChapter.position.in_(stale)))
+            rows = []
+            for chapter in chapters:
+                if not chapter["changed"]:
+                    continue
+                rows += [{"book_id": book_id, "chapter": chapter["position"], "source": name, "target": name, "weight": n}
+                         for name, n in chapter["mentions"].items()]
+                rows += [{"book_id": book_id, "chapter": chapter["position"], "source": a, "target": b, "weight": n}
+                         for (a, b), n in chapter["edges"].items()]
+            if rows:
+                conn.execute(insert(GraphEdge), rows)
+            if changed:
+                conn.execute(insert(GraphChapter), [
+                    {"book_id": book_id, "position": c["position"], "title": c["title"], "digest": c["digest"]}
+                    for c in chapters if c["changed"]
+                ])
+            session.commit()
+            return {"chapters": len(chapters), "recounted": len(changed)}
+
+    def get_graph(self, book_id: int, chapter: Optional[int] = None, min_weight: int = 1) -> Optional[Dict]:
+        """A book's relationship graph summed over chapters (or one chapter), None if not built."""
+        with Session(engine) as session:
+            titles = session.exec(
+                select(GraphChapter.position, GraphChapter.title)
+                .where(GraphChapter.book_id == book_id).order_by(GraphChapter.position)
+            ).all()
+            if not titles:
+                return None
+            weight = func.sum(GraphEdge.weight)
+            statement = select(GraphEdge.source, GraphEdge.target, weight).where(GraphEdge.book_id == book_id)
+            if chapter is not None:
+                statement = statement.where(GraphEdge.chapter == chapter)
+            rows = session.exec(statement.group_by(GraphEdge.source, GraphEdge.target)).all()
+            return {
+                **graph.graph_payload(rows, min_weight),
+                "chapters": [{"position": position, "title": title} for position, title in titles]
+            }
+
+    def create_qa_session(self, book_id: int) -> str:
+        """Start an empty Q&A conversation about a book. Returns its id."""
+        with Session(engine) as session:
+            qa = QASession(id=uuid.uuid4().hex, book_id=book_id)
+            session.add(qa)
+            session.commit()
+            return qa.id
+
+    def get_qa_session(self, session_id: str) -> Optional[Dict]:
+        with Session(engine) as session:
+            qa = session.get(QASession, session_id)
+            if not qa:
+                return None
+            return {
+                "id": qa.id,
+                "book_id": qa.book_id,
+                "summary": qa.summary,
+                "turns": json.loads(qa.turns_json),
+                "updated_at": qa.updated_at.timestamp()
+            }
+
+    def save_qa_session(self, session_id: str, history: Dict) -> bool:
+        """Store a conversation's summary and turns. False if the session no longer exists."""
+        with Session(engine) as session:
+            qa = session.get(QASession, session_id)
+            if not qa:
+                return False
+            qa.summary = history.get("summary", "")
+            qa.turns_json = json.dumps(history.get("turns", []))
+            qa.updated_at = datetime.utcnow()
+            session.add(qa)
+            session.commit()
+            return True
+
+    def delete_qa_session(self, session_id: str) -> bool:
+        with Session(engine) as session:
+            result = session.exec(delete(QASession).where(QASession.id == session_id))
+            session.commit()
+            return result.rowcount > 0
+
+    def get_entity(self, book_id: int, name: str) -> Optional[object]:
+        """A single entity entry by (case-insensitive) name, as stored in the analysis."""
+        with Session(engine) as session:
+            statement = (
+                select(Entity.data_json)
+                .where(Entity.book_id == book_id, Entity.name_key == name.strip().lower())
+                .order_by(Entity.position)
+            )
+            data = session.exec(statement).first()
+            return json.loads(data) if data else None
+
+    def get_scene(self, book_id: int, index: int) -> Optional[Dict]:
+        """A single scene by its 0-based position."""
+        with Session(engine) as session:
+            statement = select(Scene.data_json).where(Scene.book_id == book_id, Scene.position == index)
+            data = session.exec(statement).first()
+            return json.loads(data) if data else None
+
+    def find_books_with_entity(self, name: str) -> List[Dict]:
+        """Books whose analysis mentions an entity with this name."""
+        with Session(engine) as session:
+            book_ids = select(Entity.book_id).where(Entity.name_key == name.strip().lower())
+            rows = session.exec(
+                _book_summary_query().where(Book.id.in_(book_ids)).order_by(Book.upload_date.desc(), Image.id)
+            ).all()
+        return list(self._rows_to_books(rows).values())
+
+    def _index_book(self, session: Session, book: Book, full_text: str, old_text: str = ""):
+        """
+        Update the book's search row in the current transaction (text columns
+        only if text was given). `old_text` is the text indexed until now.
+        """
+        fields = {"title": book.title, "author": book.author}
+        if full_text:
+            fields.update(body=full_text, chapters=search.chapter_titles(full_text))
+            retrieval.index_chunks(session.connection(), book.id, full_text, old_text)
+        search.index_book(session.connection(), book.id, old_text, **fields)
+
+    def _backfill_search_index(self):
+        """Index books stored before the search table existed."""
+        with Session(engine) as session:
+            missing = session.exec(
+                select(Book.id).where(text(f"book.id NOT IN (SELECT id FROM {search.CONTENT_TABLE})"))
+            ).all()
+            for book_id in missing:
+                book = session.exec(select(Book.title, Book.author, Book.full_text).where(Book.id == book_id)).first()
+                analysis = self.get_analysis(book_id)
+                search.index_book(
+                    session.connection(), book_id,
+                    title=book.title, author=book.author,
+                    body=book.full_text, chapters=search.chapter_titles(book.full_text),
+                    **search.analysis_fields(analysis)
+                )
+            if missing:
+                session.commit()
+                print(f"✅ Indexed {len(missing)} books for search")
+        self._backfill_passages()
+
+    def _backfill_passages(self):
+        """Chunk books stored before the passage index existed."""
+        with Session(engine) as session:
+            conn = session.connection()
+            indexed = 0
+            for book_id in session.exec(select(Book.id)).all():
+                if retrieval.has_chunks(conn, book_id):
+                    continue
+                full_text = session.exec(select(Book.full_text).where(Book.id == book_id)).first()
+                if full_text and retrieval.index_chunks(conn, book_id, full_text):
+                    indexed += 1
+            if indexed:
+                session.commit()
+                print(f"✅ Indexed passages for {indexed} books")
+
+    def retrieve_passages(self, book_id: int, question: str, k: int = retrieval.TOP_K) -> List[str]:
+        """The k passages of a book most relevant to a question, in reading order."""
+        with Session(engine) as session:
+            full_text = session.exec(select(Book.full_text).where(Book.id == book_id)).first()
+            return retrieval.retrieve(session.connection(), book_id, question, full_text, k)
+
+    def search_books(self, query: str, limit: int = 20) -> List[Dict]:
+        """
+        Full-text search over titles, authors, chapter headings, entities,
+        scene descriptions and book text.
+
+        Returns:
+            Book dicts (as in get_books) with "score" and "snippet", best match first
+        """
+        with Session(engine) as session:
+            hits = search.search(session.connection(), query, limit)
+            if not hits:
+                return []
+            ids = [hit["book_id"] for hit in hits]
+            rows = session.exec(_book_summary_query().where(Book.id.in_(ids)).order_by(Image.id)).all()
+            # Body hits are quoted from the book text (the index stores none), for the top few only
+            quoted = [hit for hit in hits[:BODY_SNIPPET_HITS] if "<mark>" not in (hit["snippet"] or "")]
+            if quoted:
+                bodies = dict(session.exec(
+                    select(Book.id, Book.full_text).where(Book.id.in_([hit["book_id"] for hit in quoted]))
+                ).all())
+                for hit in quoted:
+                    hit["snippet"] = search.body_snippet(bodies.get(hit["book_id"]), query) or hit["snippet"]
+
+        books = self._rows_to_books(rows)
+        return [
+            {**books[hit["book_id"]], "score": hit["score"], "snippet": hit["snippet"]}
+            for hit in hits if hit["book_id"] in books
+        ]
 
     def get_books(self) -> List[Dict]:
         """Get all books sorted by date (newest first)."""
         try:
-            self.scan_and_backfill() # Ensure sync
-            
             with Session(engine) as session:
-                statement = select(Book).order_by(Book.upload_date.desc())
-                books = session.exec(statement).all()
-                return [self._book_to_dict(b, session) for b in books]
+                statement = _book_summary_query().order_by(Book.upload_date.desc(), Image.id)
+                rows = session.exec(statement).all()
+            return list(self._rows_to_books(rows).values())
         except Exception as e:
             print(f"⚠️ Error fetching library: {e}")
             return []
 
     def delete_book(self, book_id: int) -> bool:
         """Delete a book by ID."""
+        return bool(self.delete_books([book_id]))
+
+    def delete_books(self, book_ids: List[int]) -> List[int]:
+        """
+        Delete several books and all their rows in one transaction.
+        Generated assets are left for collect_garbage, which removes those
+        no other book references.
+
+        Returns:
+            IDs that existed and were deleted
+        """
         with Session(engine) as session:
-            book = session.get(Book, book_id)
-            if not book:
-                return False
-            
-            # Delete file
-            file_path = os.path.join(self.upload_dir, book.filename)
+            rows = session.exec(select(Book.id, Book.filename).where(Book.id.in_(book_ids))).all()
+            found = [row.id for row in rows]
+            if not found:
+                return []
+
+            bodies = dict(session.exec(select(Book.id, Book.full_text).where(Book.id.in_(found))).all())
+            for model in BOOK_CHILD_TABLES:
+                session.exec(delete(model).where(model.book_id.in_(found)))
+            search.remove_books(session.connection(), bodies)
+            retrieval.remove_chunks(session.connection(), bodies)
+            session.exec(delete(Book).where(Book.id.in_(found)))
+            session.commit()
+
+        for row in rows:
+            file_path = os.path.join(self.upload_dir, row.filename)
             if os.path.exists(file_path):
                 try:
                     os.remove(file_path)
                     print(f"Deleted file: {file_path}")
                 except Exception as e:
                     print(f"Error deleting file {file_path}: {e}")
-            
-            # Cascade delete is handled by SQLModel/SQLAlchemy if configured, 
-            # but explicit delete is safer for now without cascade setup
-            statement = select(Analysis).where(Analysis.book_id == book_id)
-            analysis = session.exec(statement).first()
-            if analysis:
-                session.delete(analysis)
-                
-            # Delete images
-            statement = select(Image).where(Image.book_id == book_id)
-            images = session.exec(statement).all()
-            for img in images:
-                session.delete(img)
-                
-            session.delete(book)
+            with self._known_lock:
+                if self._known_filenames is not None:
+                    self._known_filenames.discard(row.filename)
+        return found
+
+    def _asset_path(self, path: str) -> Optional[str]:
+        """Normalize a file path or /api/assets URL to a path relative to the upload dir."""
+        if not path:
+            return None
+        path = path.split("?", 1)[0]
+        if path.startswith(ASSET_URL_PREFIX):
+            path = path[len(ASSET_URL_PREFIX):]
+        elif os.path.isabs(path):
+            path = os.path.relpath(path, self.upload_dir)
+        path = os.path.normpath(path).replace(os.sep, "/")
+        if path.startswith("..") or path in (".", ""):
+            return None
+        return path
+
+    def register_assets(self, book_id: int, paths: List[str], session: Session = None) -> int:
+        """
+        Record generated files (or directories) as referenced by a book.
+        Paths may be absolute, relative to the upload dir, or /api/assets URLs.
+        """
+        relative = sorted({p for p in (self._asset_path(path) for path in paths) if p})
+        if not relative:
+            return 0
+        if session is None:
+            with Session(engine) as session:
+                count = self.register_assets(book_id, relative, session)
+                session.commit()
+                return count
+
+        now = datetime.utcnow()
+        session.exec(sqlite_insert(Asset).values([{"path": p, "created_at": now} for p in relative])
+                     .on_conflict_do_nothing(index_elements=["path"]))
+        asset_ids = session.exec(select(Asset.id).where(Asset.path.in_(relative))).all()
+        session.exec(sqlite_insert(AssetRef).values([{"asset_id": a, "book_id": book_id} for a in asset_ids])
+                     .on_conflict_do_nothing())
+        return len(asset_ids)
+
+    def release_assets(self, book_id: int, paths: List[str]) -> int:
+        """Drop a book's references to generated files; unreferenced ones are left for collect_garbage."""
+        relative = sorted({p for p in (self._asset_path(path) for path in paths) if p})
+        if not relative:
+            return 0
+        with Session(engine) as session:
+            result = session.exec(delete(AssetRef).where(
+                AssetRef.book_id == book_id,
+                AssetRef.asset_id.in_(select(Asset.id).where(Asset.path.in_(relative)))
+            ))
             session.commit()
-            return True
+            return result.rowcount
+
+    def _disk_size(self, path: str) -> int:
+        if os.path.isdir(path):
+            return sum(
+                os.path.getsize(os.path.join(root, name))
+                for root, _, files in os.walk(path) for name in files
+            )
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def collect_garbage(self, dry_run: bool = False) -> Dict:
+        """
+        Remove assets no book references any more (reference count zero).
+
+        Rows are deleted first, in one transaction, so an asset re-registered
+        concurrently keeps its file; the files are removed afterwards.
+        """
+        orphaned = ~Asset.id.in_(select(AssetRef.asset_id))
+        with Session(engine) as session:
+            if dry_run:
+                paths = session.exec(select(Asset.path).where(orphaned)).all()
+            else:
+                paths = session.exec(delete(Asset).where(orphaned).returning(Asset.path)).scalars().all()
+                session.commit()
+
+        freed = 0
+        for rel_path in paths:
+            full_path = os.path.join(self.upload_dir, rel_path)
+            size = self._disk_size(full_path)
+            freed += size
+            if dry_run or not os.path.exists(full_path):
+                continue
+            try:
+                if os.path.isdir(full_path):
+                    shutil.rmtree(full_path)
+                else:
+                    os.remove(full_path)
+            except Exception as e:
+                print(f"⚠️ Could not remove asset {rel_path}: {e}")
+                freed -= size
+
+        verb = "Would reclaim" if dry_run else "Reclaimed"
+        print(f"🧹 {verb} {len(paths)} unreferenced assets ({freed / 1024 / 1024:.1f} MB)")
+        return {"assets": len(paths), "bytes": freed, "dry_run": dry_run}
+
+    def disk_usage(self) -> Dict:
+        """
+        Bytes used under the upload dir, split by top-level directory and by
+        ownership: book files, referenced assets, unreferenced assets (GC will
+        reclaim) and untracked files (created before asset tracking or outside it).
+        """
+        with Session(engine) as session:
+            book_files = set(session.exec(select(Book.filename)).all())
+            all_assets = set(session.exec(select(Asset.path)).all())
+            referenced = set(session.exec(select(Asset.path).where(Asset.id.in_(select(AssetRef.asset_id)))).all())
+
+        def owner(rel_path: str) -> Optional[str]:
+            # Match the file itself or any registered parent directory
+            parts = rel_path.split("/")
+            for i in range(len(parts), 0, -1):
+                candidate = "/".join(parts[:i])
+                if candidate in all_assets:
+                    return candidate
+            return None
+
+        usage = {"total": 0, "books": 0, "referenced": 0, "unreferenced": 0, "untracked": 0, "by_directory": {}}
+        for root, _, files in os.walk(self.upload_dir):
+            for name in files:
+                full_path = os.path.join(root, name)
+                try:
+                    size = os.path.getsize(full_path)
+                except OSError:
+                    continue
+                rel_path = os.path.relpath(full_path, self.upload_dir).replace(os.sep, "/")
+                top = rel_path.split("/", 1)[0] if "/" in rel_path else "."
+                usage["by_directory"][top] = usage["by_directory"].get(top, 0) + size
+                usage["total"] += size
+
+                asset = owner(rel_path)
+                if rel_path in book_files:
+                    usage["books"] += size
+                elif asset is None:
+                    usage["untracked"] += size
+                elif asset in referenced:
+                    usage["referenced"] += size
+                else:
+                    usage["unreferenced"] += size
+        return usage
 
     def get_book(self, book_id: int) -> Optional[Dict]:
         """Get a single book by ID."""
         with Session(engine) as session:
-            book = session.get(Book, book_id)
-            return self._book_to_dict(book, session) if book else None
+            statement = _book_summary_query().where(Book.id == book_id).order_by(Image.id)
+            row = session.exec(statement).first()
+            return self._book_to_dict(row, row.thumbnail) if row else None
 
     def get_book_full_text(self, book_id: int) -> Optional[str]:
         """Get the full text of a book."""
         with Session(engine) as session:
-            book = session.get(Book, book_id)
-            return book.full_text if book else None
+            statement = select(Book.full_text).where(Book.id == book_id)
+            return session.exec(statement).first()
 
     def update_book_thumbnail(self, book_id: int, thumbnail_path: str) -> bool:
         """Update the thumbnail path for a book."""
@@ -253,63 +748,161 @@ class LibraryManager:
             else:
                 img = Image(book_id=book_id, type="cover", path=thumbnail_path)
                 session.add(img)
+            self.register_assets(book_id, [thumbnail_path], session)
             session.commit()
             return True
 
-    def _book_to_dict(self, book: Book, session: Session = None) -> Dict:
-        """Convert Book model to dictionary for API."""
-        # Get thumbnail
-        thumbnail = None
-        if session:
-            # Use relationship if loaded, or query
-            # Since we didn't eager load, query is safer
-            statement = select(Image).where(Image.book_id == book.id).where(Image.type == "cover")
-            img = session.exec(statement).first()
-            if img:
-                thumbnail = img.path
-        
+    def _get_thumbnail(self, session: Session, book_id: int) -> Optional[str]:
+        statement = select(Image.path).where(Image.book_id == book_id).where(Image.type == "cover")
+        return session.exec(statement).first()
+
+    def _rows_to_books(self, rows) -> Dict[int, Dict]:
+        """Book dicts keyed by id from _book_summary_query rows, in row order."""
+        books = {}
+        for row in rows:
+            # Keep the first cover if a book somehow has several
+            if row.id not in books:
+                books[row.id] = self._book_to_dict(row, row.thumbnail)
+        return books
+
+    def _book_to_dict(self, book, thumbnail: Optional[str] = None) -> Dict:
+        """Convert a Book model or summary row to dictionary for API."""
         return {
             "id": book.id, # Int ID now
             "title": book.title,
             "author": book.author,
             "filename": book.filename,
             "upload_date": book.upload_date.timestamp(),
-            "file_size": self._get_file_size(book.filename),
+            "file_size": book.file_size or 0,
             "thumbnail": thumbnail
         }
 
-    def scan_and_backfill(self):
+    def scan_and_backfill(self, force: bool = False):
         """
         Scan upload directory for files not in library and add them.
+        Skipped when the directory mtime is unchanged since the last scan.
         """
         if not os.path.exists(self.upload_dir):
             return
 
+        mtime = os.stat(self.upload_dir).st_mtime_ns
+        if not force and mtime == self._upload_dir_mtime:
+            return
+        self._upload_dir_mtime = mtime
+
+        self.add_files(os.listdir(self.upload_dir))
+
+    def add_files(self, filenames: List[str]) -> int:
+        """Insert books for any of the given upload-dir filenames not yet in the library."""
+        # Held throughout so concurrent scans never insert or record the same files twice
+        with self._known_lock:
+            return self._add_files(filenames)
+
+    def _add_files(self, filenames: List[str]) -> int:
+        if self._known_filenames is None:
+            with Session(engine) as session:
+                self._known_filenames = set(session.exec(select(Book.filename)).all())
+
+        new_files = []
+        for filename in filenames:
+            ext = os.path.splitext(filename)[1].lower()
+            if (ext in ALLOWED_EXTENSIONS
+                    and filename not in self._known_filenames
+                    and os.path.isfile(os.path.join(self.upload_dir, filename))):
+                new_files.append(filename)
+
+        if not new_files:
+            return 0
+
+        rows = []
+        for filename in new_files:
+            print(f"Found unlisted book: {filename}")
+            rows.append({
+                "title": filename,
+                "author": "Unknown",
+                "filename": filename,
+                "file_size": self._get_file_size(filename),
+                "upload_date": datetime.utcnow(),
+                "full_text": ""
+            })
         with Session(engine) as session:
-            existing_filenames = {b.filename for b in session.exec(select(Book)).all()}
-            
-            ALLOWED_EXTENSIONS = {".pdf", ".epub", ".txt"}
-            
-            count = 0
-            for filename in os.listdir(self.upload_dir):
-                file_path = os.path.join(self.upload_dir, filename)
-                if os.path.isfile(file_path):
-                    ext = os.path.splitext(filename)[1].lower()
-                    if ext in ALLOWED_EXTENSIONS and filename not in existing_filenames:
-                        # Found a new file!
-                        print(f"Found unlisted book: {filename}")
-                        new_book = Book(
-                            title=filename,
-                            author="Unknown",
-                            filename=filename,
-                            full_text=""
-                        )
-                        session.add(new_book)
-                        count += 1
-            
-            if count > 0:
+            # An upload may have claimed the filename in the meantime
+            statement = sqlite_insert(Book).values(rows).on_conflict_do_nothing(index_elements=["filename"])
+            session.exec(statement)
+            session.commit()
+        self._known_filenames.update(new_files)
+        print(f"✅ Backfilled {len(new_files)} books into library")
+        return len(new_files)
+
+    def forget_files(self, filenames: List[str]) -> List[int]:
+        """
+        Remove books for deleted upload-dir files that were only backfilled
+        (never ingested). Ingested books keep their text and analysis.
+        """
+        with Session(engine) as session:
+            rows = session.exec(
+                select(Book.id, Book.filename).where(Book.filename.in_(filenames), Book.full_text == "")
+            ).all()
+        gone = [row.id for row in rows if not os.path.exists(os.path.join(self.upload_dir, row.filename))]
+        if gone:
+            print(f"🗑️ Removing {len(gone)} unlisted books whose files were deleted")
+        return self.delete_books(gone) if gone else []
+
+    async def watch_upload_dir(self):
+        """
+        Keep the library in sync with the upload directory, off the request path.
+        Uses inotify (via watchfiles) when available, otherwise polls the directory mtime.
+        """
+        try:
+            from watchfiles import awatch, Change
+        except ImportError:
+            print(f"👀 watchfiles not installed, polling {self.upload_dir} every {WATCH_POLL_SECONDS:.0f}s")
+            while True:
+                await asyncio.sleep(WATCH_POLL_SECONDS)
+                try:
+                    await asyncio.to_thread(self.scan_and_backfill)
+                except Exception as e:
+                    print(f"⚠️ Library scan failed: {e}")
+
+        upload_dir = os.path.abspath(self.upload_dir)
+        print(f"👀 Watching {upload_dir} for new books")
+        async for changes in awatch(upload_dir, recursive=False):
+            changes = [(change, os.path.basename(path)) for change, path in changes if os.path.dirname(path) == upload_dir]
+            added = [name for change, name in changes if change != Change.deleted]
+            deleted = [name for change, name in changes if change == Change.deleted]
+            try:
+                if deleted:
+                    await asyncio.to_thread(self.forget_files, deleted)
+                if added:
+                    await asyncio.to_thread(self.add_files, added)
+            except Exception as e:
+                print(f"⚠️ Library sync failed: {e}")
+
+    def find_book_by_hash(self, content_hash: str) -> Optional[Dict]:
+        """The book whose uploaded file has this sha256, if any."""
+        with Session(engine) as session:
+            statement = _book_summary_query().where(Book.content_hash == content_hash).order_by(Book.id, Image.id)
+            row = session.exec(statement).first()
+            return self._book_to_dict(row, row.thumbnail) if row else None
+
+    def backfill_content_hashes(self) -> int:
+        """Hash uploaded files of books stored before content_hash existed."""
+        with Session(engine) as session:
+            rows = session.exec(select(Book.id, Book.filename).where(Book.content_hash.is_(None))).all()
+            updated = 0
+            for book_id, filename in rows:
+                path = os.path.join(self.upload_dir, filename)
+                if not os.path.isfile(path):
+                    continue
+                session.exec(
+                    text("UPDATE book SET content_hash = :hash WHERE id = :id"),
+                    params={"hash": file_sha256(path), "id": book_id}
+                )
+                updated += 1
+            if updated:
                 session.commit()
-                print(f"✅ Backfilled {count} books into library")
+                print(f"✅ Hashed {updated} library files")
+            return updated
 
     def _get_file_size(self, filename: str) -> int:
         if not filename: return 0
@@ -317,3 +910,32 @@ class LibraryManager:
             return os.path.getsize(os.path.join(self.upload_dir, filename))
         except:
             return 0
+
+
+class AsyncLibraryManager:
+    """
+    Async facade over LibraryManager for FastAPI handlers.
+
+    Each method call runs on a dedicated thread pool, so DB round-trips never
+    block the event loop (and don't compete with the default to_thread pool
+    used for image/TTS work). The API mirrors LibraryManager with awaitables:
+
+        books = await library_manager.get_books()
+    """
+    def __init__(self, manager: LibraryManager, max_workers: int = DB_THREADS):
+        self.sync = manager
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="library-db")
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if not callable(attr) or asyncio.iscoroutinefunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+        return call
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,119 @@
+import os
+import json
+import asyncio
+from array import array
+from typing import List, Dict, Optional
+
+# ffmpeg/ffprobe are installed in the Docker image; override for local setups
+FFMPEG_BIN = os.getenv("FFMPEG_PATH", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_PATH", "ffprobe")
+
+# Sample rate used when decoding audio for waveform peaks
+PEAKS_SAMPLE_RATE = 8000
+
+async def run_ffmpeg(args: List[str], binary: str = FFMPEG_BIN) -> bytes:
+    """
+    Runs ffmpeg (or ffprobe) as a subprocess without blocking the event loop.
+
+    Returns:
+        Captured stdout bytes. Raises on a non-zero exit code.
+    """
+    process = await asyncio.create_subprocess_exec(
+        binary, "-hide_banner", "-nostdin", *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        error_tail = stderr.decode("utf-8", errors="replace")[-500:]
+        raise Exception(f"{os.path.basename(binary)} exited with {process.returncode}: {error_tail}")
+    return stdout
+
+async def probe_duration(path: str) -> float:
+    """Returns the duration of an audio file in seconds."""
+    output = await run_ffmpeg([
+        "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        path
+    ], binary=FFPROBE_BIN)
+    return float(output.decode().strip() or 0.0)
+
+def _escape_ffmetadata(value: str) -> str:
+    """Escape special characters for the FFMETADATA1 format."""
+    for char in ("\\", "=", ";", "#", "\n"):
+        value = value.replace(char, "\\" + char)
+    return value
+
+def write_ffmetadata(path: str, chapters: List[Dict], title: Optional[str] = None, artist: Optional[str] = None) -> str:
+    """
+    Writes an FFMETADATA1 file with chapter markers.
+
+    Args:
+        path: Destination metadata file
+        chapters: List of {"title", "start", "end"} with times in seconds
+        title: Optional album/episode title
+        artist: Optional artist/author
+    """
+    lines = [";FFMETADATA1"]
+    if title:
+        lines.append(f"title={_escape_ffmetadata(title)}")
+        lines.append(f"album={_escape_ffmetadata(title)}")
+    if artist:
+        lines.append(f"artist={_escape_ffmetadata(artist)}")
+
+    for chapter in chapters:
+        lines.extend([
+            "",
+            "[CHAPTER]",
+            "TIMEBASE=1/1000",
+            f"START={int(chapter['start'] * 1000)}",
+            f"END={int(chapter['end'] * 1000)}",
+            f"title={_escape_ffmetadata(chapter['title'])}"
+        ])
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+def codec_args(fmt: str) -> List[str]:
+    """Encoder arguments for an output container ("mp3", "m4a" or "m4b")."""
+    if fmt in ("m4a", "m4b"):
+        # faststart moves the index to the front so players can seek with range requests
+        return ["-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart", "-f", "mp4"]
+    return ["-c:a", "libmp3lame", "-b:a", "128k", "-id3v2_version", "3", "-f", "mp3"]
+
+async def compute_peaks(path: str, points_per_second: int = 10) -> Dict:
+    """
+    Decodes audio to low-rate mono PCM and returns normalized waveform peaks.
+
+    Returns:
+        {"duration": seconds, "points_per_second": n, "peaks": [0.0-1.0, ...]}
+    """
+    raw = await run_ffmpeg([
+        "-v", "error", "-i", path,
+        "-ac", "1", "-ar", str(PEAKS_SAMPLE_RATE),
+        "-f", "s16le", "-"
+    ])
+    samples = array("h")
+    samples.frombytes(raw[:len(raw) - (len(raw) % 2)])
+
+    bucket = max(1, PEAKS_SAMPLE_RATE // points_per_second)
+    peaks = []
+    for start in range(0, len(samples), bucket):
+        window = samples[start:start + bucket]
+        peaks.append(max(max(window), -min(window)) / 32768)
+
+    return {
+        "duration": len(samples) / PEAKS_SAMPLE_RATE,
+        "points_per_second": points_per_second,
+        "peaks": [round(p, 3) for p in peaks]
+    }
+
+def write_json_atomic(path: str, data) -> str:
+    """Write JSON to a temp file and rename it into place."""
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,177 @@
+from typing import Callable, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel
+from src.search import CREATE_SEARCH_TABLES
+from src.retrieval import CREATE_PASSAGE_TABLES
+from src.database import compress_text, decompress_text, COMPRESS_MIN_BYTES
+
+# Schema versions are tracked in SQLite's PRAGMA user_version.
+# Append new migrations here; never edit or reorder applied ones.
+
+def _columns(conn, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(text(f"PRAGMA table_info({table})")).all()]
+
+def _add_column(conn, table: str, column: str, ddl: str):
+    if column not in _columns(conn, table):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def _add_podcast_json(conn):
+    _add_column(conn, "analysis", "podcast_json", "VARCHAR")
+
+def _add_book_file_size(conn):
+    # Sizes for existing rows are backfilled from disk by LibraryManager
+    _add_column(conn, "book", "file_size", "INTEGER NOT NULL DEFAULT 0")
+
+def _add_indexes(conn):
+    """
+    Unique analysis-per-book and filename indexes, plus lookup indexes.
+
+    Older versions could store several analyses for one book. Before the
+    unique index is created, every book keeps only its newest analysis,
+    the row with the highest id (analysis has no timestamp, and ids
+    increase with insertion), and the others are deleted. The number of
+    dropped rows per book is logged.
+    """
+    duplicates = conn.execute(text(
+        "SELECT book_id, COUNT(*) - 1 FROM analysis GROUP BY book_id HAVING COUNT(*) > 1 ORDER BY book_id"
+    )).all()
+    for book_id, dropped in duplicates:
+        print(f"⚠️ Book {book_id}: dropping {dropped} older duplicate analysis row(s), keeping the newest")
+    conn.execute(text(
+        "DELETE FROM analysis WHERE id NOT IN (SELECT MAX(id) FROM analysis GROUP BY book_id)"
+    ))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_analysis_book_id ON analysis (book_id)"))
+    try:
+        with conn.begin_nested():
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_book_filename ON book (filename)"))
+    except IntegrityError:
+        print("⚠️ Duplicate filenames in library, book.filename index created without UNIQUE")
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_book_filename ON book (filename)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_book_upload_date ON book (upload_date)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_image_book_id_type ON image (book_id, type)"))
+
+def _add_search_index(conn):
+    # Rows are filled by LibraryManager (backfill on startup, then add_book/save_analysis)
+    for statement in CREATE_SEARCH_TABLES:
+        conn.execute(text(statement))
+
+# Compressed columns; rows are rewritten in batches to bound memory
+COMPRESSED_COLUMNS = {
+    "book": ("full_text",),
+    "analysis": ("entities_json", "scenes_json", "keywords_json", "podcast_json"),
+}
+COMPRESS_BATCH = 50
+
+def _compress_columns(conn):
+    for table, columns in COMPRESSED_COLUMNS.items():
+        for column in columns:
+            last_id = 0
+            while True:
+                rows = conn.execute(text(
+                    f"SELECT id, {column} FROM {table} WHERE id > :last AND typeof({column}) = 'text' "
+                    f"AND length(CAST({column} AS BLOB)) >= :min ORDER BY id LIMIT :batch"
+                ), {"last": last_id, "min": COMPRESS_MIN_BYTES, "batch": COMPRESS_BATCH}).all()
+                if not rows:
+                    break
+                for row_id, value in rows:
+                    conn.execute(
+                        text(f"UPDATE {table} SET {column} = :value WHERE id = :id"),
+                        {"value": compress_text(value), "id": row_id}
+                    )
+                last_id = rows[-1][0]
+    # Freed pages are reused by later writes; run VACUUM manually to shrink the file
+
+def _normalize_analysis(conn):
+    # Tables come from create_all; move each book's JSON lists into them
+    import json
+    from src.database import Entity, Scene, PodcastSegment
+    from src.library import entity_row, scene_row, segment_row, replace_rows
+
+    rows = conn.execute(text("SELECT id, book_id FROM analysis")).all()
+    for analysis_id, book_id in rows:
+        entities, scenes, podcast = conn.execute(
+            text("SELECT entities_json, scenes_json, podcast_json FROM analysis WHERE id = :id"), {"id": analysis_id}
+        ).first()
+        entities = json.loads(decompress_text(entities) or "[]")
+        scenes = json.loads(decompress_text(scenes) or "[]")
+        podcast = json.loads(decompress_text(podcast) or "[]") if podcast else []
+        replace_rows(conn, Entity, book_id, [entity_row(book_id, i, e) for i, e in enumerate(entities)])
+        replace_rows(conn, Scene, book_id, [scene_row(book_id, i, s) for i, s in enumerate(scenes)])
+        if podcast:
+            replace_rows(conn, PodcastSegment, book_id, [segment_row(book_id, i, s) for i, s in enumerate(podcast)])
+        conn.execute(text(
+            "UPDATE analysis SET entities_json = '[]', scenes_json = '[]', podcast_json = NULL WHERE id = :id"
+        ), {"id": analysis_id})
+
+def _track_existing_assets(conn):
+    # Covers and podcast segments are the only generated files older versions recorded
+    conn.execute(text("INSERT OR IGNORE INTO asset (path, created_at) SELECT DISTINCT path, CURRENT_TIMESTAMP FROM image"))
+    conn.execute(text(
+        "INSERT OR IGNORE INTO asset_ref (asset_id, book_id) "
+        "SELECT asset.id, image.book_id FROM image JOIN asset ON asset.path = image.path"
+    ))
+    podcast_path = "substr(url, length('/api/assets/') + 1)"
+    conn.execute(text(
+        f"INSERT OR IGNORE INTO asset (path, created_at) SELECT DISTINCT {podcast_path}, CURRENT_TIMESTAMP "
+        "FROM podcast_segment WHERE url LIKE '/api/assets/%'"
+    ))
+    conn.execute(text(
+        "INSERT OR IGNORE INTO asset_ref (asset_id, book_id) "
+        f"SELECT asset.id, podcast_segment.book_id FROM podcast_segment JOIN asset ON asset.path = {podcast_path} "
+        "WHERE url LIKE '/api/assets/%'"
+    ))
+
+def _add_book_content_hash(conn):
+    # Hashes for existing books are filled lazily by LibraryManager.backfill_content_hashes
+    _add_column(conn, "book", "content_hash", "VARCHAR")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_book_content_hash ON book (content_hash)"))
+
+def _add_passage_index(conn):
+    # Filled by LibraryManager (passage backfill on startup, then add_book)
+    for statement in CREATE_PASSAGE_TABLES:
+        conn.execute(text(statement))
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "add analysis.podcast_json", _add_podcast_json),
+    (2, "add book.file_size", _add_book_file_size),
+    (3, "add library indexes and unique constraints", _add_indexes),
+    (4, "add full-text search index", _add_search_index),
+    (5, "compress book text and analysis JSON", _compress_columns),
+    (6, "move entities, scenes and podcast segments into tables", _normalize_analysis),
+    (7, "track generated assets per book", _track_existing_assets),
+    (8, "add book.content_hash", _add_book_content_hash),
+    (9, "add passage index for question answering", _add_passage_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn) -> int:
+    return conn.execute(text("PRAGMA user_version")).scalar() or 0
+
+def run_migrations(engine) -> int:
+    """
+    Bring the database schema up to LATEST_VERSION.
+
+    Missing tables are created from the models, then each pending migration
+    runs in its own transaction. Migrations are idempotent, so a fresh
+    database simply runs them all (they only add what create_all can't,
+    such as indexes on pre-existing tables and the FTS5 table).
+
+    Returns:
+        The schema version after migrating
+    """
+    with engine.begin() as conn:
+        SQLModel.metadata.create_all(conn)
+        version = get_schema_version(conn)
+
+    for target, description, migrate in MIGRATIONS:
+        if target <= version:
+            continue
+        print(f"🔄 Applying schema migration {target}: {description}...")
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(text(f"PRAGMA user_version = {target}"))
+        version = target
+        print(f"✅ Schema at version {version}.")
+    return version
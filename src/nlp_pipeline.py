@@ -0,0 +1,126 @@
+"""
+Offline spaCy stage shared by the quiz, flashcard and entity fallbacks.
+
+A book is parsed once: its text is split into blocks that go through
+`nlp.pipe` in batches, with only the components a task needs loaded. The
+result is kept for the most recent books as plain sentence records, so
+later callers pick sentences and tokens without parsing anything again.
+
+Parsing runs in-process by default, which is what the server wants (it
+calls parse_book from worker threads). Command-line tools can opt into
+spaCy worker processes for long books with set_pipe_processes().
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from src.retrieval import chunk_text
+from src.embeddings import text_key
+
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+
+# Components of the en_core_web_* pipelines; anything a task doesn't list is
+# excluded at load time instead of being run and thrown away
+MODEL_COMPONENTS = ("tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer", "ner")
+TAG_COMPONENTS = ("tok2vec", "tagger", "attribute_ruler", "senter")  # Sentences + POS (quizzes, flashcards)
+NER_COMPONENTS = ("tok2vec", "ner", "senter")  # Sentences + named entities (offline analysis)
+
+PIPE_BLOCK_CHARS = 5000         # Text per Doc; many small Docs batch and parallelize well
+PIPE_BATCH_SIZE = 32            # Docs per nlp.pipe batch
+PIPE_PROCESSES = 1              # Raised by set_pipe_processes() outside the server
+MULTIPROCESS_MIN_BLOCKS = 64    # Below this (~300k chars) worker start-up costs more than it saves
+# Sentence records take many times the size of the text; the budget holds
+# about two novels, and the most recent parse is always kept
+PARSE_CACHE_CHARS = int(os.getenv("PARSE_CACHE_CHARS", 2_000_000))
+
+_pipelines = {}
+_parse_cache = OrderedDict()  # (text key, components) -> (text length, sentence records)
+_parse_locks = {}  # Keys being parsed
+_lock = threading.Lock()
+
+def set_pipe_processes(processes: int):
+    """Worker processes for long books; only for CLI tools, never from the server."""
+    global PIPE_PROCESSES
+    PIPE_PROCESSES = max(1, processes)
+
+def load_pipeline(components: Sequence[str] = TAG_COMPONENTS):
+    """
+    The spaCy model with only `components` loaded (cached per component set),
+    or None if spaCy or the model is unavailable.
+    """
+    key = tuple(components)
+    with _lock:
+        if key not in _pipelines:
+            try:
+                import spacy
+                nlp = spacy.load(SPACY_MODEL, exclude=[name for name in MODEL_COMPONENTS if name not in key])
+                for name in list(nlp.disabled):
+                    if name in key:
+                        nlp.enable_pipe(name)
+                if not nlp.has_pipe("senter") and not nlp.has_pipe("parser"):
+                    nlp.add_pipe("sentencizer")
+            except Exception as e:
+                print(f"Warning: Spacy load failed: {e}")
+                print(f"Install with: python -m spacy download {SPACY_MODEL}")
+                nlp = None
+            _pipelines[key] = nlp
+        return _pipelines[key]
+
+def _sentence_records(doc, with_entities: bool) -> List[Dict]:
+    records = []
+    for sent in doc.sents:
+        text = sent.text.strip()
+        if not text:
+            continue
+        record = {"text": text, "tokens": [(token.text, token.pos_, token.is_stop) for token in sent]}
+        if with_entities:
+            record["ents"] = [(ent.text, ent.label_) for ent in sent.ents]
+        records.append(record)
+    return records
+
+def parse_book(text: str, components: Sequence[str] = TAG_COMPONENTS) -> Optional[List[Dict]]:
+    """
+    Sentence records for a whole book, parsed once per (text, components).
+
+    Returns:
+        [{"text", "tokens": [(text, pos, is_stop)], "ents": [(text, label)]}]
+        in reading order ("ents" only when "ner" is among the components),
+        or None if spaCy is unavailable.
+    """
+    key = (text_key(text), tuple(components))
+    with _lock:
+        if key in _parse_cache:
+            _parse_cache.move_to_end(key)
+            return _parse_cache[key][1]
+        book_lock = _parse_locks.setdefault(key, threading.Lock())
+
+    # Concurrent callers (quiz and flashcards of one study pack) share one parse
+    with book_lock:
+        try:
+            with _lock:
+                if key in _parse_cache:
+                    return _parse_cache[key][1]
+            return _parse(text, key, components)
+        finally:
+            with _lock:
+                _parse_locks.pop(key, None)
+
+def _parse(text: str, key, components: Sequence[str]) -> Optional[List[Dict]]:
+    nlp = load_pipeline(components)
+    if nlp is None:
+        return None
+
+    blocks = chunk_text(text, PIPE_BLOCK_CHARS, 0)
+    n_process = PIPE_PROCESSES if len(blocks) >= MULTIPROCESS_MIN_BLOCKS else 1
+    with_entities = "ner" in components
+    print(f"🔤 spaCy: parsing {len(blocks)} blocks ({n_process} process{'es' if n_process > 1 else ''})")
+    sentences = []
+    for doc in nlp.pipe(blocks, batch_size=PIPE_BATCH_SIZE, n_process=n_process):
+        sentences.extend(_sentence_records(doc, with_entities))
+
+    with _lock:
+        _parse_cache[key] = (len(text), sentences)
+        while len(_parse_cache) > 1 and sum(size for size, _ in _parse_cache.values()) > PARSE_CACHE_CHARS:
+            _parse_cache.popitem(last=False)
+    return sentences
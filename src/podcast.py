@@ -7,6 +7,7 @@ from dataclasses import dataclass
 from openai import AsyncOpenAI
 from src.config import OPENROUTER_API_KEY
 from src.audio import generate_audio
+from src.media import run_ffmpeg, probe_duration, write_ffmetadata, codec_args, compute_peaks, write_json_atomic
 from src.prompts import PODCAST_PROMPT
 
 @dataclass
@@ -416,6 +417,126 @@ class PodcastGenerator:
         return successful_files
 
 
+async def assemble_episode(
+    playlist: List[Dict],
+    segment_dir: str,
+    output_path: str,
+    gap_ms: int = 250,
+    crossfade_ms: int = 0,
+    title: str = "Booked and Busy"
+) -> Dict:
+    """
+    Merge podcast segments into a single episode file with chapter markers.
+
+    Args:
+        playlist: Segments with speaker, text and url (as returned by /api/generate/podcast)
+        segment_dir: Directory containing the segment MP3s
+        output_path: Episode path; ".m4a" produces AAC, anything else MP3
+        gap_ms: Silence inserted between segments (ignored when crossfading)
+        crossfade_ms: Crossfade length between segments; 0 uses gaps instead
+        title: Episode title written to the file metadata
+
+    Returns:
+        Dict with duration, segment offset table and the peaks JSON path
+    """
+    fmt = "m4a" if output_path.endswith((".m4a", ".m4b")) else "mp3"
+
+    segments = []
+    for seg in playlist:
+        path = os.path.join(segment_dir, os.path.basename(seg.get("url", "")))
+        if os.path.exists(path):
+            segments.append((seg, path))
+    if not segments:
+        raise ValueError("No podcast segments found to assemble")
+
+    durations = await asyncio.gather(*(probe_duration(path) for _, path in segments))
+
+    # Crossfades overlap neighbours; gaps push them apart
+    crossfade = crossfade_ms / 1000 if len(segments) > 1 else 0
+    gap = 0 if crossfade else gap_ms / 1000
+
+    offsets = []
+    cursor = 0.0
+    for i, ((seg, path), duration) in enumerate(zip(segments, durations)):
+        offsets.append({
+            "index": i,
+            "speaker": seg.get("speaker"),
+            "text": seg.get("text", ""),
+            "start": round(cursor, 3),
+            "end": round(cursor + duration, 3),
+            "url": seg.get("url")
+        })
+        cursor += duration - crossfade if i < len(segments) - 1 else duration
+        if i < len(segments) - 1:
+            cursor += gap
+    total_duration = cursor
+
+    # Normalize every input so concat/acrossfade see identical stream formats
+    filters = [
+        f"[{i}:a]aresample=44100,aformat=sample_fmts=fltp:channel_layouts=stereo[s{i}]"
+        for i in range(len(segments))
+    ]
+    if crossfade:
+        previous = "s0"
+        for i in range(1, len(segments)):
+            label = f"x{i}"
+            filters.append(f"[{previous}][s{i}]acrossfade=d={crossfade:.3f}[{label}]")
+            previous = label
+        filters.append(f"[{previous}]anull[out]")
+    else:
+        for i in range(len(segments) - 1):
+            filters.append(f"[s{i}]apad=pad_dur={gap:.3f}[p{i}]")
+        labels = "".join(f"[p{i}]" for i in range(len(segments) - 1)) + f"[s{len(segments) - 1}]"
+        filters.append(f"{labels}concat=n={len(segments)}:v=0:a=1[out]")
+
+    chapters = [
+        {
+            "title": f"{o['speaker']}: {o['text'][:60]}",
+            "start": o["start"],
+            "end": offsets[i + 1]["start"] if i + 1 < len(offsets) else total_duration
+        }
+        for i, o in enumerate(offsets)
+    ]
+
+    tmp_path = f"{output_path}.part"
+    metadata_path = f"{output_path}.ffmeta"
+    write_ffmetadata(metadata_path, chapters, title=title, artist="Jax & Emma")
+
+    args = []
+    for _, path in segments:
+        args.extend(["-i", path])
+    args.extend(["-i", metadata_path])
+    args.extend([
+        "-filter_complex", ";".join(filters),
+        "-map", "[out]",
+        "-map_metadata", str(len(segments)),
+        "-map_chapters", str(len(segments)),
+        *codec_args(fmt),
+        "-y", tmp_path
+    ])
+
+    print(f"🎚️  Assembling podcast episode from {len(segments)} segments...")
+    try:
+        await run_ffmpeg(args)
+        os.replace(tmp_path, output_path)
+    finally:
+        for path in (tmp_path, metadata_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    peaks_path = os.path.splitext(output_path)[0] + ".peaks.json"
+    write_json_atomic(peaks_path, await compute_peaks(output_path))
+
+    print(f"✅ Episode assembled: {output_path} ({total_duration:.1f}s)")
+    return {
+        "path": output_path,
+        "format": fmt,
+        "duration": round(total_duration, 3),
+        "segments": offsets,
+        "peaks_path": peaks_path
+    }
+
+
 # Convenience functions for backward compatibility
 async def generate_podcast_script(text: str) -> List[Dict]:
     """Generate a podcast script (legacy interface)."""
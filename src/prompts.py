@@ -528,6 +528,19 @@ INPUT TEXT:
 # For preprocessing text before sending to TTS
 # ----------------------------------------------------------------------------
 
+# Filled into {bookends} depending on where the chunk sits in the book
+AUDIOBOOK_INTRO_INSTRUCTION = """INTRO (add at the very beginning):
+"You are listening to [BOOK_TITLE], written by [AUTHOR_NAME]. ..."
+"""
+
+AUDIOBOOK_OUTRO_INSTRUCTION = """OUTRO (add at the very end):
+"... Thank you for listening."
+"""
+
+AUDIOBOOK_CONTINUATION_INSTRUCTION = """This is a passage from the middle of the book.
+Do NOT add any intro or outro - start and end exactly where the passage does.
+"""
+
 AUDIOBOOK_NARRATOR_PROMPT = """
 You are a professional audiobook narrator preparing text for text-to-speech.
 
@@ -553,11 +566,7 @@ READING RULES:
 - Fix punctuation for better speech flow
 - Remove page numbers and formatting artifacts
 
-INTRO (add at the very beginning):
-"You are listening to [BOOK_TITLE], written by [AUTHOR_NAME]. ..."
-
-OUTRO (add at the very end):
-"... Thank you for listening."
+{bookends}
 
 CRITICAL FORMATTING FOR NATURAL PAUSES:
 - End each sentence with ". ... " (period, space, ellipsis, space)
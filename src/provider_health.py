@@ -0,0 +1,163 @@
+import math
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+# Circuit breaker defaults
+HEALTH_WINDOW = 50            # Most recent calls kept per provider
+MIN_CALLS_FOR_RATE = 10       # Calls needed before the error rate can open the breaker
+FAILURE_THRESHOLD = 3         # Consecutive failures that open the breaker
+ERROR_RATE_THRESHOLD = 0.5    # Rolling error rate that opens the breaker
+COOLDOWN_SECONDS = 30.0       # Time an open breaker waits before a trial call
+
+# Ranking order of breaker states (open providers are only ranked once cooled down)
+BREAKER_ORDER = {"closed": 0, "half_open": 1, "open": 2}
+
+class ProviderHealth:
+    """
+    Rolling latency/error statistics and a circuit breaker for one provider.
+
+    States:
+        closed    - requests flow normally
+        open      - provider is skipped until the cooldown expires
+        half_open - a single trial request is let through; its outcome
+                    closes or re-opens the breaker
+    """
+    def __init__(self, name: str, window: int = HEALTH_WINDOW, cooldown: float = COOLDOWN_SECONDS):
+        self.name = name
+        self.cooldown = cooldown
+        self.calls = deque(maxlen=window)  # (timestamp, latency, ok, rate_limited)
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trial_owner = None  # Ticket of the call holding the half-open trial slot
+
+    def allow_request(self):
+        """
+        Claim permission to send a request now. Returns None when the provider
+        should be skipped, otherwise a ticket to hand back to record_success,
+        record_failure or end_trial. When half-open only one ticket holds the
+        trial slot, and only that ticket releases it.
+        """
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return None
+            self.state = "half_open"
+            self.trial_owner = None  # A trial from an earlier half-open period no longer counts
+        if self.state == "half_open":
+            if self.trial_owner is not None:
+                return None
+            self.trial_owner = object()
+            return self.trial_owner
+        return True
+
+    def end_trial(self, ticket):
+        """Release the trial slot if `ticket` holds it, without recording an outcome (e.g. the call was cancelled)."""
+        if ticket is not None and ticket is self.trial_owner:
+            self.trial_owner = None
+
+    def record_success(self, latency: float, ticket=None):
+        self.calls.append((time.time(), latency, True, False))
+        self.consecutive_failures = 0
+        if self.state != "closed":
+            print(f"✅ {self.name} recovered, closing circuit breaker")
+        self.state = "closed"
+        self.end_trial(ticket)
+
+    def record_failure(self, latency: float, rate_limited: bool = False, ticket=None):
+        self.calls.append((time.time(), latency, False, rate_limited))
+        self.consecutive_failures += 1
+        self.end_trial(ticket)
+
+        enough_calls = len(self.calls) >= MIN_CALLS_FOR_RATE
+        if (self.state == "half_open"
+                or self.consecutive_failures >= FAILURE_THRESHOLD
+                or (enough_calls and self.error_rate() >= ERROR_RATE_THRESHOLD)):
+            if self.state != "open":
+                print(f"🛑 {self.name} circuit breaker opened for {self.cooldown:.0f}s "
+                      f"(error rate {self.error_rate():.0%}, {self.consecutive_failures} consecutive failures)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def error_rate(self) -> float:
+        if not self.calls:
+            return 0.0
+        return sum(1 for c in self.calls if not c[2]) / len(self.calls)
+
+    def rate_limited_count(self) -> int:
+        return sum(1 for c in self.calls if c[3])
+
+    def latencies(self, successful_only: bool = True) -> List[float]:
+        return [c[1] for c in self.calls if c[2] or not successful_only]
+
+    def avg_latency(self) -> Optional[float]:
+        latencies = self.latencies()
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def latency_percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """Latency below which a fraction q of recent successful calls finished (nearest rank)."""
+        latencies = sorted(self.latencies())
+        if len(latencies) < max(1, min_samples):
+            return None
+        rank = max(1, math.ceil(q * len(latencies)))
+        return latencies[rank - 1]
+
+    def is_healthy(self) -> bool:
+        # Sustained errors open the breaker; a half-open provider is still on probation
+        return self.state == "closed"
+
+    def snapshot(self) -> Dict:
+        avg = self.avg_latency()
+        p95 = self.latency_percentile(0.95)
+        return {
+            "state": self.state,
+            "calls": len(self.calls),
+            "error_rate": round(self.error_rate(), 3),
+            "rate_limited": self.rate_limited_count(),
+            "avg_latency": round(avg, 3) if avg is not None else None,
+            "p95_latency": round(p95, 3) if p95 is not None else None,
+            "consecutive_failures": self.consecutive_failures
+        }
+
+class HealthRegistry:
+    """Per-provider health trackers, created on first use."""
+    def __init__(self, names: Optional[List[str]] = None, cooldown: float = COOLDOWN_SECONDS):
+        self.cooldown = cooldown
+        self.providers: Dict[str, ProviderHealth] = {}
+        for name in names or []:
+            self.get(name)
+
+    def get(self, name: str) -> ProviderHealth:
+        if name not in self.providers:
+            self.providers[name] = ProviderHealth(name, cooldown=self.cooldown)
+        return self.providers[name]
+
+    def rank(self, candidates: List[str]) -> List[str]:
+        """
+        Order candidates healthiest first: by breaker state, then rolling error
+        rate, then p95 latency, keeping the given order as the tie-breaker.
+        Error rate and latency only count once a provider has MIN_CALLS_FOR_RATE
+        calls, so a single slow or failed call doesn't reorder providers.
+        Providers whose breaker is open are dropped.
+        """
+        ranked = sorted(enumerate(candidates), key=lambda item: self._rank_key(*item))
+        return [name for _, name in ranked if self.get(name).state != "open" or self._cooled_down(name)]
+
+    def _rank_key(self, position: int, name: str):
+        health = self.get(name)
+        enough_calls = len(health.calls) >= MIN_CALLS_FOR_RATE
+        error_rate = health.error_rate() if enough_calls else 0.0
+        p95 = health.latency_percentile(0.95, min_samples=MIN_CALLS_FOR_RATE) or 0.0
+        return (BREAKER_ORDER[health.state], error_rate, p95, position)
+
+    def _cooled_down(self, name: str) -> bool:
+        health = self.get(name)
+        return time.monotonic() - health.opened_at >= health.cooldown
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: health.snapshot() for name, health in self.providers.items()}
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Heuristic used across providers whose clients raise plain exceptions."""
+    text = str(error).lower()
+    return "429" in text or "rate limit" in text or "quota" in text
@@ -0,0 +1,197 @@
+import re
+import math
+from collections import Counter
+from itertools import zip_longest
+from typing import List, Dict, Tuple
+from sqlalchemy import text
+
+# Passage index for question answering. Each book is split into overlapping
+# chunks at ingest; rowid = book_id * CHUNK_ROWID_STRIDE + position, so a
+# book's chunks are one rowid range (cheap to filter and delete).
+# The FTS5 table is contentless: passages are stored only as character
+# offsets into book.full_text (SPAN_TABLE) and sliced out of the book text
+# when needed, including to remove a book's old tokens, since FTS5 deletes
+# contentless rows by value.
+CHUNK_TABLE = "chunk_fts"
+SPAN_TABLE = "chunk_span"
+CHUNK_ROWID_STRIDE = 1_000_000
+
+CHUNK_CHARS = 1200    # Target passage size
+CHUNK_OVERLAP = 200   # Carried over so an answer spanning a boundary stays in one passage
+TOP_K = 6             # Passages sent with each question (~7k chars, vs 10k of page one before)
+
+CREATE_CHUNK_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {CHUNK_TABLE} USING fts5("
+    "text, content='', tokenize='porter unicode61 remove_diacritics 2')"
+)
+CREATE_SPAN_TABLE = (
+    f"CREATE TABLE IF NOT EXISTS {SPAN_TABLE} (book_id INTEGER NOT NULL, position INTEGER NOT NULL, "
+    "char_start INTEGER NOT NULL, char_end INTEGER NOT NULL, PRIMARY KEY (book_id, position)) WITHOUT ROWID"
+)
+CREATE_PASSAGE_TABLES = (CREATE_CHUNK_TABLE, CREATE_SPAN_TABLE)
+
+# BM25 parameters for the in-memory fallback (same defaults as FTS5)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from", "had", "has",
+    "have", "he", "her", "his", "how", "i", "in", "is", "it", "its", "of", "on", "or", "she", "that",
+    "the", "their", "them", "they", "this", "to", "was", "were", "what", "when", "where", "which",
+    "who", "whom", "why", "will", "with", "would", "you", "about", "book", "story",
+}
+
+def chunk_spans(full_text: str, chunk_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, int]]:
+    """
+    (start, end) offsets into full_text of passages of about chunk_chars,
+    breaking at paragraph or sentence ends where possible, each starting
+    `overlap` chars before the previous one ended. Passages carry no
+    leading or trailing whitespace.
+    """
+    full_text = full_text or ""
+    lead = len(full_text) - len(full_text.lstrip())
+    body = full_text.strip()
+
+    spans = []
+    start = 0
+    while start < len(body):
+        end = min(start + chunk_chars, len(body))
+        if end < len(body):
+            window = body[start + chunk_chars // 2:end]
+            for separator in ("\n\n", ". ", "\n", " "):
+                cut = window.rfind(separator)
+                if cut != -1:
+                    end = start + chunk_chars // 2 + cut + len(separator)
+                    break
+        segment = body[start:end]
+        if segment.strip():
+            first = start + len(segment) - len(segment.lstrip())
+            spans.append((lead + first, lead + start + len(segment.rstrip())))
+        if end >= len(body):
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+def chunk_text(full_text: str, chunk_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """The passages of chunk_spans()."""
+    return [full_text[start:end] for start, end in chunk_spans(full_text, chunk_chars, overlap)]
+
+def _terms(value: str) -> List[str]:
+    return [t for t in re.findall(r"\w+", value.lower()) if t not in STOPWORDS and len(t) > 1]
+
+def _rowid_range(book_id: int):
+    return book_id * CHUNK_ROWID_STRIDE, (book_id + 1) * CHUNK_ROWID_STRIDE - 1
+
+def index_chunks(conn, book_id: int, full_text: str, old_text: str = "") -> int:
+    """
+    Replace a book's passages. `old_text` is the text indexed until now
+    (its stored full_text). Returns the number stored.
+    """
+    remove_chunks(conn, {book_id: old_text})
+    spans = chunk_spans(full_text)[:CHUNK_ROWID_STRIDE]
+    if spans:
+        base = book_id * CHUNK_ROWID_STRIDE
+        conn.execute(
+            text(f"INSERT INTO {CHUNK_TABLE} (rowid, text) VALUES (:rowid, :text)"),
+            [{"rowid": base + i, "text": full_text[start:end]} for i, (start, end) in enumerate(spans)]
+        )
+        conn.execute(
+            text(f"INSERT INTO {SPAN_TABLE} (book_id, position, char_start, char_end) VALUES (:book_id, :position, :start, :end)"),
+            [{"book_id": book_id, "position": i, "start": start, "end": end} for i, (start, end) in enumerate(spans)]
+        )
+    return len(spans)
+
+def _spans(conn, book_id: int) -> List[Tuple[int, int, int]]:
+    return conn.execute(
+        text(f"SELECT position, char_start, char_end FROM {SPAN_TABLE} WHERE book_id = :book_id"), {"book_id": book_id}
+    ).all()
+
+def remove_chunks(conn, bodies: Dict[int, str]):
+    """Drop books' passages; `bodies` maps book id -> the text they were cut from (see index_chunks)."""
+    for book_id, body in bodies.items():
+        book_id = int(book_id)
+        spans = _spans(conn, book_id)
+        if not spans:
+            continue
+        base = book_id * CHUNK_ROWID_STRIDE
+        conn.execute(
+            text(f"INSERT INTO {CHUNK_TABLE} ({CHUNK_TABLE}, rowid, text) VALUES ('delete', :rowid, :text)"),
+            [{"rowid": base + position, "text": (body or "")[start:end]} for position, start, end in spans]
+        )
+        conn.execute(text(f"DELETE FROM {SPAN_TABLE} WHERE book_id = :book_id"), {"book_id": book_id})
+
+def has_chunks(conn, book_id: int) -> bool:
+    return conn.execute(
+        text(f"SELECT 1 FROM {SPAN_TABLE} WHERE book_id = :book_id LIMIT 1"), {"book_id": book_id}
+    ).first() is not None
+
+def retrieve(conn, book_id: int, question: str, full_text: str, k: int = TOP_K) -> List[str]:
+    """
+    Top-k passages of a book for a question, by FTS5 bm25, returned in
+    reading order and sliced from the book's `full_text`. Any question word
+    may match.
+    """
+    terms = _terms(question)
+    if not terms or not full_text:
+        return []
+    match = " OR ".join(f'"{t}"' for t in dict.fromkeys(terms))
+    low, high = _rowid_range(book_id)
+    rowids = conn.execute(text(
+        f"SELECT rowid FROM {CHUNK_TABLE} WHERE {CHUNK_TABLE} MATCH :match "
+        f"AND rowid BETWEEN :low AND :high ORDER BY bm25({CHUNK_TABLE}) LIMIT :k"
+    ), {"match": match, "low": low, "high": high, "k": k}).scalars().all()
+    if not rowids:
+        return []
+    positions = ", ".join(str(int(rowid - low)) for rowid in rowids)
+    spans = conn.execute(text(
+        f"SELECT char_start, char_end FROM {SPAN_TABLE} WHERE book_id = :book_id AND position IN ({positions}) "
+        "ORDER BY position"
+    ), {"book_id": book_id}).all()
+    return [full_text[start:end] for start, end in spans]
+
+def rank_passages(full_text: str, question: str, k: int = TOP_K) -> List[str]:
+    """
+    In-memory BM25 over freshly chunked text, for books that aren't in the
+    library index. Falls back to the opening passages when nothing matches.
+    """
+    chunks = chunk_text(full_text)
+    terms = set(_terms(question))
+    if not chunks:
+        return []
+    if not terms:
+        return chunks[:k]
+
+    docs = [Counter(_terms(chunk)) for chunk in chunks]
+    avg_len = sum(sum(doc.values()) for doc in docs) / len(docs) or 1.0
+    df = {t: sum(1 for doc in docs if t in doc) for t in terms}
+
+    scores = []
+    for i, doc in enumerate(docs):
+        length = sum(doc.values())
+        score = 0.0
+        for t in terms:
+            tf = doc.get(t, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(docs) - df[t] + 0.5) / (df[t] + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+        if score > 0:
+            scores.append((score, i))
+
+    if not scores:
+        return chunks[:k]
+    best = sorted(i for _, i in sorted(scores, reverse=True)[:k])
+    return [chunks[i] for i in best]
+
+def merge_passages(*rankings: List[str], k: int = TOP_K) -> List[str]:
+    """Interleave passage lists (e.g. semantic and BM25 hits) up to k, dropping repeats."""
+    merged = []
+    for group in zip_longest(*rankings):
+        for passage in group:
+            if passage and passage not in merged and len(merged) < k:
+                merged.append(passage)
+    return merged
+
+def format_passages(passages: List[str]) -> str:
+    """Numbered passages for an LLM prompt."""
+    return "\n\n".join(f"[Passage {i}]\n{passage}" for i, passage in enumerate(passages, 1))
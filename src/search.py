@@ -0,0 +1,171 @@
+import re
+from typing import List, Dict, Optional
+from sqlalchemy import text
+
+# FTS5 index over each book; rowid is book.id. Created (external-content) by
+# migration 4. The index holds tokens only: column
+# values live in CONTENT_TABLE, where body is always '' (the text is already
+# stored, compressed, in book.full_text). Since FTS5 has no copy of a row,
+# changing or deleting one replays the old values through the 'delete'
+# command, with the old body passed in by the caller. (FTS5's 'rebuild' and
+# 'integrity-check' would read that empty body: drop the table and let the
+# startup backfill re-index instead.)
+FTS_TABLE = "book_fts"
+CONTENT_TABLE = "book_search"
+FTS_COLUMNS = ("title", "author", "chapters", "entities", "scenes", "body")
+META_COLUMNS = FTS_COLUMNS[:-1]
+
+# bm25 column weights, in FTS_COLUMNS order: metadata matches outrank body text
+FTS_WEIGHTS = (10.0, 5.0, 4.0, 3.0, 2.0, 1.0)
+
+SNIPPET_TOKENS = 16
+MAX_RESULTS = 50
+
+_CONTENT_COLUMNS = ", ".join(f"{c} TEXT NOT NULL DEFAULT ''" for c in FTS_COLUMNS)
+CREATE_CONTENT_TABLE = f"CREATE TABLE IF NOT EXISTS {CONTENT_TABLE} (id INTEGER PRIMARY KEY, {_CONTENT_COLUMNS})"
+CREATE_FTS_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"{', '.join(FTS_COLUMNS)}, content='{CONTENT_TABLE}', content_rowid='id', "
+    "tokenize='porter unicode61 remove_diacritics 2')"
+)
+CREATE_SEARCH_TABLES = (CREATE_CONTENT_TABLE, CREATE_FTS_TABLE)
+
+# Context kept either side of the first body hit when building a snippet
+SNIPPET_CONTEXT_CHARS = 160
+
+def chapter_titles(full_text: str) -> str:
+    """Heading lines, using the same heuristic as analysis.chapter_segmentation."""
+    titles = []
+    for line in (full_text or "").split("\n"):
+        stripped = line.strip()
+        if stripped and (stripped.lower().startswith("chapter") or (line.isupper() and len(stripped) < 50)):
+            titles.append(stripped)
+    return "\n".join(titles)
+
+def _entity_name(entity) -> str:
+    if isinstance(entity, (list, tuple)):
+        return " ".join(str(part) for part in entity[:2])
+    if isinstance(entity, dict):
+        return f"{entity.get('name', '')} {entity.get('role', entity.get('type', ''))}".strip()
+    return str(entity)
+
+def _scene_text(scene) -> str:
+    if isinstance(scene, dict):
+        return " ".join(str(scene.get(k, "")) for k in ("description", "excerpt", "environment") if scene.get(k))
+    return str(scene)
+
+def analysis_fields(analysis: Optional[Dict]) -> Dict[str, str]:
+    """Entity and scene columns from an analysis dict."""
+    analysis = analysis or {}
+    return {
+        "entities": "\n".join(_entity_name(e) for e in analysis.get("entities", []) or []),
+        "scenes": "\n".join(_scene_text(s) for s in analysis.get("scenes", []) or []),
+    }
+
+def _delete_row(conn, book_id: int, values: Dict[str, str]):
+    columns = ", ".join(FTS_COLUMNS)
+    placeholders = ", ".join(f":{c}" for c in FTS_COLUMNS)
+    conn.execute(
+        text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {columns}) VALUES ('delete', :id, {placeholders})"),
+        {"id": book_id, **values}
+    )
+
+def index_book(conn, book_id: int, old_body: str = "", **fields):
+    """
+    Insert or update a book's search row. Only the given columns change,
+    so analysis updates don't have to re-send the full text.
+
+    `old_body` must be the text currently indexed for the book (its stored
+    full_text): the index keeps no copy, and the old tokens are removed by
+    value. It is also the body kept when `body` isn't given.
+    """
+    fields = {k: v or "" for k, v in fields.items() if k in FTS_COLUMNS}
+    current = conn.execute(
+        text(f"SELECT {', '.join(META_COLUMNS)} FROM {CONTENT_TABLE} WHERE id = :id"), {"id": book_id}
+    ).mappings().first()
+    values = {c: "" for c in FTS_COLUMNS}
+    if current:
+        values.update(current, body=old_body or "")
+        _delete_row(conn, book_id, values)
+    values.update(fields)
+
+    columns = ", ".join(FTS_COLUMNS)
+    placeholders = ", ".join(f":{c}" for c in FTS_COLUMNS)
+    conn.execute(
+        text(f"INSERT OR REPLACE INTO {CONTENT_TABLE} (id, {columns}) VALUES (:id, {placeholders})"),
+        {"id": book_id, **values, "body": ""}
+    )
+    conn.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (:id, {placeholders})"), {"id": book_id, **values})
+
+def remove_books(conn, bodies: Dict[int, str]):
+    """Drop books from the index; `bodies` maps book id -> its stored full_text (see index_book)."""
+    for book_id, body in bodies.items():
+        current = conn.execute(
+            text(f"SELECT {', '.join(META_COLUMNS)} FROM {CONTENT_TABLE} WHERE id = :id"), {"id": book_id}
+        ).mappings().first()
+        if current:
+            _delete_row(conn, book_id, {**current, "body": body or ""})
+            conn.execute(text(f"DELETE FROM {CONTENT_TABLE} WHERE id = :id"), {"id": book_id})
+
+def to_match_query(query: str) -> str:
+    """
+    Turn free user input into a safe FTS5 query: every word must match,
+    the last one as a prefix so search-as-you-type works.
+    """
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return ""
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def body_snippet(full_text: str, query: str) -> str:
+    """
+    Snippet around the first hit of a query word in a book's text, hits
+    wrapped in <mark>. Words match by prefix (roughly what the porter
+    tokenizer matches); "" when none occurs.
+    """
+    terms = re.findall(r"\w+", query)
+    if not terms or not full_text:
+        return ""
+    stems = sorted({t[:-1] if len(t) > 3 and t.lower().endswith("s") else t for t in terms}, key=len, reverse=True)
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(t) for t in stems) + r")\w*", re.IGNORECASE)
+    hit = pattern.search(full_text)
+    if not hit:
+        return ""
+    start = max(0, hit.start() - SNIPPET_CONTEXT_CHARS)
+    end = min(len(full_text), hit.end() + SNIPPET_CONTEXT_CHARS)
+    words = full_text[start:end].split()
+    if start > 0:
+        words = words[1:]  # Likely cut mid-word
+    if end < len(full_text):
+        words = words[:-1]
+    first = next((i for i, w in enumerate(words) if pattern.search(w)), 0)
+    lo = max(0, first - SNIPPET_TOKENS // 2)
+    window = words[lo:lo + SNIPPET_TOKENS]
+    snippet = pattern.sub(lambda m: f"<mark>{m.group(0)}</mark>", " ".join(window))
+    prefix = "…" if start > 0 or lo > 0 else ""
+    suffix = "…" if end < len(full_text) or lo + SNIPPET_TOKENS < len(words) else ""
+    return f"{prefix}{snippet}{suffix}"
+
+def search(conn, query: str, limit: int = 20) -> List[Dict]:
+    """
+    Ranked full-text search.
+
+    Returns:
+        [{"book_id", "score", "snippet"}] best match first; snippets come
+        from the metadata columns and mark hits with <mark>. Body hits have
+        no stored text to quote: their snippet is "" and callers build it
+        with body_snippet() from the book text.
+    """
+    match = to_match_query(query)
+    if not match:
+        return []
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    rows = conn.execute(text(
+        f"SELECT rowid, bm25({FTS_TABLE}, {weights}) AS score, "
+        f"snippet({FTS_TABLE}, -1, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match ORDER BY score LIMIT :limit"
+    ), {"match": match, "limit": min(limit, MAX_RESULTS)}).all()
+    # bm25() is lower-is-better; flip it so callers see higher-is-better
+    return [{"book_id": row[0], "score": round(-row[1], 4), "snippet": row[2]} for row in rows]
@@ -1,5 +1,8 @@
 import os
+import json
 import shutil
+import hashlib
+import uuid
 import uvicorn
 import asyncio
 import aiofiles
@@ -7,7 +10,7 @@ import mimetypes
 import traceback
 from pathlib import Path
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, BackgroundTasks, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 import zipfile
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
@@ -27,12 +30,17 @@ import src.config
 from src.ingestion import ingest_book, clean_format
 from src.analysis import semantic_analysis
 from src.audio import generate_audio as generate_audio_service
-from src.audio import generate_audio as generate_audio_service
+from src.audio import generate_audio_file, tts_health
 from src.visuals import generate_images, generate_entity_image, generate_poster_with_deapi
-from src.knowledge import generate_quizzes, ask_question, suggest_questions
-from src.knowledge import generate_quizzes, ask_question, suggest_questions
-from src.podcast import generate_podcast_script, generate_podcast_audio
-from src.library import LibraryManager
+from src.knowledge import ask_question, suggest_questions, llm_health, close_http_session
+from src.knowledge import ask_question_stream, build_study_pack, NoProviderError
+from src.knowledge import retrieval_query, record_turn, needs_compaction, compact_conversation, merge_compaction
+from src.podcast import generate_podcast_script, generate_podcast_audio, assemble_episode
+from src.audiobook import export_audiobook
+from src.library import LibraryManager, AsyncLibraryManager
+from src.retrieval import merge_passages
+from src import embeddings
+from src.bulk_import import bulk_import
 from src.video import generate_video_with_deapi
 from src.storybook import generate_full_storybook, world_bible_to_json, pages_to_json
 
@@ -59,7 +67,13 @@ async def lifespan(app: FastAPI):
         print("⚠️  WARNING: DEAPI_API_KEY is not set. High-quality image generation will fail.")
     else:
         print("✅ DEAPI_API_KEY found.")
+
+    # Pick up books dropped into the upload directory without scanning on every request
+    watcher = asyncio.create_task(library_manager.watch_upload_dir())
     yield
+    watcher.cancel()
+    library_manager.shutdown()
+    await close_http_session()
 
 app = FastAPI(title="Book2Vision API", lifespan=lifespan)
 
@@ -112,21 +126,26 @@ async def health_check():
             "deepseek": bool(DEEPSEEK_API_KEY),
             "elevenlabs": bool(ELEVENLABS_API_KEY),
             "deepgram": bool(DEEPGRAM_API_KEY)
-        }
+        },
+        "tts_providers": tts_health.snapshot(),
+        "llm_providers": llm_health.snapshot()
     }
 
 # Directories
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 UPLOAD_DIR = os.path.join(BASE_DIR, "temp_upload")
+# Uploads are validated here and only then moved into the watched UPLOAD_DIR
+STAGING_DIR = os.path.join(BASE_DIR, "temp_staging")
 OUTPUT_DIR = os.path.join(BASE_DIR, "Book2Vision_Output")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # Initialize Library Manager
-library_manager = LibraryManager(UPLOAD_DIR)
+library_manager = AsyncLibraryManager(LibraryManager(UPLOAD_DIR))
 
 # File Upload Security Configuration
 MAX_FILE_SIZE_MB = 50  # Maximum upload size in MB
+MAX_IMPORT_SIZE_MB = int(os.getenv("MAX_IMPORT_SIZE_MB", 2048))  # Bulk import archives
 ALLOWED_EXTENSIONS = {".pdf", ".epub", ".txt"}
 ALLOWED_MIMETYPES = {"application/pdf", "application/epub+zip", "text/plain"}
 
@@ -147,10 +166,85 @@ class AppState:
         self.entity_images = {}
         self.book_id = None
         self.audiobook_path = None
-        self.immersive_audio_paths = []
+        self.immersive_audio = {}  # book_id -> latest immersive audio job (job_id, scenes, paths)
+        self.podcast_episode_path = None
+        self.audiobook_export = None
+        self.asset_gc = None
+        self.bulk_import = None
+        self.study_packs = {}  # book_id -> study pack job status
+        self.qa_locks = {}  # Q&A session id -> lock serializing its turns
 
 state = AppState()
 
+async def track_assets(book_id: Optional[int], paths: List[str]):
+    """Record generated files as owned by a book so the asset GC can reclaim them later."""
+    if not book_id or not paths:
+        return
+    try:
+        await library_manager.register_assets(book_id, [p for p in paths if p])
+    except Exception as e:
+        print(f"⚠️ Asset tracking failed: {e}")
+
+# Long-running per-book jobs (embeddings, graph, study pack) run as their own
+# tasks: BackgroundTasks run one after another, so queuing them there would
+# hold up quick follow-ups such as the auto-generated cover
+_running_jobs = set()
+
+def spawn_job(coro) -> asyncio.Task:
+    """Start a background coroutine now, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    _running_jobs.add(task)
+    task.add_done_callback(_running_jobs.discard)
+    return task
+
+async def build_embeddings_background(book_id: Optional[int], full_text: str):
+    """Embed a book's passages for semantic Q&A (no-op without an embedding backend)."""
+    try:
+        path = await asyncio.to_thread(embeddings.build_index, full_text)
+        if path:
+            await track_assets(book_id, [path])
+    except Exception as e:
+        print(f"⚠️ Embedding index failed: {e}")
+
+async def build_graph_background(book_id: Optional[int]):
+    """Recount the relationship graph for chapters whose text or entities changed."""
+    if not book_id:
+        return
+    try:
+        result = await library_manager.update_graph(book_id)
+        if result and result["recounted"]:
+            print(f"🕸️ Graph: recounted {result['recounted']}/{result['chapters']} chapters of book {book_id}")
+    except Exception as e:
+        print(f"⚠️ Graph update failed: {e}")
+
+async def run_study_pack(book_id: int, full_text: str):
+    """Background job: build and store a book's quiz, flashcards and suggested questions."""
+    job = state.study_packs[book_id]
+    job.update(status="running", started_at=time.time())
+    try:
+        passages = await asyncio.to_thread(embeddings.representative_passages, full_text)
+        pack = await build_study_pack(full_text, passages)
+        await library_manager.save_study_pack(book_id, pack)
+        job["status"] = "complete"
+    except Exception as e:
+        print(f"❌ Study pack failed: {e}")
+        traceback.print_exc()
+        job.update(status="failed", error=str(e)[:200])
+    job["finished_at"] = time.time()
+
+def study_pack_pending(book_id: Optional[int]) -> bool:
+    job = state.study_packs.get(book_id)
+    return bool(job and job.get("status") in ("queued", "running"))
+
+def schedule_study_pack(book_id: Optional[int], full_text: str) -> bool:
+    """Queue a study pack build unless one is already queued or running for the book."""
+    if not book_id or not (full_text or "").strip() or study_pack_pending(book_id):
+        return False
+    # Marked before returning, so a request arriving before the job starts sees it
+    state.study_packs[book_id] = {"status": "queued", "queued_at": time.time()}
+    spawn_job(run_study_pack(book_id, full_text))
+    return True
+
 # Models
 class AudioRequest(BaseModel):
     text: str
@@ -167,6 +261,7 @@ class VisualsRequest(BaseModel):
 
 class QARequest(BaseModel):
     question: str
+    session_id: Optional[str] = None
 
 class ImmersiveAudioRequest(BaseModel):
     voice_id: str = "21m00Tcm4TlvDq8ikWAM"
@@ -176,6 +271,7 @@ class ImmersiveAudioRequest(BaseModel):
 
 @app.post("/api/upload")
 async def upload_book(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
+    staged_path = None
     try:
         # 1. Validate filename exists
         if not file.filename or file.filename == "":
@@ -198,19 +294,23 @@ async def upload_book(file: UploadFile = File(...), background_tasks: Background
             safe_filename = f"upload_{int(time.time())}{file_ext}"
         
         file_path = os.path.join(UPLOAD_DIR, safe_filename)
+        os.makedirs(STAGING_DIR, exist_ok=True)
+        staged_path = os.path.join(STAGING_DIR, f"{uuid.uuid4().hex[:8]}_{safe_filename}")
         
         # 4. Check file size during streaming (prevent DoS)
         total_size = 0
         max_size_bytes = MAX_FILE_SIZE_MB * 1024 * 1024
+        digest = hashlib.sha256()  # Same hash as library.file_sha256, computed while streaming
         
-        async with aiofiles.open(file_path, "wb") as buffer:
+        async with aiofiles.open(staged_path, "wb") as buffer:
             while chunk := await file.read(8192):  # Read in 8KB chunks
                 total_size += len(chunk)
+                digest.update(chunk)
                 if total_size > max_size_bytes:
                     # File too large - clean up and reject
                     await buffer.close()
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
+                    if os.path.exists(staged_path):
+                        os.remove(staged_path)
                     raise HTTPException(
                         status_code=413,
                         detail=f"File too large. Maximum size: {MAX_FILE_SIZE_MB}MB"
@@ -220,7 +320,7 @@ async def upload_book(file: UploadFile = File(...), background_tasks: Background
         # 5. Verify MIME type after upload (content-based detection)
         detected_type, _ = mimetypes.guess_type(file_path)
         if detected_type not in ALLOWED_MIMETYPES:
-            os.remove(file_path)  # Clean up invalid file
+            os.remove(staged_path)  # Clean up invalid file
             raise HTTPException(
                 status_code=400,
                 detail=f"File content type not allowed: {detected_type}"
@@ -228,15 +328,18 @@ async def upload_book(file: UploadFile = File(...), background_tasks: Background
         
         # Ingest
         try:
-            ingestion_result = await ingest_book(file_path)
+            ingestion_result = await ingest_book(staged_path)
             ingestion_result["filename"] = safe_filename  # Use sanitized filename
         except Exception as e:
              print(f"Ingestion failed: {e}")
              # Clean up file on ingestion failure
-             if os.path.exists(file_path):
-                 os.remove(file_path)
+             if os.path.exists(staged_path):
+                 os.remove(staged_path)
              raise HTTPException(status_code=400, detail="File processing failed. Please ensure the file is a valid book format.")
         
+        # Validated: only now does the file appear in the library's upload dir
+        os.replace(staged_path, file_path)
+        
         # Store state
         state.ingestion_result = ingestion_result
         state.full_text = ingestion_result.get("full_text", "")
@@ -258,16 +361,21 @@ async def upload_book(file: UploadFile = File(...), background_tasks: Background
 
         
         # Add to library FIRST (so we have book_id)
-        new_book = library_manager.add_book({
+        new_book = await library_manager.add_book({
             "title": ingestion_result.get("title", "Unknown"),
             "author": ingestion_result.get("author", "Unknown"),
-            "filename": safe_filename
+            "filename": safe_filename,
+            "file_size": total_size,
+            "content_hash": digest.hexdigest()
         }, full_text=state.full_text)
         state.book_id = new_book["id"]
         
         # Save analysis to DB
         if state.analysis_result:
-             library_manager.save_analysis(state.book_id, state.analysis_result)
+             await library_manager.save_analysis(state.book_id, state.analysis_result)
+        spawn_job(build_embeddings_background(state.book_id, state.full_text))
+        spawn_job(build_graph_background(state.book_id))
+        schedule_study_pack(state.book_id, state.full_text)
         
         # Auto-generate cover in background (after book_id is set)
         title = ingestion_result.get("title", "Unknown")
@@ -315,7 +423,8 @@ async def upload_book(file: UploadFile = File(...), background_tasks: Background
                                 role = "Character"
                             
                             print(f"   Generating entity: {name}")
-                            await generate_entity_image(name, role, entity_dir)
+                            entity_path = await generate_entity_image(name, role, entity_dir)
+                            await track_assets(state.book_id, [entity_path])
                             # Small delay to prevent rate limiting
                             await asyncio.sleep(1)
                         except Exception as e:
@@ -329,7 +438,7 @@ async def upload_book(file: UploadFile = File(...), background_tasks: Background
                     
                     if cover_path and state.book_id:
                         filename = os.path.basename(cover_path)
-                        library_manager.update_book_thumbnail(state.book_id, f"visuals/{filename}")
+                        await library_manager.update_book_thumbnail(state.book_id, f"visuals/{filename}")
                         print(f"✅ Auto-generated cover saved and linked to library: {cover_path}")
                 except Exception as e:
                     print(f"⚠️ Auto cover generation failed: {e}")
@@ -352,6 +461,10 @@ async def upload_book(file: UploadFile = File(...), background_tasks: Background
         print(f"❌ Upload error: {type(e).__name__} - {e}")
         traceback.print_exc()  # Full trace in server logs only
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
+    finally:
+        # Left behind only if the upload was rejected or failed before validation finished
+        if staged_path and os.path.exists(staged_path):
+            os.remove(staged_path)
 
 @app.get("/api/story")
 async def get_story():
@@ -411,6 +524,7 @@ async def generate_audio(req: AudioRequest):
         
         print(f"Audio file created: {audio_file}")
         state.audiobook_path = audio_file # Track for download
+        await track_assets(state.book_id, [audio_file])
         return {"audio_url": f"/api/assets/{filename}"}
     except HTTPException:
         raise
@@ -502,6 +616,7 @@ async def generate_visuals(req: VisualsRequest, background_tasks: BackgroundTask
             
         # Update state with expected paths (relative)
         state.images_list = [os.path.join(visuals_dir, img) for img in expected_images]
+        await track_assets(state.book_id, state.images_list)
         
         print("="*50)
         print(f"🎨 VISUALS GENERATION REQUESTED")
@@ -524,7 +639,7 @@ async def generate_visuals(req: VisualsRequest, background_tasks: BackgroundTask
         # Update thumbnail in library (use first scene if available, else title)
         if state.book_id:
             # Check if we already have a high-quality cover
-            current_book = library_manager.get_book(state.book_id)
+            current_book = await library_manager.get_book(state.book_id)
             has_cover = current_book and (current_book.get("thumbnail") or "").startswith("visuals/cover_")
             
             if not has_cover:
@@ -539,7 +654,7 @@ async def generate_visuals(req: VisualsRequest, background_tasks: BackgroundTask
                     # Store relative path from upload dir (which is what library expects/serves via assets)
                     # Actually library stores metadata. Frontend constructs URL.
                     # Let's store "visuals/filename.jpg"
-                    library_manager.update_book_thumbnail(state.book_id, f"visuals/{thumbnail_filename}")
+                    await library_manager.update_book_thumbnail(state.book_id, f"visuals/{thumbnail_filename}")
 
         # Return relative paths for frontend immediately
         image_urls = [f"/api/assets/visuals/{img}" for img in expected_images]
@@ -562,7 +677,7 @@ async def generate_poster(background_tasks: BackgroundTasks):
         os.makedirs(visuals_dir, exist_ok=True)
         
         # Get metadata
-        book = library_manager.get_book(state.book_id)
+        book = await library_manager.get_book(state.book_id)
         if not book:
              raise HTTPException(status_code=404, detail="Book not found")
              
@@ -586,7 +701,7 @@ async def generate_poster(background_tasks: BackgroundTasks):
         if poster_path:
             # Update library thumbnail
             filename = os.path.basename(poster_path)
-            library_manager.update_book_thumbnail(state.book_id, f"visuals/{filename}")
+            await library_manager.update_book_thumbnail(state.book_id, f"visuals/{filename}")
             
             return {
                 "poster_url": f"/api/assets/visuals/{filename}",
@@ -618,6 +733,7 @@ async def get_entity_image(name: str, role: str = "Character", regenerate: bool
         
         if img_path:
             state.entity_images[name] = img_path
+            await track_assets(state.book_id, [img_path])
             # Add timestamp to URL to bust browser cache
             return {"image_url": f"/api/assets/entities/{os.path.basename(img_path)}?t={int(time.time())}"}
         else:
@@ -661,6 +777,7 @@ async def generate_character_portraits_endpoint(req: CharacterPortraitsRequest,
             expected_portraits.append(f"portrait_{safe_name}.jpg")
         
         print(f"🎭 Generating {len(expected_portraits)} character portraits...")
+        await track_assets(state.book_id, [os.path.join(portraits_dir, img) for img in expected_portraits])
         
         # Run in background
         background_tasks.add_task(
@@ -683,6 +800,27 @@ async def generate_character_portraits_endpoint(req: CharacterPortraitsRequest,
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Failed to generate character portraits")
 
+async def _find_character(name: str) -> list:
+    """
+    Look up one character entry ([name, role, physical, outfit, prop]).
+    Saved books read the single entity row; unsaved analyses are scanned in memory.
+    """
+    if not state.analysis_result:
+        raise HTTPException(status_code=400, detail="No book analyzed")
+
+    character = None
+    if state.book_id:
+        character = await library_manager.get_entity(state.book_id, name)
+    if character is None:
+        for entity in state.analysis_result.get("entities", []):
+            if isinstance(entity, list) and len(entity) >= 1 and entity[0].lower() == name.lower():
+                character = entity
+                break
+
+    if not isinstance(character, list) or not character:
+        raise HTTPException(status_code=404, detail=f"Character '{name}' not found")
+    return character
+
 @app.get("/api/character/{name}/portrait")
 async def get_character_portrait(name: str, style: str = "anime", genre: str = "fantasy"):
     """Get or generate a single character portrait."""
@@ -695,18 +833,7 @@ async def get_character_portrait(name: str, style: str = "anime", genre: str = "
         return {"portrait_url": f"/api/assets/portraits/portrait_{safe_name}.jpg?t={int(time.time())}"}
     
     # Find character in analysis to get details
-    if not state.analysis_result:
-        raise HTTPException(status_code=400, detail="No book analyzed")
-    
-    entities = state.analysis_result.get("entities", [])
-    character = None
-    for entity in entities:
-        if isinstance(entity, list) and len(entity) >= 1 and entity[0].lower() == name.lower():
-            character = entity
-            break
-    
-    if not character:
-        raise HTTPException(status_code=404, detail=f"Character '{name}' not found")
+    character = await _find_character(name)
     
     try:
         from src.visuals import generate_character_portrait
@@ -726,6 +853,7 @@ async def get_character_portrait(name: str, style: str = "anime", genre: str = "
             outfit = "appropriate attire"
             prop = "none"
         
+        await track_assets(state.book_id, [portrait_path])
         result = await generate_character_portrait(
             name=char_name,
             role=role,
@@ -758,18 +886,7 @@ async def get_character_sheet(name: str, style: str = "anime"):
         return {"sheet_url": f"/api/assets/portraits/sheet_{safe_name}.jpg?t={int(time.time())}"}
     
     # Find character
-    if not state.analysis_result:
-        raise HTTPException(status_code=400, detail="No book analyzed")
-    
-    entities = state.analysis_result.get("entities", [])
-    character = None
-    for entity in entities:
-        if isinstance(entity, list) and len(entity) >= 1 and entity[0].lower() == name.lower():
-            character = entity
-            break
-    
-    if not character:
-        raise HTTPException(status_code=404, detail=f"Character '{name}' not found")
+    character = await _find_character(name)
     
     try:
         from src.visuals import generate_character_sheet
@@ -789,6 +906,7 @@ async def get_character_sheet(name: str, style: str = "anime"):
             outfit = "appropriate attire"
             prop = "none"
         
+        await track_assets(state.book_id, [sheet_path])
         result = await generate_character_sheet(
             name=char_name,
             role=role,
@@ -823,18 +941,134 @@ async def serve_portrait(filename: str):
     
     return FileResponse(file_path, media_type="image/jpeg")
 
+async def qa_passages(question: str) -> Optional[List[str]]:
+    """Passages for a question about the active book: semantic hits merged with library BM25."""
+    lexical = await library_manager.retrieve_passages(state.book_id, question) if state.book_id else []
+    semantic = await asyncio.to_thread(embeddings.semantic_passages, state.full_text, question)
+    return merge_passages(semantic or [], lexical) or None
+
+def qa_lock(session_id: str) -> asyncio.Lock:
+    return state.qa_locks.setdefault(session_id, asyncio.Lock())
+
+async def load_qa_session(session_id: Optional[str]) -> Optional[dict]:
+    """The conversation for a Q&A request, or None for a one-off question."""
+    if not session_id:
+        return None
+    history = await library_manager.get_qa_session(session_id)
+    if not history:
+        raise HTTPException(status_code=404, detail="Q&A session not found")
+    if history["book_id"] != state.book_id:
+        raise HTTPException(status_code=409, detail="Q&A session belongs to another book")
+    return history
+
+async def compact_qa_session(session_id: str):
+    """
+    Background job: fold a session's older turns into its rolling summary.
+    The summary is written without holding the session lock, so follow-up
+    questions aren't held up; turns added meanwhile are kept on merge.
+    """
+    history = await library_manager.get_qa_session(session_id)
+    if not history or not needs_compaction(history):
+        return
+    try:
+        compacted = await compact_conversation(history)
+        async with qa_lock(session_id):
+            current = await library_manager.get_qa_session(session_id)
+            merged = merge_compaction(history, compacted, current) if current else None
+            if merged:
+                await library_manager.save_qa_session(session_id, merged)
+    except Exception as e:
+        print(f"⚠️ Q&A session compaction failed: {e}")
+
+@app.post("/api/qa/sessions")
+async def create_qa_session():
+    """Start a server-side conversation about the active book; pass its id as session_id to /api/qa."""
+    if not state.full_text or not state.book_id:
+        raise HTTPException(status_code=400, detail="No book uploaded")
+    return {"session_id": await library_manager.create_qa_session(state.book_id)}
+
+@app.get("/api/qa/sessions/{session_id}")
+async def get_qa_session(session_id: str):
+    history = await library_manager.get_qa_session(session_id)
+    if not history:
+        raise HTTPException(status_code=404, detail="Q&A session not found")
+    return history
+
+@app.delete("/api/qa/sessions/{session_id}")
+async def delete_qa_session(session_id: str):
+    if not await library_manager.delete_qa_session(session_id):
+        raise HTTPException(status_code=404, detail="Q&A session not found")
+    state.qa_locks.pop(session_id, None)
+    return {"status": "deleted"}
+
+def qa_error(e: Exception) -> HTTPException:
+    """HTTP error for a failed question: 503 when no provider is configured, else 500."""
+    if isinstance(e, NoProviderError):
+        return HTTPException(status_code=503, detail=str(e))
+    print(f"QA Error: {type(e).__name__} - {e}")
+    traceback.print_exc()
+    return HTTPException(status_code=500, detail="Question answering failed. Please try again.")
+
 @app.post("/api/qa")
-async def qa_endpoint(req: QARequest):
+async def qa_endpoint(req: QARequest, background_tasks: BackgroundTasks):
     if not state.full_text:
         raise HTTPException(status_code=400, detail="No book uploaded")
-    
-    try:
-        answer = ask_question(state.full_text, req.question)
-        return {"answer": answer}
-    except Exception as e:
-        print(f"QA Error: {type(e).__name__} - {e}")
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail="Question answering failed. Please try again.")
+    if not req.session_id:
+        try:
+            passages = await qa_passages(req.question)
+            answer = await ask_question(state.full_text, req.question, passages)
+            return {"answer": answer}
+        except Exception as e:
+            raise qa_error(e)
+
+    async with qa_lock(req.session_id):
+        history = await load_qa_session(req.session_id)
+        try:
+            passages = await qa_passages(retrieval_query(req.question, history))
+            answer = await ask_question(state.full_text, req.question, passages, history)
+        except Exception as e:
+            raise qa_error(e)  # Nothing is recorded: failures never become turns
+        history = record_turn(history, req.question, answer)
+        await library_manager.save_qa_session(req.session_id, history)
+    if needs_compaction(history):
+        background_tasks.add_task(compact_qa_session, req.session_id)
+    return {"answer": answer, "session_id": req.session_id}
+
+@app.get("/api/qa/stream")
+async def qa_stream_endpoint(question: str, background_tasks: BackgroundTasks, session_id: Optional[str] = None):
+    """
+    Server-sent events variant of /api/qa (usable with EventSource):
+    "data: {"token": ...}" per chunk of the answer, then "event: done",
+    or "event: error" if the provider fails mid-answer. With session_id the
+    completed answer is added to that conversation.
+    """
+    if not state.full_text:
+        raise HTTPException(status_code=400, detail="No book uploaded")
+    history = await load_qa_session(session_id)
+    passages = await qa_passages(retrieval_query(question, history))
+    full_text = state.full_text
+    if history:
+        background_tasks.add_task(compact_qa_session, session_id)
+
+    async def events():
+        parts = []
+        try:
+            async for token in ask_question_stream(full_text, question, passages, history):
+                parts.append(token)
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            if history:
+                async with qa_lock(session_id):
+                    latest = await library_manager.get_qa_session(session_id)
+                    if latest:
+                        await library_manager.save_qa_session(session_id, record_turn(latest, question, "".join(parts).strip()))
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"QA stream error: {type(e).__name__} - {e}")
+            detail = str(e) if isinstance(e, NoProviderError) else "Question answering failed. Please try again."
+            yield f"event: error\ndata: {json.dumps({'detail': detail})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/api/suggested_questions")
 async def suggested_questions_endpoint():
@@ -842,12 +1076,64 @@ async def suggested_questions_endpoint():
         return {"questions": []}
         
     try:
-        questions = suggest_questions(state.full_text)
+        pack = await library_manager.get_study_pack(state.book_id) if state.book_id else None
+        if pack and pack["questions"]:
+            return {"questions": pack["questions"]}
+        passages = await asyncio.to_thread(embeddings.representative_passages, state.full_text)
+        questions = await suggest_questions(state.full_text, passages)
         return {"questions": questions}
     except Exception as e:
         print(f"Suggested questions error: {e}")
         return {"questions": []}
 
+@app.get("/api/graph")
+async def get_graph(book_id: Optional[int] = None, chapter: Optional[int] = None, min_weight: int = 1):
+    """
+    Character relationship graph of a book (default: the active one):
+    nodes with mention counts and edges weighted by how often two entities
+    appear within a few paragraphs of each other. `chapter` restricts it to
+    one chapter. Built on first request if the book has none yet.
+    """
+    book_id = book_id or state.book_id
+    if not book_id:
+        raise HTTPException(status_code=400, detail="No book uploaded")
+    result = await library_manager.get_graph(book_id, chapter, min_weight)
+    if result is None:
+        if not await library_manager.update_graph(book_id):
+            raise HTTPException(status_code=404, detail="Book not found or not analyzed")
+        result = await library_manager.get_graph(book_id, chapter, min_weight)
+    return {"book_id": book_id, **result}
+
+@app.get("/api/study/{book_id}")
+async def get_study_pack(book_id: int):
+    """
+    A book's study pack (quiz, flashcards, suggested questions). Served from
+    the database once built; otherwise generation is queued (if not already
+    queued or running) and the job status is returned with 202.
+    """
+    pack = await library_manager.get_study_pack(book_id)
+    if pack:
+        return {"status": "ready", **pack}
+
+    if not study_pack_pending(book_id):
+        full_text = await library_manager.get_book_full_text(book_id)
+        if full_text is None:
+            raise HTTPException(status_code=404, detail="Book not found")
+        if not schedule_study_pack(book_id, full_text):
+            raise HTTPException(status_code=422, detail="Book has no text to study")
+    return JSONResponse(status_code=202, content=state.study_packs[book_id])
+
+@app.post("/api/study/{book_id}/regenerate")
+async def regenerate_study_pack(book_id: int):
+    if study_pack_pending(book_id):
+        raise HTTPException(status_code=409, detail="Study pack is already being generated")
+    full_text = await library_manager.get_book_full_text(book_id)
+    if full_text is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    if not schedule_study_pack(book_id, full_text):
+        raise HTTPException(status_code=422, detail="Book has no text to study")
+    return state.study_packs[book_id]
+
 @app.post("/api/generate/podcast")
 async def generate_podcast_endpoint(background_tasks: BackgroundTasks):
     if not state.full_text:
@@ -905,18 +1191,36 @@ async def generate_podcast_endpoint(background_tasks: BackgroundTasks):
                     "url": f"/api/assets/podcast/{filename}"
                 })
         
+        # 4. Merge segments into a single episode (one ranged request instead of N fetches)
+        episode = None
+        try:
+            episode_filename = f"podcast_episode_{int(time.time())}.mp3"
+            result = await assemble_episode(playlist, podcast_dir, os.path.join(podcast_dir, episode_filename))
+            episode = {
+                "url": f"/api/assets/podcast/{episode_filename}",
+                "peaks_url": f"/api/assets/podcast/{os.path.basename(result['peaks_path'])}",
+                "duration": result["duration"],
+                "segments": result["segments"]
+            }
+            state.podcast_episode_path = result["path"]
+        except Exception as e:
+            print(f"⚠️  Episode assembly failed, serving segments only: {e}")
+        
         print("="*50)
         print(f"✅ PODCAST GENERATION COMPLETE: {len(playlist)} segments")
         print("="*50)
         
         # Save to library
         if state.book_id:
-            library_manager.save_podcast(state.book_id, playlist)
+            await library_manager.save_podcast(state.book_id, playlist)
+            await track_assets(state.book_id, [seg["url"] for seg in playlist] + (
+                [episode["url"], episode["peaks_url"]] if episode else []
+            ))
             # Update in-memory state
             if state.analysis_result:
                 state.analysis_result["podcast"] = playlist
             
-        return {"playlist": playlist}
+        return {"playlist": playlist, "episode": episode}
     except HTTPException:
         raise
     except Exception as e:
@@ -944,46 +1248,92 @@ async def generate_podcast_endpoint(background_tasks: BackgroundTasks):
                 detail=f"Podcast generation failed: {str(e)[:100]}"
             )
 
-async def generate_scene_audios(scenes, output_dir, voice_id, provider):
-    """Helper to generate audio for all scenes sequentially."""
-    for i, scene in enumerate(scenes):
+def _scene_narration_text(scene):
+    """Build the narration text for an immersive scene (dict or plain string)."""
+    if isinstance(scene, dict):
+        text = f"{scene.get('narrator_intro', '')} {scene.get('excerpt', '')}".strip()
+        if not text:
+            text = scene.get('description', '') # Fallback
+        return text
+    return str(scene)
+
+async def generate_scene_audios(scenes, output_dir, voice_id, provider, status, book_id=None, job_id=None):
+    """
+    Helper to generate audio for all scenes concurrently.
+    Concurrency is bounded per provider inside generate_audio, and each
+    scene's entry in `status` (the job's own list) is updated as it finishes.
+    The book's older job directories are removed once this job is done.
+    """
+    async def generate_one(i, scene):
+        entry = status[i]
+        entry["status"] = "generating"
         try:
-            # Handle both dict and string formats
-            if isinstance(scene, dict):
-                text = f"{scene.get('narrator_intro', '')} {scene.get('excerpt', '')}".strip()
-                if not text:
-                    text = scene.get('description', '') # Fallback
-            else:
-                text = str(scene)
-            
-            filename = f"immersive_scene_{i+1:02d}.mp3"
-            output_path = os.path.join(output_dir, filename)
-            
             print(f"Generating immersive audio for scene {i+1}...")
-            await generate_audio_service(
-                text, 
-                output_path, 
+            await generate_audio_file(
+                _scene_narration_text(scene),
+                os.path.join(output_dir, entry["filename"]),
                 voice_id=voice_id,
                 provider=provider
             )
+            entry["status"] = "ready"
         except Exception as e:
+            entry["status"] = "failed"
+            entry["error"] = str(e)[:200]
             print(f"Failed to generate audio for scene {i+1}: {e}")
 
+    await asyncio.gather(*(generate_one(i, scene) for i, scene in enumerate(scenes)))
+    ready = sum(1 for entry in status if entry["status"] == "ready")
+    print(f"✅ Immersive audio complete: {ready}/{len(scenes)} scenes")
+    await remove_previous_immersive_jobs(book_id, job_id)
+
+async def remove_previous_immersive_jobs(book_id: Optional[int], job_id: str):
+    """
+    Once a book's latest immersive audio job finishes, delete the book's
+    older job directories (including ones left from before a restart).
+    """
+    job = state.immersive_audio.get(book_id)
+    if not job or job["job_id"] != job_id:
+        return  # A newer job exists; it cleans up when it finishes
+    root = os.path.join(UPLOAD_DIR, "immersive_audio")
+    prefix = f"{book_id or 0}_"
+    stale = [
+        os.path.join(root, name) for name in os.listdir(root)
+        if name.startswith(prefix) and name != job_id and os.path.isdir(os.path.join(root, name))
+    ]
+    if not stale:
+        return
+    if book_id:
+        await library_manager.release_assets(book_id, stale)
+    for path in stale:
+        await asyncio.to_thread(shutil.rmtree, path, True)
+    print(f"🧹 Removed {len(stale)} older immersive audio jobs for book {book_id or '-'}")
+
 @app.post("/api/generate/immersive_audio")
 async def generate_immersive_audio(req: ImmersiveAudioRequest, background_tasks: BackgroundTasks):
     if not state.analysis_result or not state.analysis_result.get("scenes"):
         raise HTTPException(status_code=400, detail="No scenes available. Analyze book first.")
         
     try:
-        immersive_dir = os.path.join(UPLOAD_DIR, "immersive_audio")
+        # Each request writes to its own directory, so concurrent jobs (same or
+        # different books) never overwrite each other's files or status
+        job_id = f"{state.book_id or 0}_{uuid.uuid4().hex[:8]}"
+        immersive_dir = os.path.join(UPLOAD_DIR, "immersive_audio", job_id)
         os.makedirs(immersive_dir, exist_ok=True)
         
         scenes = state.analysis_result.get("scenes", [])
         expected_audio = []
+        status = []
         
         for i in range(len(scenes)):
             filename = f"immersive_scene_{i+1:02d}.mp3"
-            expected_audio.append(f"/api/assets/immersive_audio/{filename}")
+            url = f"/api/assets/immersive_audio/{job_id}/{filename}"
+            expected_audio.append(url)
+            status.append({
+                "scene": i + 1,
+                "filename": filename,
+                "url": url,
+                "status": "pending"
+            })
             
         # Start background generation
         background_tasks.add_task(
@@ -991,21 +1341,118 @@ async def generate_immersive_audio(req: ImmersiveAudioRequest, background_tasks:
             scenes, 
             immersive_dir, 
             req.voice_id, 
-            req.provider
+            req.provider,
+            status,
+            state.book_id,
+            job_id
         )
         
         # Track expected paths for download (best effort, actual files checked at download time)
-        state.immersive_audio_paths = [os.path.join(immersive_dir, os.path.basename(url)) for url in expected_audio]
+        paths = [os.path.join(immersive_dir, entry["filename"]) for entry in status]
+        state.immersive_audio[state.book_id] = {"job_id": job_id, "scenes": status, "paths": paths}
+        await track_assets(state.book_id, [immersive_dir])
         
-        return {"audio_urls": expected_audio, "status": "generating"}
+        return {"job_id": job_id, "audio_urls": expected_audio, "status": "generating", "scenes": status}
     except Exception as e:
         print(f"Immersive audio error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/immersive_audio/status")
+async def immersive_audio_status(book_id: Optional[int] = None):
+    """Per-scene progress of the latest immersive audio generation for a book (default: the current one)."""
+    job = state.immersive_audio.get(book_id if book_id is not None else state.book_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No immersive audio generated for this book")
+    scenes = job["scenes"]
+    done = all(entry["status"] in ("ready", "failed") for entry in scenes)
+    return {
+        "job_id": job["job_id"],
+        "status": "complete" if done else "generating",
+        "ready": sum(1 for entry in scenes if entry["status"] == "ready"),
+        "total": len(scenes),
+        "scenes": scenes
+    }
+
+class AudiobookExportRequest(BaseModel):
+    voice_id: str = "21m00Tcm4TlvDq8ikWAM"
+    provider: str = "deepgram"
+
+async def run_audiobook_export(text, output_dir, title, author, voice_id, provider):
+    """Background job: export the full audiobook and record progress in state."""
+    job = state.audiobook_export
+    chapter_status = {}
+
+    def on_progress(chapter):
+        chapter_status[chapter["index"]] = chapter["status"]
+        job["chapters_ready"] = sum(1 for s in chapter_status.values() if s == "ready")
+        job["chapters_failed"] = sum(1 for s in chapter_status.values() if s == "failed")
+
+    try:
+        result = await export_audiobook(
+            text, output_dir, book_title=title, author=author,
+            voice_id=voice_id, provider=provider, progress_callback=on_progress
+        )
+        export_rel = os.path.relpath(output_dir, UPLOAD_DIR).replace(os.sep, "/")
+        job["chapters"] = [
+            {
+                "index": c["index"],
+                "title": c["title"],
+                "status": c["status"],
+                "start": c.get("start"),
+                "duration": c.get("duration"),
+                "url": f"/api/assets/{export_rel}/{os.path.basename(c['mp3_path'])}" if c["status"] == "ready" else None
+            }
+            for c in result["chapters"]
+        ]
+        if result["m4b_path"]:
+            job["m4b_url"] = f"/api/assets/{export_rel}/{os.path.basename(result['m4b_path'])}"
+        job["missing_chapters"] = result["missing_chapters"]
+        job["status"] = result["status"]
+    except Exception as e:
+        print(f"❌ Audiobook export failed: {e}")
+        traceback.print_exc()
+        job["status"] = "failed"
+        job["error"] = str(e)[:200]
+
+@app.post("/api/export/audiobook")
+async def export_audiobook_endpoint(req: AudiobookExportRequest, background_tasks: BackgroundTasks):
+    """Start a full-length audiobook export (chapter MP3s + M4B) in the background."""
+    if not state.full_text:
+        raise HTTPException(status_code=400, detail="No book uploaded")
+    if state.audiobook_export and state.audiobook_export.get("status") == "running":
+        raise HTTPException(status_code=409, detail="An audiobook export is already running")
+
+    title = (state.ingestion_result or {}).get("title") or "Untitled"
+    author = (state.ingestion_result or {}).get("author") or "Unknown Author"
+    export_id = state.book_id or int(time.time())
+    output_dir = os.path.join(UPLOAD_DIR, "audiobook_export", str(export_id))
+
+    state.audiobook_export = {
+        "status": "running",
+        "chapters_ready": 0,
+        "chapters_failed": 0,
+        "chapters": [],
+        "missing_chapters": [],
+        "m4b_url": None
+    }
+    await track_assets(state.book_id, [output_dir])
+    background_tasks.add_task(
+        run_audiobook_export, state.full_text, output_dir, title, author, req.voice_id, req.provider
+    )
+    return {"status": "running"}
+
+@app.get("/api/export/audiobook/status")
+async def export_audiobook_status():
+    """Progress and download URLs of the current audiobook export."""
+    if not state.audiobook_export:
+        raise HTTPException(status_code=404, detail="No audiobook export started")
+    return state.audiobook_export
+
 class VideoRequest(BaseModel):
     image_filename: str
     prompt: str = ""
     duration: int = 5
+    scene_index: Optional[int] = None  # 0-based scene; its description is the default prompt
 
 @app.post("/api/generate/scene_video")
 async def generate_scene_video(req: VideoRequest):
@@ -1022,10 +1469,17 @@ async def generate_scene_video(req: VideoRequest):
         videos_dir = os.path.join(OUTPUT_DIR, state.ingestion_result.get("book_id", "latest"), "videos")
         os.makedirs(videos_dir, exist_ok=True)
         
+        # Without a prompt, animate the scene as described (one scene row, not the whole analysis)
+        prompt = req.prompt
+        if not prompt and req.scene_index is not None and state.book_id:
+            scene = await library_manager.get_scene(state.book_id, req.scene_index)
+            if isinstance(scene, dict) and scene.get("description"):
+                prompt = f"Animate this scene with subtle movements: {scene['description']}"
+        
         # Generate video
         video_path = await generate_video_with_deapi(
             image_path=image_path,
-            prompt=req.prompt or "Animate this scene with subtle movements",
+            prompt=prompt or "Animate this scene with subtle movements",
             output_dir=videos_dir,
             duration=req.duration
         )
@@ -1071,8 +1525,10 @@ async def download_all_content():
         if state.audiobook_path and os.path.exists(state.audiobook_path):
             files_to_zip.append(state.audiobook_path)
             
-        # 4. Podcast
-        if state.analysis_result and state.analysis_result.get("podcast"):
+        # 4. Podcast (merged episode if available, else individual segments)
+        if state.podcast_episode_path and os.path.exists(state.podcast_episode_path):
+            files_to_zip.append(state.podcast_episode_path)
+        elif state.analysis_result and state.analysis_result.get("podcast"):
             podcast = state.analysis_result.get("podcast")
             for seg in podcast:
                 url = seg.get("url", "")
@@ -1084,14 +1540,15 @@ async def download_all_content():
                         files_to_zip.append(path)
                         
         # 5. Immersive Audio
-        if state.immersive_audio_paths:
-            for path in state.immersive_audio_paths:
+        immersive = state.immersive_audio.get(state.book_id)
+        if immersive:
+            for path in immersive["paths"]:
                 if os.path.exists(path):
                     files_to_zip.append(path)
         
         # 6. Cover/Poster
         if state.book_id:
-            book = library_manager.get_book(state.book_id)
+            book = await library_manager.get_book(state.book_id)
             if book and book.get("thumbnail"):
                 # Thumbnail path is relative "visuals/filename.jpg"
                 thumb_path = os.path.join(UPLOAD_DIR, book["thumbnail"])
@@ -1126,25 +1583,144 @@ async def download_all_content():
 async def get_library():
     """Get all books in the library."""
     try:
-        return {"books": library_manager.get_books()}
+        return {"books": await library_manager.get_books()}
     except Exception as e:
         print(f"❌ Library fetch error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Failed to fetch library")
 
+@app.get("/api/library/search")
+async def search_library(q: str, limit: int = 20):
+    """Full-text search across the library, ranked with highlighted snippets."""
+    if not q.strip():
+        return {"query": q, "results": []}
+    try:
+        results = await library_manager.search_books(q, limit=max(1, limit))
+        return {"query": q, "results": results}
+    except Exception as e:
+        print(f"❌ Library search error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Search failed")
+
+@app.get("/api/library/characters/{name}")
+async def books_with_character(name: str):
+    """Books whose analysis includes a character with this name."""
+    return {"name": name, "books": await library_manager.find_books_with_entity(name)}
+
+async def run_asset_gc(dry_run: bool = False):
+    """Background job: reclaim generated files no book references any more."""
+    state.asset_gc = {"status": "running", "dry_run": dry_run, "started_at": time.time()}
+    try:
+        result = await library_manager.collect_garbage(dry_run=dry_run)
+        state.asset_gc.update(status="complete", result=result)
+    except Exception as e:
+        print(f"❌ Asset GC failed: {e}")
+        traceback.print_exc()
+        state.asset_gc.update(status="failed", error=str(e)[:200])
+    state.asset_gc["finished_at"] = time.time()
+
+def schedule_asset_gc(background_tasks: BackgroundTasks) -> bool:
+    if state.asset_gc and state.asset_gc.get("status") == "running":
+        return False
+    background_tasks.add_task(run_asset_gc)
+    return True
+
 @app.delete("/api/library/{book_id}")
-async def delete_book(book_id: int):
+async def delete_book(book_id: int, background_tasks: BackgroundTasks):
     """Delete a book from the library."""
-    success = library_manager.delete_book(book_id)
+    success = await library_manager.delete_book(book_id)
     if not success:
         raise HTTPException(status_code=404, detail="Book not found")
+    schedule_asset_gc(background_tasks)
     return {"message": "Book deleted successfully"}
 
+class BulkDeleteRequest(BaseModel):
+    book_ids: List[int]
+
+@app.post("/api/library/delete")
+async def delete_books(req: BulkDeleteRequest, background_tasks: BackgroundTasks):
+    """Delete several books at once; their unreferenced assets are reclaimed in the background."""
+    deleted = await library_manager.delete_books(req.book_ids)
+    if deleted:
+        schedule_asset_gc(background_tasks)
+    return {"deleted": deleted, "not_found": [i for i in req.book_ids if i not in deleted]}
+
+@app.post("/api/library/gc")
+async def start_asset_gc(background_tasks: BackgroundTasks, dry_run: bool = False):
+    """Start asset garbage collection (dry_run only reports what would be freed)."""
+    if state.asset_gc and state.asset_gc.get("status") == "running":
+        raise HTTPException(status_code=409, detail="Asset GC is already running")
+    background_tasks.add_task(run_asset_gc, dry_run)
+    return {"status": "running", "dry_run": dry_run}
+
+@app.get("/api/library/storage")
+async def library_storage():
+    """Disk usage of the upload directory and the last asset GC run."""
+    usage = await library_manager.disk_usage()
+    return {"usage": usage, "gc": state.asset_gc}
+
+async def run_bulk_import(archive_path: str, analyze: bool):
+    """Background job: import every book in an uploaded zip, tracking per-file progress."""
+    job = state.bulk_import
+    files = {}
+
+    def on_progress(entry):
+        files[id(entry)] = entry
+        job["files"] = list(files.values())
+        job["counts"] = {}
+        for item in job["files"]:
+            job["counts"][item["status"]] = job["counts"].get(item["status"], 0) + 1
+
+    try:
+        result = await bulk_import(archive_path, library_manager.sync, analyze=analyze, progress_callback=on_progress)
+        job.update(status="complete", files=result["files"], counts=result["counts"])
+    except Exception as e:
+        print(f"❌ Bulk import failed: {e}")
+        traceback.print_exc()
+        job.update(status="failed", error=str(e)[:200])
+    finally:
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+
+@app.post("/api/library/import")
+async def import_library(background_tasks: BackgroundTasks, file: UploadFile = File(...), analyze: bool = Form(True)):
+    """Bulk import a zip of PDF/EPUB/TXT books; progress via /api/library/import/status."""
+    if state.bulk_import and state.bulk_import.get("status") == "running":
+        raise HTTPException(status_code=409, detail="A bulk import is already running")
+    if Path(file.filename or "").suffix.lower() != ".zip":
+        raise HTTPException(status_code=400, detail="Bulk import expects a .zip archive")
+
+    import_dir = os.path.join(UPLOAD_DIR, "imports")
+    os.makedirs(import_dir, exist_ok=True)
+    archive_path = os.path.join(import_dir, f"import_{int(time.time())}.zip")
+
+    total_size = 0
+    max_size_bytes = MAX_IMPORT_SIZE_MB * 1024 * 1024
+    async with aiofiles.open(archive_path, "wb") as buffer:
+        while chunk := await file.read(1024 * 1024):
+            total_size += len(chunk)
+            if total_size > max_size_bytes:
+                await buffer.close()
+                os.remove(archive_path)
+                raise HTTPException(status_code=413, detail=f"Archive too large. Maximum size: {MAX_IMPORT_SIZE_MB}MB")
+            await buffer.write(chunk)
+
+    state.bulk_import = {"status": "running", "started_at": time.time(), "files": [], "counts": {}}
+    background_tasks.add_task(run_bulk_import, archive_path, analyze)
+    return {"status": "running"}
+
+@app.get("/api/library/import/status")
+async def import_library_status():
+    """Per-file progress of the current bulk import."""
+    if not state.bulk_import:
+        raise HTTPException(status_code=404, detail="No bulk import started")
+    return state.bulk_import
+
 @app.post("/api/library/load/{book_id}")
-async def load_book(book_id: int):
+async def load_book(book_id: int, background_tasks: BackgroundTasks):
     """Load a book from the library into active state."""
     state.book_id = book_id
-    book = library_manager.get_book(book_id)
+    book = await library_manager.get_book(book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
     
@@ -1153,13 +1729,13 @@ async def load_book(book_id: int):
     
     if not os.path.exists(file_path):
         # Clean up if file is missing
-        library_manager.delete_book(book_id)
+        await library_manager.delete_book(book_id)
         raise HTTPException(status_code=404, detail="Book file not found on server")
     
     try:
         # Try to load from DB first
-        full_text = library_manager.get_book_full_text(book_id)
-        analysis = library_manager.get_analysis(book_id)
+        full_text = await library_manager.get_book_full_text(book_id)
+        analysis = await library_manager.get_analysis(book_id)
         
         if full_text and analysis:
             print(f"✅ Loaded book from DB: {book['title']}")
@@ -1188,8 +1764,12 @@ async def load_book(book_id: int):
             state.analysis_result = analysis
             
             # Save back to DB for next time
-            library_manager.add_book(book, full_text=state.full_text) # Update text
-            library_manager.save_analysis(book_id, analysis)
+            await library_manager.add_book(book, full_text=state.full_text) # Update text
+            await library_manager.save_analysis(book_id, analysis)
+        spawn_job(build_embeddings_background(book_id, state.full_text))
+        spawn_job(build_graph_background(book_id))
+        if not await library_manager.get_study_pack(book_id):
+            schedule_study_pack(book_id, state.full_text)
         
         return {
             "message": "Book loaded successfully",
@@ -1252,6 +1832,7 @@ async def generate_storybook_api(config: StorybookConfig = None):
         book_id = state.ingestion_result.get("book_id", "storybook")
         output_dir = os.path.join(UPLOAD_DIR, "storybook", book_id)
         os.makedirs(output_dir, exist_ok=True)
+        await track_assets(state.book_id, [output_dir])
         
         # Get existing entities if available
         existing_entities = state.ingestion_result.get("entities", [])
@@ -0,0 +1,179 @@
+import asyncio
+import pytest
+import src.audio as audio
+import src.podcast as podcast
+from src.provider_health import HealthRegistry
+
+
+@pytest.fixture(autouse=True)
+def fresh_tts(monkeypatch):
+    monkeypatch.setattr(audio, "tts_health", HealthRegistry(["deepgram", "elevenlabs", "inbuilt"]))
+    monkeypatch.setattr(audio, "_provider_semaphores", {})
+    monkeypatch.setattr(audio, "DEEPGRAM_API_KEY", "test-key")
+
+
+def test_failed_provider_falls_over_to_edge_tts(tmp_path, monkeypatch):
+    async def deepgram(text, output_path, *args, **kwargs):
+        raise Exception("Deepgram API Error: 429 - Too Many Requests")
+
+    async def edge(text, output_path, *args, **kwargs):
+        with open(output_path, "wb") as f:
+            f.write(b"edge audio")
+        return output_path
+
+    monkeypatch.setattr(audio, "generate_audio_deepgram", deepgram)
+    monkeypatch.setattr(audio, "generate_audio_edge", edge)
+
+    output = tmp_path / "scene_01.mp3"
+    assert asyncio.run(audio.generate_audio_file("Call me Ishmael.", str(output), provider="deepgram")) == str(output)
+    assert output.read_bytes() == b"edge audio"
+    assert audio.tts_health.get("deepgram").rate_limited_count() == 1
+    assert list(tmp_path.iterdir()) == [output]
+
+
+def test_concurrency_is_bounded_by_the_provider_actually_called(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio, "PROVIDER_CONCURRENCY", {"deepgram": 6, "inbuilt": 2})
+    for _ in range(3):
+        audio.tts_health.get("deepgram").record_failure(1.0)  # Breaker open: routed to Edge TTS
+    in_flight = []
+    peak = []
+
+    async def edge(text, output_path, *args, **kwargs):
+        in_flight.append(output_path)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(output_path)
+        with open(output_path, "wb") as f:
+            f.write(b"edge audio")
+        return output_path
+
+    monkeypatch.setattr(audio, "generate_audio_edge", edge)
+
+    async def generate_all():
+        await asyncio.gather(*(
+            audio.generate_audio_file("Scene.", str(tmp_path / f"scene_{i:02d}.mp3"), provider="deepgram")
+            for i in range(8)
+        ))
+
+    asyncio.run(generate_all())
+    assert max(peak) == 2
+    assert len(list(tmp_path.iterdir())) == 8
+
+
+def test_failed_generation_keeps_the_previous_file(tmp_path, monkeypatch):
+    async def broken(text, output_path, *args, **kwargs):
+        with open(output_path, "wb") as f:
+            f.write(b"half written")
+        raise Exception("connection reset")
+
+    monkeypatch.setattr(audio, "generate_audio_deepgram", broken)
+    monkeypatch.setattr(audio, "generate_audio_edge", broken)
+
+    output = tmp_path / "scene_01.mp3"
+    output.write_bytes(b"previous audio")
+    with pytest.raises(Exception, match="after 1 attempts"):
+        asyncio.run(audio.generate_audio_file("Scene.", str(output), retries=0, provider="deepgram"))
+
+    assert output.read_bytes() == b"previous audio"
+    assert list(tmp_path.iterdir()) == [output]
+
+
+def test_episode_offsets_and_chapters_with_crossfade(tmp_path, monkeypatch):
+    playlist = []
+    for i, speaker in enumerate(["Jax", "Emma", "Jax"]):
+        (tmp_path / f"segment_{i}.mp3").write_bytes(b"mp3")
+        playlist.append({"speaker": speaker, "text": f"Line {i}", "url": f"/api/assets/podcast/segment_{i}.mp3"})
+    playlist.append({"speaker": "Emma", "text": "Never generated", "url": "/api/assets/podcast/missing.mp3"})
+    ffmpeg_calls = []
+
+    async def duration(path):
+        return 10.0
+
+    async def ffmpeg(args):
+        ffmpeg_calls.append(args)
+        with open(f"{output}.ffmeta") as f:
+            ffmpeg_calls.append(f.read())
+        with open(args[-1], "wb") as f:
+            f.write(b"episode")
+
+    async def peaks(path):
+        return [0.5]
+
+    monkeypatch.setattr(podcast, "probe_duration", duration)
+    monkeypatch.setattr(podcast, "run_ffmpeg", ffmpeg)
+    monkeypatch.setattr(podcast, "compute_peaks", peaks)
+
+    output = tmp_path / "episode.mp3"
+    result = asyncio.run(podcast.assemble_episode(playlist, str(tmp_path), str(output), crossfade_ms=2000))
+
+    assert [(s["start"], s["end"]) for s in result["segments"]] == [(0.0, 10.0), (8.0, 18.0), (16.0, 26.0)]
+    assert result["duration"] == 26.0
+    assert "acrossfade=d=2.000" in ffmpeg_calls[0][ffmpeg_calls[0].index("-filter_complex") + 1]
+    assert "START=8000\nEND=16000\ntitle=Emma: Line 1" in ffmpeg_calls[1]
+    assert output.read_bytes() == b"episode"
+    assert not (tmp_path / "episode.mp3.part").exists()
+
+
+def test_failed_episode_assembly_leaves_no_output(tmp_path, monkeypatch):
+    (tmp_path / "segment_0.mp3").write_bytes(b"mp3")
+    playlist = [{"speaker": "Jax", "text": "Hi", "url": "/api/assets/podcast/segment_0.mp3"}]
+
+    async def duration(path):
+        return 5.0
+
+    async def ffmpeg(args):
+        with open(args[-1], "wb") as f:
+            f.write(b"partial")
+        raise RuntimeError("ffmpeg failed")
+
+    monkeypatch.setattr(podcast, "probe_duration", duration)
+    monkeypatch.setattr(podcast, "run_ffmpeg", ffmpeg)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(podcast.assemble_episode(playlist, str(tmp_path), str(tmp_path / "episode.mp3")))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["segment_0.mp3"]
+
+
+def test_narration_prep_shares_one_client_and_keeps_chunk_order(monkeypatch):
+    monkeypatch.setattr(audio, "_narration_cache", audio.OrderedDict())
+    monkeypatch.setattr(audio, "NARRATION_CHUNK_CHARS", 300)
+    clients = []
+    models = []
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    class Models:
+        def generate_content(self, model, contents):
+            models.append(model)
+            chunk = contents.split("<<")[1].split(">>")[0]
+            if chunk.startswith("Chapter 2"):
+                raise Exception("500 Internal error")
+            return Response(f"Narrated: {chunk}")
+
+    class Client:
+        models = Models()
+
+    def fake_model(capability="text", api_key=None):
+        clients.append(capability)
+        return Client(), "gemini-test"
+
+    monkeypatch.setattr(audio, "get_gemini_model", fake_model)
+    monkeypatch.setattr("src.prompts.AUDIOBOOK_NARRATOR_PROMPT", "<<{text}>> {book_title} {author} {bookends}")
+
+    text = "\n\n".join(f"Chapter {i}. " + "The sea rolled on as it rolled five thousand years ago. " * 4 for i in range(1, 4))
+    result = asyncio.run(audio.prepare_audiobook_text(text, "Moby Dick", "Herman Melville"))
+
+    assert clients == ["text"]
+    assert set(models) == {"gemini-test"}
+    parts = result.split("\n\n... ")
+    assert [p.startswith("Narrated: Chapter 1") for p in parts] == [True, False, False]
+    assert parts[1].startswith("Chapter two...")  # Rule-based fallback for the failed chunk
+    assert parts[2].startswith("Narrated: Chapter 3")
+
+
+def test_professional_narration_keeps_its_outro_by_default():
+    text = "Call me Ishmael. Some years ago I went to sea."
+    assert audio.format_for_professional_narration(text).endswith("Thank you for listening.")
+    assert not audio.format_for_professional_narration(text, include_outro=False).endswith("Thank you for listening.")
@@ -0,0 +1,49 @@
+import os
+import asyncio
+import src.audiobook as audiobook
+
+
+def test_failed_chapter_cancels_its_parts_and_marks_export_partial(tmp_path, monkeypatch):
+    long_paragraph = "The whale surfaced again. " * 80
+    text = (
+        "CHAPTER ONE\nCall me Ishmael.\n"
+        f"CHAPTER TWO\n{long_paragraph}\n\n{long_paragraph}\n\n{long_paragraph}\n"
+    )
+    cancelled = []
+
+    async def fake_tts(chunk, output_path, **kwargs):
+        if "Ishmael" in chunk:
+            open(output_path, "wb").close()
+            return output_path
+        if "_part_000" in output_path:
+            raise RuntimeError("TTS quota exceeded")
+        open(output_path, "wb").close()
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            # Sibling part is stopped before the chapter's cleanup runs
+            cancelled.append(os.path.exists(output_path))
+            raise
+        return output_path
+
+    async def fake_encode(parts, mp3_path, aac_path, *args):
+        open(mp3_path, "wb").close()
+        open(aac_path, "wb").close()
+
+    async def fake_package(chapters, output_path, *args):
+        open(output_path, "wb").close()
+        return output_path
+
+    monkeypatch.setattr(audiobook, "generate_audio_file", fake_tts)
+    monkeypatch.setattr(audiobook, "_encode_chapter", fake_encode)
+    monkeypatch.setattr(audiobook, "_package_m4b", fake_package)
+
+    result = asyncio.run(audiobook.export_audiobook(text, str(tmp_path), book_title="Moby Dick"))
+
+    assert cancelled == [True, True]
+    assert result["status"] == "partial"
+    assert result["missing_chapters"] == [2]
+    assert os.path.basename(result["m4b_path"]) == "Moby_Dick_partial.m4b"
+    assert [c["status"] for c in result["chapters"]] == ["ready", "failed"]
+    assert "quota" in result["chapters"][1]["error"]
+    assert not os.path.exists(tmp_path / "parts")
@@ -0,0 +1,39 @@
+import zlib
+import numpy as np
+import src.embeddings as embeddings
+from src.embeddings import Embedder, build_index, load_index, cosine_top_k, semantic_passages, representative_passages
+
+
+def bag_of_words(batch):
+    # Deterministic stand-in for a real model: hashed word counts
+    vectors = np.zeros((len(batch), 64), dtype=np.float32)
+    for row, passage in enumerate(batch):
+        for word in passage.lower().split():
+            vectors[row, zlib.crc32(word.strip(".,?").encode()) % 64] += 1
+    return vectors
+
+
+def test_cosine_top_k_matches_brute_force(monkeypatch):
+    monkeypatch.setattr(embeddings, "SCORE_BLOCK_ROWS", 7)
+    rng = np.random.default_rng(0)
+    matrix = embeddings._normalize(rng.normal(size=(50, 16))).astype(np.float16)
+    query = embeddings._normalize(rng.normal(size=16))
+    expected = np.argsort(-(matrix.astype(np.float32) @ query))[:5]
+    assert [i for i, _ in cosine_top_k(matrix, query, 5)] == list(expected)
+
+
+def test_index_is_memory_mapped_and_queried(tmp_path, monkeypatch):
+    embedder = Embedder("bow", bag_of_words)
+    monkeypatch.setattr(embeddings, "_embedder", embedder)
+    body = "".join(f"Chapter {i}. The crew sailed on and on across the grey sea. " * 20 + "\n\n" for i in range(10))
+    body += "Queequeg polished his harpoon beside the tryworks."
+
+    path = build_index(body, str(tmp_path))
+    assert build_index(body, str(tmp_path)) == path  # reused, not re-embedded
+    matrix = load_index(body, str(tmp_path))
+    assert isinstance(matrix, np.memmap) and matrix.dtype == np.float16
+
+    passages = semantic_passages(body, "Queequeg harpoon", k=1, directory=str(tmp_path))
+    assert "harpoon" in passages[0]
+    assert len(representative_passages(body, k=3, directory=str(tmp_path))) == 3
+    assert semantic_passages("unindexed text", "harpoon", directory=str(tmp_path)) is None
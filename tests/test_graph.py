@@ -0,0 +1,35 @@
+from src.graph import chapter_graphs, count_chapter, entity_names, name_aliases, name_pattern
+
+
+def test_cooccurrence_uses_aliases_and_a_paragraph_window():
+    aliases = name_aliases(entity_names([["Elizabeth Bennet", "Character"], "Mr. Darcy", {"name": "Jane Bennet"}, "Wickham"]))
+    assert aliases["Elizabeth"] == "Elizabeth Bennet"
+    assert "Bennet" not in aliases  # Shared surname is ambiguous
+
+    chapter = "\n\n".join([
+        "Elizabeth laughed at Darcy's pride.",
+        "Jane Bennet wrote a letter.",
+        "Nothing happened.",
+        "Nothing happened again.",
+        "Wickham arrived, and Elizabeth listened.",
+    ])
+    mentions, edges = count_chapter(chapter, name_pattern(aliases), aliases, window=3)
+    assert mentions == {"Elizabeth Bennet": 2, "Darcy": 1, "Jane Bennet": 1, "Wickham": 1}
+    assert edges[("Darcy", "Elizabeth Bennet")] == 1
+    assert edges[("Darcy", "Jane Bennet")] == 1  # One paragraph apart, inside the window
+    assert ("Jane Bennet", "Wickham") not in edges  # Three paragraphs apart
+    assert edges[("Elizabeth Bennet", "Wickham")] == 1
+
+
+def test_only_changed_chapters_are_recounted():
+    text = "CHAPTER ONE\nAhab met Starbuck.\nCHAPTER TWO\nStarbuck met Stubb.\n"
+    entities = [["Ahab", "Captain", ""], ["Starbuck", "Mate", ""], ["Stubb", "Mate", ""]]
+    first = chapter_graphs(text, entities)
+    known = {c["position"]: c["digest"] for c in first}
+
+    edited = text.replace("Stubb.", "Stubb and Ahab.")
+    second = chapter_graphs(edited, entities, known)
+    assert [c["changed"] for c in second] == [False, True]
+    assert second[1]["edges"] == {("Ahab", "Starbuck"): 1, ("Ahab", "Stubb"): 1, ("Starbuck", "Stubb"): 1}
+
+    assert all(c["changed"] for c in chapter_graphs(text, entities[:2], known))  # New entity set
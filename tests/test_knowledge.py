@@ -0,0 +1,168 @@
+import time
+import asyncio
+import pytest
+import src.knowledge as knowledge
+from src.provider_health import HealthRegistry
+
+
+@pytest.fixture(autouse=True)
+def fresh_health(monkeypatch):
+    monkeypatch.setattr(knowledge, "llm_health", HealthRegistry(["deepseek", "gemini"]))
+
+
+def test_slow_provider_is_hedged_and_cancelled():
+    cancelled = []
+
+    async def slow(prompt):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "slow"
+
+    async def fast(prompt):
+        await asyncio.sleep(0.01)
+        return "fast"
+
+    start = time.monotonic()
+    result = asyncio.run(knowledge.complete("q", [("deepseek", slow), ("gemini", fast)], hedge_delay=0.05))
+    assert result == "fast"
+    assert time.monotonic() - start < 1
+    assert cancelled == [True]
+    assert not knowledge.llm_health.get("deepseek").calls  # Lost the race, not recorded as a failure
+
+
+def test_failure_falls_over_immediately_and_all_failing_raises():
+    async def broken(prompt):
+        raise Exception("429 quota exceeded")
+
+    async def ok(prompt):
+        return "answer"
+
+    result = asyncio.run(knowledge.complete("q", [("deepseek", broken), ("gemini", ok)], hedge_delay=10))
+    assert result == "answer"
+    assert knowledge.llm_health.get("deepseek").rate_limited_count() == 1
+
+    with pytest.raises(Exception, match="quota"):
+        asyncio.run(knowledge.complete("q", [("deepseek", broken)], hedge_delay=10))
+
+
+def test_stream_falls_over_before_first_token_and_caches(monkeypatch):
+    async def broken(prompt):
+        raise Exception("503")
+        yield
+
+    async def tokens(prompt):
+        for token in ["Ahab ", "was ", "drunk."]:
+            yield token
+
+    monkeypatch.setattr(knowledge, "_answer_cache", knowledge.OrderedDict())
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    monkeypatch.setattr(knowledge, "STREAMING_PROVIDERS", {"gemini": tokens})
+
+    async def collect(stream):
+        return [token async for token in stream]
+
+    passages = ["Captain Ahab was drunk on revenge."]
+    assert asyncio.run(collect(knowledge.stream_completion("q", [("deepseek", broken), ("gemini", tokens)]))) == ["Ahab ", "was ", "drunk."]
+    assert asyncio.run(collect(knowledge.ask_question_stream("", "Who was drunk?", passages))) == ["Ahab ", "was ", "drunk."]
+    # Same question (modulo case/spacing) and passages: served whole from the cache
+    assert asyncio.run(knowledge.ask_question("", "who  was drunk?", passages)) == "Ahab was drunk."
+
+
+def test_study_pack_samples_whole_book_offline(monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    body = "".join(f"CHAPTER {i}\nIn chapter {i} the whale is a leviathan. " + "Waves rolled. " * 200 + "\n" for i in range(1, 41))
+
+    sample = knowledge.sample_chapters(body, max_chars=6000)
+    assert len(sample) <= 6000 + 100
+    assert sample.count("In chapter") == 10  # Evenly spaced: 1, 5, ..., 37
+    assert "chapter 1 " in sample and "chapter 37 " in sample
+
+    pack = asyncio.run(knowledge.build_study_pack(body))
+    assert len(pack["flashcards"]) == knowledge.STUDY_FLASHCARDS
+    assert all(card["back"] == "leviathan" for card in pack["flashcards"])
+    assert pack["questions"] == list(knowledge.DEFAULT_QUESTIONS)
+
+
+def test_session_prompt_fits_budget_and_folds_old_turns(monkeypatch):
+    passages = [f"Passage {i} " + "x" * 1190 for i in range(6)]  # ~300 tokens each
+    history = {"summary": "The user asked who Ahab is.", "turns": [{"q": f"Q{i}?", "a": "A" * 400} for i in range(8)]}
+
+    kept, turns = knowledge.fit_conversation(passages, history, budget=1200)
+    assert turns == history["turns"][-5:]  # 5 x ~102 tokens fit QA_HISTORY_TOKENS, newest kept
+    assert kept == passages[:2]  # The rest of the budget, in retrieval order
+    assert knowledge.retrieval_query("Why did he?", history) == "Why did he? Q7?"
+
+    # Follow-ups go to the LLM with the conversation and are never served from the cache
+    prompts = []
+    async def answer(prompt):
+        prompts.append(prompt)
+        return "Revenge."
+    monkeypatch.setattr(knowledge, "configured_providers", lambda: [("gemini", answer)])
+    monkeypatch.setattr(knowledge, "_answer_cache", knowledge.OrderedDict())
+    for _ in range(2):
+        assert asyncio.run(knowledge.ask_question("", "Why did he?", passages[:1], history)) == "Revenge."
+    assert len(prompts) == 2 and "The user asked who Ahab is." in prompts[0]
+
+    # Offline, older turns fold into a bounded extractive summary
+    monkeypatch.setattr(knowledge, "configured_providers", lambda: [])
+    compacted = asyncio.run(knowledge.compact_conversation(history))
+    assert compacted["turns"] == history["turns"][-knowledge.QA_KEEP_TURNS:]
+    assert "Q5?" in compacted["summary"]
+    assert len(compacted["summary"]) <= knowledge.QA_SUMMARY_TOKENS * knowledge.CHARS_PER_TOKEN
+    assert not knowledge.needs_compaction(compacted)
+
+    # Turns recorded while the summary was written survive the merge
+    current = knowledge.record_turn(history, "Q9?", "A9.")
+    merged = knowledge.merge_compaction(history, compacted, current)
+    assert merged["turns"] == compacted["turns"] + [{"q": "Q9?", "a": "A9."}]
+    assert knowledge.merge_compaction(history, compacted, compacted) is None  # Already compacted
+
+
+def test_hedge_delay_follows_p95_and_invalid_replies_fall_over(monkeypatch):
+    health = knowledge.llm_health.get("deepseek")
+    assert knowledge.hedge_delay_for("deepseek") == knowledge.HEDGE_DELAY  # No samples yet
+    for latency in [0.01] * 19 + [0.05]:
+        health.record_success(latency)
+    assert knowledge.hedge_delay_for("deepseek") == knowledge.HEDGE_MIN_DELAY  # p95 clamped up
+    monkeypatch.setattr(knowledge, "HEDGE_MIN_DELAY", 0.0)
+    assert knowledge.hedge_delay_for("deepseek") == 0.01
+
+    async def usually_fast(prompt):
+        await asyncio.sleep(1)
+        return '["late"]'
+    async def backup(prompt):
+        return '```json\n["Who is Ahab?"]\n```'
+
+    start = time.monotonic()
+    result = asyncio.run(knowledge.complete("q", [("deepseek", usually_fast), ("gemini", backup)],
+                                            parse=knowledge.json_list()))
+    assert result == ["Who is Ahab?"]
+    assert time.monotonic() - start < 0.5  # Hedged after ~p95, not the fixed 3s
+
+    async def prose(prompt):
+        return "Here are some questions: ..."
+    async def valid(prompt):
+        await asyncio.sleep(0.01)
+        return '{"questions": [{"question": "Q?"}]}'
+    result = asyncio.run(knowledge.complete("q", [("deepseek", prose), ("gemini", valid)], hedge_delay=10,
+                                            parse=knowledge.json_list("questions")))
+    assert result == [{"question": "Q?"}]
+
+
+def test_failed_questions_raise_instead_of_answering(monkeypatch):
+    monkeypatch.setattr(knowledge, "configured_providers", lambda: [])
+    with pytest.raises(knowledge.NoProviderError):
+        asyncio.run(knowledge.ask_question("", "Who?", ["Passage"]))
+
+    async def down(prompt):
+        raise Exception("503 Service Unavailable")
+    monkeypatch.setattr(knowledge, "configured_providers", lambda: [("gemini", down)])
+    monkeypatch.setattr(knowledge, "_answer_cache", knowledge.OrderedDict())
+    with pytest.raises(Exception, match="503"):
+        asyncio.run(knowledge.ask_question("", "Who?", ["Passage"], {"summary": "", "turns": []}))
+    assert not knowledge._answer_cache
@@ -0,0 +1,358 @@
+import sqlite3
+import pytest
+from sqlalchemy import text
+import src.database as database
+import src.library as library
+from src.database import create_db_engine
+from src.migrations import run_migrations, LATEST_VERSION
+from src.library import LibraryManager
+
+
+@pytest.fixture
+def db_engine(tmp_path, monkeypatch):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'library.db'}")
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(library, "engine", engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def manager(db_engine, tmp_path):
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    return LibraryManager(str(upload_dir))
+
+
+def test_connections_use_wal_and_busy_timeout(db_engine):
+    with db_engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert conn.execute(text("PRAGMA foreign_keys")).scalar() == 1
+
+
+def test_fresh_database_is_migrated_to_latest_version(db_engine):
+    assert run_migrations(db_engine) == LATEST_VERSION
+    with db_engine.connect() as conn:
+        indexes = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type='index'"))}
+    assert {"ix_book_filename", "ix_analysis_book_id", "ix_image_book_id_type"} <= indexes
+    with db_engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM book_fts")).scalar() == 0
+
+
+def test_legacy_database_is_migrated(tmp_path, capsys):
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE book (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, author VARCHAR NOT NULL,
+            filename VARCHAR NOT NULL, upload_date DATETIME NOT NULL, full_text VARCHAR NOT NULL);
+        CREATE TABLE analysis (id INTEGER PRIMARY KEY, book_id INTEGER NOT NULL, summary VARCHAR NOT NULL,
+            entities_json VARCHAR NOT NULL, scenes_json VARCHAR NOT NULL, keywords_json VARCHAR NOT NULL);
+        CREATE TABLE image (id INTEGER PRIMARY KEY, book_id INTEGER NOT NULL, type VARCHAR NOT NULL,
+            path VARCHAR NOT NULL, prompt VARCHAR, created_at DATETIME NOT NULL);
+        INSERT INTO book VALUES (1, 'Moby Dick', 'Melville', 'moby.txt', '2024-01-01 00:00:00', '');
+        INSERT INTO analysis VALUES (1, 1, 'old', '[]', '[]', '[]');
+        INSERT INTO analysis VALUES (3, 1, 'new', '[]', '[]', '[]');
+        INSERT INTO analysis VALUES (2, 1, 'middle', '[]', '[]', '[]');
+    """)
+    conn.commit()
+    conn.close()
+
+    engine = create_db_engine(f"sqlite:///{path}")
+    assert run_migrations(engine) == LATEST_VERSION
+    assert run_migrations(engine) == LATEST_VERSION  # idempotent
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT summary FROM analysis")).scalars().all() == ["new"]
+        columns = [row[1] for row in conn.execute(text("PRAGMA table_info(book)"))]
+    assert "file_size" in columns
+    assert "Book 1: dropping 2 older duplicate analysis row(s)" in capsys.readouterr().out
+    engine.dispose()
+
+
+def test_add_list_and_delete_book(manager):
+    book = manager.add_book({"title": "Dune", "author": "Herbert", "filename": "dune.txt", "file_size": 42}, full_text="Spice")
+    manager.update_book_thumbnail(book["id"], "visuals/dune.jpg")
+    manager.save_analysis(book["id"], {"summary": "Desert", "entities": [], "scenes": [], "keywords": []})
+
+    books = manager.get_books()
+    assert [(b["title"], b["file_size"], b["thumbnail"]) for b in books] == [("Dune", 42, "visuals/dune.jpg")]
+    assert manager.get_book_full_text(book["id"]) == "Spice"
+
+    assert manager.delete_book(book["id"])
+    assert manager.get_books() == []
+
+
+def test_upload_dir_files_are_backfilled_once(manager, tmp_path):
+    (tmp_path / "uploads" / "emma.epub").write_bytes(b"epub")
+    (tmp_path / "uploads" / "notes.md").write_text("ignored")
+
+    manager.scan_and_backfill(force=True)
+    manager.scan_and_backfill(force=True)
+
+    assert [(b["filename"], b["file_size"]) for b in manager.get_books()] == [("emma.epub", 4)]
+
+
+def test_deleted_unlisted_files_leave_the_library(manager, tmp_path):
+    uploads = tmp_path / "uploads"
+    (uploads / "partial.pdf").write_bytes(b"%PDF")
+    (uploads / "dune.txt").write_text("Spice")
+    manager.add_files(["partial.pdf", "dune.txt"])
+    manager.add_book({"title": "Dune", "author": "Herbert", "filename": "dune.txt"}, full_text="Spice")
+
+    (uploads / "partial.pdf").unlink()
+    (uploads / "dune.txt").unlink()
+    manager.forget_files(["partial.pdf", "dune.txt"])
+
+    assert [b["filename"] for b in manager.get_books()] == ["dune.txt"]  # Ingested books are kept
+    manager.add_files(["partial.pdf"])
+    assert len(manager.get_books()) == 1
+
+
+def test_search_ranks_books_and_follows_analysis_updates(manager, monkeypatch):
+    whale = manager.add_book({"title": "Moby Dick", "author": "Melville", "filename": "moby.txt"},
+                             full_text="CHAPTER 1. Loomings\nCall me Ishmael. The white whale surfaced near the ship; the whale dove.")
+    manager.add_book({"title": "Emma", "author": "Austen", "filename": "emma.txt"},
+                     full_text="Emma Woodhouse, handsome, clever, and rich, mentioned a whale once.")
+    manager.save_analysis(whale["id"], {"entities": [["Ahab", "Captain"]], "scenes": [{"description": "A storm at sea"}]})
+
+    results = manager.search_books("whale")
+    assert [r["title"] for r in results] == ["Moby Dick", "Emma"]
+    assert "<mark>" in results[0]["snippet"]
+    assert "<mark>whale</mark> once" in results[1]["snippet"]
+
+    monkeypatch.setattr(library, "BODY_SNIPPET_HITS", 1)  # Lower hits are not quoted from the text
+    assert "<mark>" not in (manager.search_books("whale")[1]["snippet"] or "")
+
+    assert [r["title"] for r in manager.search_books("ahab")] == ["Moby Dick"]
+    assert [r["title"] for r in manager.search_books("Loom")] == ["Moby Dick"]  # prefix match
+    assert manager.search_books('"unbalanced (') == []
+
+    manager.delete_book(whale["id"])
+    assert [r["title"] for r in manager.search_books("whale")] == ["Emma"]
+
+
+def test_large_text_is_stored_compressed(manager, db_engine):
+    text_body = "It was the best of times, it was the worst of times. " * 2000
+    book = manager.add_book({"title": "Two Cities", "author": "Dickens", "filename": "cities.txt"}, full_text=text_body)
+    manager.save_analysis(book["id"], {"summary": "", "entities": [["Carton", "Lawyer"]] * 100, "scenes": [], "keywords": []})
+
+    with db_engine.connect() as conn:
+        kind, size = conn.execute(text("SELECT typeof(full_text), length(full_text) FROM book")).first()
+    assert kind == "blob"
+    assert size < len(text_body) // 10
+
+    assert manager.get_book_full_text(book["id"]) == text_body
+    assert manager.get_analysis(book["id"])["entities"][0] == ["Carton", "Lawyer"]
+
+
+def test_uncompressed_rows_are_compressed_by_migration(db_engine):
+    run_migrations(db_engine)
+    body = "Call me Ishmael. " * 100
+    with db_engine.begin() as conn:
+        conn.execute(text("INSERT INTO book (title, author, filename, file_size, upload_date, full_text) "
+                          "VALUES ('Moby Dick', 'Melville', 'moby.txt', 0, '2024-01-01 00:00:00', :body)"), {"body": body})
+        conn.execute(text("PRAGMA user_version = 4"))
+
+    run_migrations(db_engine)
+    with db_engine.connect() as conn:
+        assert conn.execute(text("SELECT typeof(full_text) FROM book")).scalar() == "blob"
+    assert LibraryManager.__new__(LibraryManager).get_book_full_text(1) == body
+
+
+def test_analysis_is_normalized_and_partially_readable(manager):
+    book = manager.add_book({"title": "Dune", "author": "Herbert", "filename": "dune.txt"}, full_text="Spice")
+    entities = [["Paul Atreides", "Heir", "lean", "stillsuit", "crysknife"], ["Chani", "Fremen"]]
+    scenes = [{"description": "Arrival on Arrakis", "emotion": "awe"}, {"description": "The sandworm", "emotion": "fear"}]
+    manager.save_analysis(book["id"], {"summary": "Desert", "entities": entities, "scenes": scenes, "keywords": ["spice"]})
+    manager.save_podcast(book["id"], [{"speaker": "Jax", "text": "Yo!", "url": "/api/assets/podcast/a.mp3"}])
+
+    analysis = manager.get_analysis(book["id"])
+    assert analysis["entities"] == entities
+    assert analysis["scenes"] == scenes
+    assert analysis["podcast"] == [{"speaker": "Jax", "text": "Yo!", "url": "/api/assets/podcast/a.mp3"}]
+
+    assert manager.get_entity(book["id"], "paul atreides") == entities[0]
+    assert manager.get_scene(book["id"], 1)["description"] == "The sandworm"
+    assert [b["title"] for b in manager.find_books_with_entity("Chani")] == ["Dune"]
+
+    # Re-saving replaces rows rather than appending
+    manager.save_analysis(book["id"], {"summary": "Desert", "entities": entities[:1], "scenes": [], "keywords": []})
+    assert manager.get_entity(book["id"], "Chani") is None
+    assert manager.delete_book(book["id"])
+
+
+def test_bulk_delete_and_asset_gc(manager, tmp_path):
+    uploads = tmp_path / "uploads"
+    (uploads / "visuals").mkdir()
+    (uploads / "visuals" / "cover_a.jpg").write_bytes(b"a" * 100)
+    (uploads / "visuals" / "shared.jpg").write_bytes(b"s" * 50)
+    (uploads / "audiobook_export" / "1").mkdir(parents=True)
+    (uploads / "audiobook_export" / "1" / "chapter_001.mp3").write_bytes(b"m" * 200)
+    (uploads / "a.txt").write_text("book a")
+
+    a = manager.add_book({"title": "A", "author": "X", "filename": "a.txt"}, full_text="alpha")
+    b = manager.add_book({"title": "B", "author": "Y", "filename": "b.txt"}, full_text="beta")
+    manager.update_book_thumbnail(a["id"], "visuals/cover_a.jpg")
+    manager.register_assets(a["id"], [str(uploads / "audiobook_export" / "1"), "/api/assets/visuals/shared.jpg?t=1"])
+    manager.register_assets(b["id"], ["visuals/shared.jpg"])
+    manager.save_analysis(a["id"], {"entities": [["Ann", "Hero"]], "scenes": [], "keywords": []})
+
+    assert manager.disk_usage()["referenced"] == 350
+
+    assert manager.delete_books([a["id"], 999]) == [a["id"]]
+    assert not (uploads / "a.txt").exists()
+    assert manager.disk_usage()["unreferenced"] == 300
+
+    assert manager.collect_garbage(dry_run=True)["bytes"] == 300
+    result = manager.collect_garbage()
+    assert (result["assets"], result["bytes"]) == (2, 300)
+    assert not (uploads / "visuals" / "cover_a.jpg").exists()
+    assert not (uploads / "audiobook_export" / "1").exists()
+    assert (uploads / "visuals" / "shared.jpg").exists()  # still referenced by B
+    assert [book["id"] for book in manager.get_books()] == [b["id"]]
+
+    assert manager.release_assets(b["id"], ["/api/assets/visuals/shared.jpg"]) == 1
+    assert manager.disk_usage()["unreferenced"] == 50
+
+
+def test_bulk_import_dedupes_by_content(manager, tmp_path):
+    import asyncio
+    from src.bulk_import import bulk_import
+
+    source = tmp_path / "catalog"
+    (source / "nested").mkdir(parents=True)
+    (source / "emma.txt").write_text("Emma Woodhouse, handsome, clever, and rich.")
+    (source / "nested" / "emma_copy.txt").write_text("Emma Woodhouse, handsome, clever, and rich.")
+    (source / "nested" / "emma.txt").write_text("A different book with the same filename.")
+    (source / "cover.jpg").write_bytes(b"not a book")
+
+    result = asyncio.run(bulk_import(str(source), manager, analyze=False, processes=1))
+    assert result["counts"] == {"imported": 2, "duplicate": 1}
+    assert sorted(b["filename"] for b in manager.get_books())[0] == "emma.txt"
+    assert len({b["filename"] for b in manager.get_books()}) == 2
+
+    again = asyncio.run(bulk_import(str(source), manager, analyze=False, processes=1))
+    assert again["counts"] == {"duplicate": 3}
+
+
+def test_zip_bombs_are_rejected_before_extraction(tmp_path, monkeypatch):
+    import zipfile
+    import src.bulk_import as bulk
+
+    archive = tmp_path / "bomb.zip"
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("nested/emma.txt", "Emma Woodhouse, handsome, clever, and rich.")
+        z.writestr("zeros.txt", "\0" * (2 * 1024 * 1024))
+    extract_dir = tmp_path / "out"
+
+    with pytest.raises(ValueError, match="compression ratio"):
+        bulk.collect_sources(str(archive), str(extract_dir))
+    assert not extract_dir.exists()
+
+    monkeypatch.setattr(bulk, "ZIP_MAX_RATIO", 10_000)
+    monkeypatch.setattr(bulk, "ZIP_MAX_TOTAL_MB", 1)
+    with pytest.raises(ValueError, match="limit is 1MB"):
+        bulk.collect_sources(str(archive), str(extract_dir))
+
+    monkeypatch.setattr(bulk, "ZIP_MAX_MEMBERS", 1)
+    with pytest.raises(ValueError, match="limit is 1"):
+        bulk.collect_sources(str(archive), str(extract_dir))
+
+
+def test_passages_are_retrieved_from_the_whole_book(manager, db_engine):
+    from src.retrieval import chunk_text, rank_passages
+
+    filler = "The sailors mended nets and talked about the weather for hours. " * 400
+    body = filler + "At last Queequeg revealed the harpoon was forged in Nantucket. " + filler
+    book = manager.add_book({"title": "Moby Dick", "author": "Melville", "filename": "moby.txt"}, full_text=body)
+
+    chunks = chunk_text(body)
+    assert len(chunks) > 20 and all(len(c) <= 1200 for c in chunks)
+
+    passages = manager.retrieve_passages(book["id"], "Where was the harpoon forged?", k=2)
+    assert passages and "Nantucket" in passages[0]
+    assert "Nantucket" in rank_passages(body, "Where was the harpoon forged?", k=1)[0]
+
+    # Passages are offsets into the book text; replacing the text drops the old tokens
+    manager.add_book({"title": "Moby Dick", "author": "Melville", "filename": "moby.txt"},
+                     full_text="\n  Call me Ishmael.  \n")
+    assert manager.retrieve_passages(book["id"], "harpoon") == []
+    assert manager.retrieve_passages(book["id"], "Ishmael") == ["Call me Ishmael."]
+    with db_engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM chunk_fts WHERE chunk_fts MATCH 'sailors'")).scalar() == 0
+        assert conn.execute(text("SELECT COUNT(*) FROM chunk_span")).scalar() == 1
+
+    manager.delete_book(book["id"])
+    assert manager.retrieve_passages(book["id"], "Ishmael") == []
+
+
+def test_study_pack_is_stored_per_book(manager):
+    book = manager.add_book({"title": "Dune", "author": "Herbert", "filename": "dune.txt"}, full_text="Spice")
+    assert manager.get_study_pack(book["id"]) is None
+
+    manager.save_study_pack(book["id"], {"quiz": [{"question": "Q?"}], "flashcards": [], "questions": ["Why?"]})
+    manager.save_study_pack(book["id"], {"quiz": [], "flashcards": [{"front": "a", "back": "b"}], "questions": ["How?"]})
+    pack = manager.get_study_pack(book["id"])
+    assert (pack["quiz"], pack["flashcards"], pack["questions"]) == ([], [{"front": "a", "back": "b"}], ["How?"])
+
+    assert manager.delete_book(book["id"])
+    assert manager.get_study_pack(book["id"]) is None
+
+
+def test_qa_session_round_trip_and_book_delete(manager):
+    book = manager.add_book({"title": "Emma", "author": "Austen", "filename": "emma.txt"}, full_text="Emma Woodhouse")
+    session_id = manager.create_qa_session(book["id"])
+    assert manager.get_qa_session(session_id)["turns"] == []
+
+    assert manager.save_qa_session(session_id, {"summary": "Asked about Emma.", "turns": [{"q": "Who?", "a": "Emma."}]})
+    history = manager.get_qa_session(session_id)
+    assert (history["book_id"], history["summary"], history["turns"]) == (book["id"], "Asked about Emma.", [{"q": "Who?", "a": "Emma."}])
+
+    assert manager.delete_book(book["id"])
+    assert manager.get_qa_session(session_id) is None
+    assert not manager.save_qa_session(session_id, {"summary": "", "turns": []})
+
+
+def test_graph_is_stored_per_chapter_and_updated_incrementally(manager):
+    text = "CHAPTER ONE\nAhab met Starbuck.\n\nAhab again.\nCHAPTER TWO\nStarbuck met Stubb.\n"
+    book = manager.add_book({"title": "Moby", "author": "Melville", "filename": "moby.txt"}, full_text=text)
+    assert manager.get_graph(book["id"]) is None
+    assert manager.update_graph(book["id"]) is None  # Not analyzed yet
+
+    manager.save_analysis(book["id"], {"entities": [["Ahab", "Captain"], ["Starbuck", "Mate"], ["Stubb", "Mate"]]})
+    assert manager.update_graph(book["id"]) == {"chapters": 2, "recounted": 2}
+    assert manager.update_graph(book["id"]) == {"chapters": 2, "recounted": 0}
+
+    graph = manager.get_graph(book["id"])
+    assert graph["nodes"][0] == {"id": "Ahab", "mentions": 2}
+    assert {"source": "Ahab", "target": "Starbuck", "weight": 2} in graph["edges"]
+    assert [c["title"] for c in graph["chapters"]] == ["CHAPTER ONE", "CHAPTER TWO"]
+
+    edited = text.replace("Stubb.", "Stubb and Ahab.")
+    assert manager.update_graph(book["id"], full_text=edited) == {"chapters": 2, "recounted": 1}
+    assert manager.get_graph(book["id"], chapter=1)["nodes"][0] == {"id": "Ahab", "mentions": 1}
+    assert manager.get_graph(book["id"])["nodes"][0] == {"id": "Ahab", "mentions": 3}
+
+    assert manager.delete_book(book["id"])
+    assert manager.get_graph(book["id"]) is None
+
+
+def test_search_index_keeps_no_copy_of_book_text(manager, db_engine):
+    book = manager.add_book({"title": "Moby Dick", "author": "Melville", "filename": "moby.txt"},
+                            full_text="The harpooneers sharpened their irons below decks.")
+    manager.save_analysis(book["id"], {"entities": [["Queequeg", "Harpooneer"]], "scenes": []})
+    assert manager.search_books("iron")[0]["snippet"] == "The harpooneers sharpened their <mark>irons</mark> below decks."
+
+    # Replacing the text removes the old words from the index, keeping the analysis columns
+    manager.add_book({"title": "Moby Dick", "author": "Melville", "filename": "moby.txt"},
+                     full_text="Ishmael signed aboard the Pequod.")
+    assert manager.search_books("sharpened") == []
+    assert [r["title"] for r in manager.search_books("pequod queequeg")] == ["Moby Dick"]
+
+    with db_engine.connect() as conn:
+        tables = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+        stored_body = conn.execute(text("SELECT SUM(LENGTH(body)) FROM book_search")).scalar()
+    assert "book_fts_content" not in tables and stored_body == 0
+
+    manager.delete_book(book["id"])
+    assert manager.search_books("pequod") == []
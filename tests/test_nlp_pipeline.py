@@ -0,0 +1,90 @@
+import pytest
+import src.nlp_pipeline as nlp_pipeline
+from src.knowledge import quiz_from_spacy, flashcards_from_text
+
+spacy = pytest.importorskip("spacy")
+
+
+@pytest.fixture
+def blank_pipeline(monkeypatch):
+    # Stand-in for en_core_web_sm: sentences plus rule-based POS for a few nouns
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("attribute_ruler")
+    for word in ("whale", "harpoon", "ship", "leviathan"):
+        ruler.add([[{"LOWER": word}]], {"POS": "NOUN"})
+    nlp.add_pipe("sentencizer")
+
+    calls = []
+    pipe = nlp.pipe
+    def counting_pipe(texts, **kwargs):
+        texts = list(texts)
+        calls.append(len(texts))
+        return pipe(texts, **kwargs)
+    nlp.pipe = counting_pipe
+
+    monkeypatch.setattr(nlp_pipeline, "load_pipeline", lambda components=None: nlp)
+    monkeypatch.setattr(nlp_pipeline, "_parse_cache", nlp_pipeline.OrderedDict())
+    monkeypatch.setattr(nlp_pipeline, "PIPE_BLOCK_CHARS", 500)
+    return calls
+
+
+def test_book_is_parsed_once_in_batches(blank_pipeline):
+    body = "The whale is a leviathan of the deep. The crew sharpened every harpoon on the ship. " * 100
+
+    sentences = nlp_pipeline.parse_book(body)
+    assert len(sentences) == 200
+    assert ("whale", "NOUN", False) in sentences[0]["tokens"]
+    assert blank_pipeline == [len(nlp_pipeline.chunk_text(body, 500, 0))]  # One pipe() call over all blocks
+
+    quiz = quiz_from_spacy(body, count=4)
+    assert len(quiz) == 4
+    assert all("______" in q["question"] and q["answer"] in ("whale", "harpoon", "ship", "leviathan") for q in quiz)
+    assert flashcards_from_text(body, parsed=True)[0] == {"front": "The whale", "back": "leviathan of the deep"}
+    assert len(blank_pipeline) == 1  # Quiz and flashcards reused the cached parse
+
+
+def test_parse_cache_is_bounded_by_text_size(blank_pipeline, monkeypatch):
+    monkeypatch.setattr(nlp_pipeline, "PARSE_CACHE_CHARS", 1500)
+    moby = "The whale is a leviathan of the deep. " * 30
+    ship = "The crew sharpened every harpoon on the ship. " * 30
+
+    nlp_pipeline.parse_book(moby)
+    nlp_pipeline.parse_book(ship)  # Over budget: the older book is evicted
+    assert len(nlp_pipeline._parse_cache) == 1
+    nlp_pipeline.parse_book(ship)
+    assert len(blank_pipeline) == 2
+    nlp_pipeline.parse_book(moby)
+    assert len(blank_pipeline) == 3
+
+
+def test_offline_entities_merge_name_variants_and_rank_central_characters(monkeypatch):
+    from src.analysis import extract_entities_offline
+
+    # Stand-in for the statistical NER: a rule-based entity ruler
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler")
+    ruler.add_patterns([
+        {"label": "PERSON", "pattern": [{"LOWER": "captain"}, {"LOWER": "ahab"}]},
+        {"label": "PERSON", "pattern": "Ahab"},
+        {"label": "PERSON", "pattern": "Starbuck"},
+        {"label": "PERSON", "pattern": "Ishmael"},
+        {"label": "PERSON", "pattern": [{"LOWER": "ishmael"}, {"LOWER": "grey"}]},
+        {"label": "PERSON", "pattern": "Fedallah"},
+        {"label": "GPE", "pattern": "Nantucket"},
+    ])
+    nlp.add_pipe("sentencizer")
+    monkeypatch.setattr(nlp_pipeline, "load_pipeline", lambda components=None: nlp)
+    monkeypatch.setattr(nlp_pipeline, "_parse_cache", nlp_pipeline.OrderedDict())
+
+    chapter = (
+        "Captain Ahab paced the deck. Starbuck watched Ahab closely. "
+        "Ishmael Grey had sailed from Nantucket. Ahab spoke to Starbuck and Ishmael. "
+    )
+    book = chapter * 10 + "Fedallah whispered. Fedallah whispered. Fedallah whispered."
+
+    entities = extract_entities_offline(book)
+    names = [name for name, _, _ in entities]
+    assert names[0] == "Ahab"  # "Captain Ahab" and "Ahab" are one character
+    assert "Ishmael Grey" in names and "Ishmael" not in names  # Short form folded into the full name
+    assert names.index("Fedallah") > names.index("Starbuck")  # Mentioned in one place, shares no scenes
+    assert ["Nantucket", "Location", ""] in entities
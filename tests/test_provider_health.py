@@ -0,0 +1,104 @@
+import time
+from src.provider_health import ProviderHealth, HealthRegistry, is_rate_limit_error
+
+
+def test_breaker_opens_after_consecutive_failures():
+    health = ProviderHealth("deepgram", cooldown=60)
+    for _ in range(3):
+        assert health.allow_request()
+        health.record_failure(0.5)
+
+    assert health.state == "open"
+    assert not health.allow_request()
+
+
+def test_half_open_allows_single_trial_and_recovers():
+    health = ProviderHealth("elevenlabs", cooldown=0.01)
+    for _ in range(3):
+        health.record_failure(0.1)
+    time.sleep(0.02)
+
+    ticket = health.allow_request()     # trial request
+    assert ticket
+    assert not health.allow_request()   # only one trial at a time
+    health.record_success(0.2, ticket)
+
+    assert health.state == "closed"
+    assert health.allow_request()
+
+
+def test_failed_trial_reopens_breaker():
+    health = ProviderHealth("elevenlabs", cooldown=0.01)
+    for _ in range(3):
+        health.record_failure(0.1)
+    time.sleep(0.02)
+
+    assert health.allow_request()
+    health.record_failure(0.1)
+    assert health.state == "open"
+
+
+def test_rank_skips_open_and_prefers_healthy():
+    registry = HealthRegistry(["deepgram", "inbuilt"], cooldown=60)
+    assert registry.rank(["deepgram", "inbuilt"]) == ["deepgram", "inbuilt"]
+
+    for _ in range(3):
+        registry.get("deepgram").record_failure(1.0, rate_limited=True)
+
+    assert registry.rank(["deepgram", "inbuilt"]) == ["inbuilt"]
+
+
+def test_rate_limit_detection():
+    assert is_rate_limit_error(Exception("Deepgram API Error: 429 - Too Many Requests"))
+    assert not is_rate_limit_error(Exception("Deepgram API Error: 500"))
+
+
+def test_single_failure_does_not_demote_provider():
+    registry = HealthRegistry(["deepgram", "inbuilt"], cooldown=60)
+    registry.get("deepgram").record_failure(1.0)
+
+    assert registry.rank(["deepgram", "inbuilt"]) == ["deepgram", "inbuilt"]
+
+
+def test_rank_orders_by_error_rate_then_p95():
+    registry = HealthRegistry(["deepseek", "gemini", "openrouter"], cooldown=60)
+    for i in range(10):
+        registry.get("deepseek").record_success(0.5)
+        if i % 4 == 0:
+            registry.get("deepseek").record_failure(0.5)
+        registry.get("gemini").record_success(3.0)
+        registry.get("openrouter").record_success(1.0)
+
+    assert registry.rank(["deepseek", "gemini", "openrouter"]) == ["openrouter", "gemini", "deepseek"]
+
+
+def test_cancelled_trial_releases_the_slot():
+    health = ProviderHealth("gemini", cooldown=0.01)
+    for _ in range(3):
+        health.record_failure(0.1)
+    time.sleep(0.02)
+
+    ticket = health.allow_request()
+    assert not health.allow_request()
+    health.end_trial(ticket)
+    assert health.state == "half_open"
+    assert health.allow_request()
+
+
+def test_only_the_trial_owner_releases_the_slot():
+    health = ProviderHealth("deepgram", cooldown=0.01)
+    for _ in range(3):
+        health.record_failure(0.1)
+    time.sleep(0.02)
+
+    stale = health.allow_request()
+    health.record_failure(0.1, ticket=stale)  # Trial fails, breaker re-opens
+    time.sleep(0.02)
+    trial = health.allow_request()
+    assert trial
+
+    health.end_trial(stale)             # Late cancel from the earlier trial
+    health.end_trial(None)              # Call that never held the slot
+    assert not health.allow_request()
+    health.end_trial(trial)
+    assert health.allow_request()
@@ -1145,9 +1145,8 @@ async function generateMotionForCurrentScene() {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                scene_index: currentSceneIndex,
-                image_filename: filename,
-                prompt: scene.text // Use scene text as prompt
+                scene_index: currentSceneIndex, // Server prompts with the stored scene description
+                image_filename: filename
             })
         });
 